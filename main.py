@@ -2,21 +2,25 @@
 Enhanced Personalized Study Plan Generator using LangChain
 with OpenRouter LLM Support - Simplified Version
 """
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_openai import ChatOpenAI
+import time
+_MODULE_LOAD_START = time.perf_counter()
+
+# Only lightweight standard-library modules are imported at load time. The LLM
+# stack (langchain, langchain_openai), rich, numpy, matplotlib, yaml and
+# asyncio are imported inside the code paths that need them so `--help` and
+# config-only commands start quickly; see --profile-startup.
 import os
+import sys
 import json
+import csv
+import hashlib
+import importlib
+import importlib.util
+import re
+import string
 import argparse
 from datetime import datetime
-import yaml
 import logging
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich import print as rprint
-import matplotlib.pyplot as plt
-import numpy as np
 from pathlib import Path
 
 # Configure logging
@@ -27,27 +31,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class _LazyConsole:
+    """Stand-in for the shared rich Console that imports rich on first use"""
+    
+    def __init__(self):
+        self._console = None
+    
+    def __getattr__(self, name):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return getattr(self._console, name)
+
 # Initialize rich console for better CLI presentation
-console = Console()
-
-# Define an enhanced PromptTemplate for personalized study plans
-personalized_study_plan_template = PromptTemplate(
-    input_variables=[
-        "student_name",
-        "grade_level",
-        "subjects",
-        "academic_performance", 
-        "learning_style",
-        "extracurricular_activities",
-        "goals",
-        "challenges",
-        "available_study_time",
-        "upcoming_exams",
-        "preferred_resources",
-        "additional_info",
-        "special_considerations"
-    ],
-    template="""
+console = _LazyConsole()
+
+# Fields every student profile provides to the prompt template
+PROFILE_FIELDS = [
+    "student_name",
+    "grade_level",
+    "subjects",
+    "academic_performance", 
+    "learning_style",
+    "extracurricular_activities",
+    "goals",
+    "challenges",
+    "available_study_time",
+    "upcoming_exams",
+    "preferred_resources",
+    "additional_info",
+    "special_considerations"
+]
+
+# Define an enhanced prompt for personalized study plans; the PromptTemplate
+# object (personalized_study_plan_template) is built from it on first use
+PERSONALIZED_STUDY_PLAN_TEMPLATE = """
 # EXPERT EDUCATIONAL CONSULTANT ROLE
 You are a highly experienced educational consultant with expertise in curriculum design, educational psychology, and personalized learning. Your specialty is creating individualized study plans that maximize student potential through evidence-based learning strategies tailored to each student's unique profile.
 
@@ -184,7 +202,1113 @@ Compile a comprehensive list of all recommended resources, tools, and materials
 
 Your plan should be evidence-based, practical for implementation, and specifically tailored to {student_name}'s unique profile. Each recommendation should have a clear rationale connected to aspects of their learning profile and supported by educational best practices.
 """
+
+# Human-readable labels used when rendering partial profiles into smaller prompts
+PROFILE_FIELD_LABELS = {
+    "student_name": "Name",
+    "grade_level": "Grade Level",
+    "subjects": "Subjects",
+    "academic_performance": "Current Academic Performance",
+    "learning_style": "Primary Learning Style",
+    "extracurricular_activities": "Extracurricular Activities & Commitments",
+    "goals": "Personal & Academic Goals",
+    "challenges": "Learning Challenges & Obstacles",
+    "available_study_time": "Available Study Time Distribution",
+    "upcoming_exams": "Upcoming Assessments & Deadlines",
+    "preferred_resources": "Preferred Learning Resources & Tools",
+    "additional_info": "Additional Contextual Information",
+    "special_considerations": "Special Considerations or Accommodations"
+}
+
+def _format_response_sections(template_text):
+    """Extract the numbered (title, instructions) pairs from the FORMAT OF YOUR RESPONSE block"""
+    format_block = template_text.split("# FORMAT OF YOUR RESPONSE", 1)[1]
+    sections = []
+    for match in re.finditer(r"^## (\d+)\. ([^\n]+)\n(.+?)(?=\n\n|\Z)", format_block, re.M | re.S):
+        sections.append((match.group(2).strip(), match.group(3).strip()))
+    return sections
+
+# The ten sections every plan is asked for, in order, with their instructions
+PLAN_SECTIONS = _format_response_sections(PERSONALIZED_STUDY_PLAN_TEMPLATE)
+PLAN_SECTION_TITLES = [title for title, _ in PLAN_SECTIONS]
+
+# Profile fields each plan section is written from; a change to any of them
+# makes that section stale. student_name is handled by renaming in place.
+SECTION_DEPENDENCIES = {
+    "Executive Summary": {"grade_level", "subjects", "academic_performance", "learning_style", "goals", "challenges"},
+    "Comprehensive Student Analysis": {"grade_level", "subjects", "academic_performance", "learning_style", "challenges", "additional_info", "special_considerations"},
+    "Weekly Master Schedule": {"subjects", "academic_performance", "extracurricular_activities", "available_study_time", "upcoming_exams"},
+    "Subject-Specific Action Plans": {"subjects", "academic_performance", "learning_style", "preferred_resources", "goals"},
+    "Adaptive Progress Monitoring System": {"subjects", "academic_performance", "goals"},
+    "Exam Success Strategies": {"subjects", "learning_style", "challenges", "upcoming_exams"},
+    "Challenge Mitigation Strategies": {"challenges", "additional_info", "special_considerations"},
+    "Wellbeing and Sustainability Framework": {"extracurricular_activities", "available_study_time", "challenges", "special_considerations"},
+    "Implementation Guidance": {"goals", "challenges", "additional_info"},
+    "Resource Appendix": {"subjects", "preferred_resources", "additional_info"}
+}
+
+# Smaller prompt used to (re)write a single plan section (section_study_plan_template)
+SECTION_STUDY_PLAN_TEMPLATE = """
+# EXPERT EDUCATIONAL CONSULTANT ROLE
+You are a highly experienced educational consultant writing one section of an existing personalized study plan for {student_name}.
+
+# RELEVANT STUDENT PROFILE
+{profile_details}
+
+# CONTEXT FROM THE REST OF THE PLAN
+{plan_context}
+
+# SECTION TO WRITE
+{section_heading}
+{section_instructions}
+
+Write only the body of this section in Markdown, without repeating the section heading. Keep it consistent with the rest of the plan and specifically tailored to {student_name}'s profile.
+"""
+
+def _cacheable_template(template):
+    """Move the student profile block of a template to the end
+
+    Everything before the profile is then identical for every student, so
+    providers that cache prompt prefixes can reuse it byte-for-byte.
+    """
+    head, rest = template.split("# STUDENT PROFILE COMPREHENSIVE ANALYSIS", 1)
+    profile_block, tail = rest.split("# COMPREHENSIVE STUDY PLAN DEVELOPMENT FRAMEWORK", 1)
+    tail = tail.replace("{student_name}'s unique profile", "the unique profile of the student described below")
+    return (head + "# COMPREHENSIVE STUDY PLAN DEVELOPMENT FRAMEWORK" + tail.rstrip("\n")
+            + "\n\n# STUDENT PROFILE COMPREHENSIVE ANALYSIS" + profile_block.rstrip("\n") + "\n")
+
+# Same instructions as the full template with the profile moved to the end
+CACHEABLE_STUDY_PLAN_TEMPLATE = _cacheable_template(PERSONALIZED_STUDY_PLAN_TEMPLATE)
+
+# Condensed instructions (roughly a third of the full template's tokens); the
+# static prefix comes first and the profile last for provider prompt caching
+COMPACT_STUDY_PLAN_TEMPLATE = """
+# ROLE
+You are an expert educational consultant (curriculum design, educational psychology, personalized learning). Write an evidence-based, practical, individualized study plan for the student profiled at the end.
+
+# APPROACH
+- Match study methods and resources to the learning style; sequence difficulty to build confidence while fixing weaknesses
+- Put the hardest subjects in peak-energy periods, work around commitments, and use research-based breaks (Pomodoro, spaced repetition)
+- Give targeted interventions for each challenge, exam timelines with practice assessments, and wellbeing habits that prevent burnout
+- Tie every recommendation to the profile with a brief rationale
+
+# RESPONSE FORMAT (Markdown, these ten sections in order)
+## 1. Executive Summary - concise overview and key strategies
+## 2. Comprehensive Student Analysis - strengths to leverage, challenges to address
+## 3. Weekly Master Schedule - hour-by-hour per day (e.g. "- 6:30-7:15 PM: Calculus practice"), including breaks and commitments
+## 4. Subject-Specific Action Plans - per subject: methods, resources, targeted exercises, memory techniques, real-world links, progressive challenges
+## 5. Adaptive Progress Monitoring System - weekly self-assessment, milestones, adjustment triggers, tracking tools
+## 6. Exam Success Strategies - per exam: timeline, review method, practice schedule, exam-day and post-exam routine
+## 7. Challenge Mitigation Strategies - per challenge: interventions, progress indicators, fallbacks
+## 8. Wellbeing and Sustainability Framework - motivation, balance, stress, sleep and exercise, sustainable habits
+## 9. Implementation Guidance - getting started, adapting, troubleshooting, when to seek help
+## 10. Resource Appendix - all resources by subject
+
+# STUDENT PROFILE
+- Name: {student_name}
+- Grade Level: {grade_level}
+- Subjects: {subjects}
+- Current Academic Performance: {academic_performance}
+- Primary Learning Style: {learning_style}
+- Extracurricular Activities & Commitments: {extracurricular_activities}
+- Personal & Academic Goals: {goals}
+- Learning Challenges & Obstacles: {challenges}
+- Available Study Time Distribution: {available_study_time}
+- Upcoming Assessments & Deadlines: {upcoming_exams}
+- Preferred Learning Resources & Tools: {preferred_resources}
+- Additional Contextual Information: {additional_info}
+- Special Considerations or Accommodations: {special_considerations}
+"""
+
+# Replaces the Weekly Master Schedule instructions when the schedule is
+# computed locally: the model only explains it, and the schedule itself is
+# spliced into the plan afterwards (see insert_weekly_schedule)
+SCHEDULE_NARRATION_INSTRUCTIONS = (
+    "The weekly schedule under PRECOMPUTED WEEKLY SCHEDULE was computed from the student's availability, "
+    "commitments, grades and exam dates and will be inserted after your text automatically. Do not write or "
+    "repeat a schedule: in 3-5 short bullet points, explain its rationale (peak-energy placement, exam "
+    "priorities, breaks) and how to adapt it."
 )
+SCHEDULE_PROMPT_BLOCK = "# PRECOMPUTED WEEKLY SCHEDULE\n{weekly_schedule}"
+
+def _scheduled_template(template):
+    """Swap a template's Weekly Master Schedule instructions for SCHEDULE_NARRATION_INSTRUCTIONS
+
+    The per-student schedule goes after everything else, behind the profile,
+    so the cacheable and compact variants keep their static prefix.
+    """
+    scheduled = re.sub(
+        r"^(## 3\. Weekly Master Schedule)(?: - [^\n]*|\n[^\n]+)$",
+        lambda match: f"{match.group(1)}\n{SCHEDULE_NARRATION_INSTRUCTIONS}",
+        template, count=1, flags=re.M
+    )
+    assert scheduled != template, "template has no Weekly Master Schedule section"
+    return scheduled.rstrip("\n") + "\n\n" + SCHEDULE_PROMPT_BLOCK
+
+# PromptTemplate objects built lazily from the template strings above
+_PROMPT_TEMPLATES = {
+    "personalized_study_plan_template": (PROFILE_FIELDS, PERSONALIZED_STUDY_PLAN_TEMPLATE),
+    "cacheable_study_plan_template": (PROFILE_FIELDS, CACHEABLE_STUDY_PLAN_TEMPLATE),
+    "compact_study_plan_template": (PROFILE_FIELDS, COMPACT_STUDY_PLAN_TEMPLATE),
+    "section_study_plan_template": (
+        ["student_name", "profile_details", "plan_context", "section_heading", "section_instructions"],
+        SECTION_STUDY_PLAN_TEMPLATE
+    )
+}
+# "scheduled_*" variants of each study plan template take a precomputed weekly_schedule
+for _name in ("personalized_study_plan_template", "cacheable_study_plan_template", "compact_study_plan_template"):
+    _PROMPT_TEMPLATES[f"scheduled_{_name}"] = (PROFILE_FIELDS + ["weekly_schedule"], _scheduled_template(_PROMPT_TEMPLATES[_name][1]))
+
+def get_prompt_template(name):
+    """Return the langchain PromptTemplate registered under name, building it on first use"""
+    if name not in globals():
+        from langchain.prompts import PromptTemplate
+        input_variables, template = _PROMPT_TEMPLATES[name]
+        globals()[name] = PromptTemplate(input_variables=input_variables, template=template)
+    return globals()[name]
+
+def __getattr__(name):
+    """Keep `main.personalized_study_plan_template` working without importing langchain at load time"""
+    if name in _PROMPT_TEMPLATES:
+        return get_prompt_template(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Study plan prompt variants selectable with --prompt-template
+STUDY_PLAN_TEMPLATE_VARIANTS = {
+    "full": "personalized_study_plan_template",
+    "cacheable": "cacheable_study_plan_template",
+    "compact": "compact_study_plan_template"
+}
+
+# Order in which free-text fields give up tokens when a prompt exceeds its
+# budget (first entry is shortened first); name and grade are never cut
+FIELD_TRUNCATION_ORDER = [
+    "additional_info",
+    "preferred_resources",
+    "special_considerations",
+    "goals",
+    "learning_style",
+    "challenges",
+    "academic_performance",
+    "available_study_time",
+    "extracurricular_activities",
+    "upcoming_exams",
+    "subjects"
+]
+FIELD_TOKEN_FLOOR = 32
+# Seconds to wait for tiktoken to load (or download) its BPE files before estimating instead
+TOKEN_ENCODER_LOAD_TIMEOUT = 10.0
+
+_TOKEN_ENCODERS = {}
+
+def _token_encoder(model=None):
+    """Return the local tiktoken encoding for model, or None when tiktoken is unavailable
+
+    Models tiktoken does not know (Claude, Gemini, Llama via OpenRouter) use
+    cl100k_base, which is close enough for budgeting. tiktoken needs its BPE
+    files on disk (fetched once, or pre-seeded via TIKTOKEN_CACHE_DIR); the
+    fetch has no timeout of its own, so loading runs in a daemon thread and
+    an offline or failed fetch falls back to the character estimate.
+    """
+    key = model or ""
+    if key not in _TOKEN_ENCODERS:
+        import threading
+        loaded = {}
+        
+        def load():
+            try:
+                import tiktoken
+                try:
+                    loaded["encoder"] = tiktoken.encoding_for_model(key.split("/")[-1])
+                except KeyError:
+                    loaded["encoder"] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                loaded["error"] = e
+        
+        thread = threading.Thread(target=load, name="tiktoken-load", daemon=True)
+        thread.start()
+        thread.join(TOKEN_ENCODER_LOAD_TIMEOUT)
+        encoder = loaded.get("encoder")
+        if encoder is None:
+            reason = loaded.get("error") or f"BPE files not loaded within {TOKEN_ENCODER_LOAD_TIMEOUT:g}s"
+            logger.info(f"tiktoken unavailable ({reason}); estimating tokens as characters / 4")
+        _TOKEN_ENCODERS[key] = encoder
+    return _TOKEN_ENCODERS[key]
+
+def count_tokens(text, model=None):
+    """Count prompt tokens offline"""
+    encoder = _token_encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+def shorten_text(text, max_tokens, model=None):
+    """Extractively shorten text to about max_tokens, keeping whole leading sentences where possible"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    marker = " [...]"
+    budget = max(1, max_tokens - count_tokens(marker, model))
+    
+    kept, used = [], 0
+    for sentence in re.split(r"(?<=[.!?;])\s+", text):
+        tokens = count_tokens(sentence, model) + (1 if kept else 0)
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    if kept:
+        return " ".join(kept) + marker
+    
+    # A single long sentence: cut on a token boundary
+    encoder = _token_encoder(model)
+    if encoder is None:
+        return text[:budget * 4].rstrip() + marker
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:budget]).rstrip() + marker
+
+def static_prefix(template):
+    """Literal text of a prompt template before its first variable, identical for every student
+
+    This is the part provider-side prompt caches can reuse across requests.
+    """
+    prefix = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        prefix.append(literal)
+        if field is not None:
+            break
+    return "".join(prefix)
+
+def fit_profile_to_budget(student_profile, template, token_budget=None, model=None, extra_inputs=None):
+    """Render template for a profile, shortening low-priority fields to fit token_budget
+
+    Returns (prompt, fitted_profile, stats) where stats has the prompt and
+    per-field token counts and which fields were shortened. extra_inputs
+    (e.g. a precomputed weekly_schedule) are rendered as-is and counted as
+    extra_tokens.
+    """
+    extra_inputs = extra_inputs or {}
+    fitted = {field: str(student_profile.get(field, "")) for field in PROFILE_FIELDS}
+    field_tokens = {field: count_tokens(value, model) for field, value in fitted.items()}
+    static_tokens = count_tokens(template.format(**{field: "" for field in PROFILE_FIELDS}, **{key: "" for key in extra_inputs}), model)
+    prefix_tokens = count_tokens(static_prefix(template), model)
+    extra_tokens = sum(count_tokens(str(value), model) for value in extra_inputs.values())
+    
+    truncated = []
+    if token_budget:
+        overflow = static_tokens + extra_tokens + sum(field_tokens.values()) - token_budget
+        for field in FIELD_TRUNCATION_ORDER:
+            if overflow <= 0:
+                break
+            spare = field_tokens[field] - FIELD_TOKEN_FLOOR
+            if spare <= 0:
+                continue
+            fitted[field] = shorten_text(fitted[field], field_tokens[field] - min(spare, overflow), model)
+            new_tokens = count_tokens(fitted[field], model)
+            overflow -= field_tokens[field] - new_tokens
+            field_tokens[field] = new_tokens
+            truncated.append(field)
+    
+    prompt = template.format(**fitted, **extra_inputs)
+    prompt_tokens = count_tokens(prompt, model)
+    stats = {
+        "prompt_tokens": prompt_tokens,
+        "static_tokens": static_tokens,
+        "prefix_tokens": prefix_tokens,
+        "profile_tokens": sum(field_tokens.values()),
+        "extra_tokens": extra_tokens,
+        "budget": token_budget,
+        "over_budget": bool(token_budget) and prompt_tokens > token_budget,
+        "truncated_fields": truncated,
+        "field_tokens": field_tokens
+    }
+    return prompt, {**fitted, **extra_inputs}, stats
+
+_SECTION_HEADING_RE = re.compile(
+    r"^#{1,4}[ \t]*(?:\d+[.)][ \t]*)?(" + "|".join(re.escape(t) for t in PLAN_SECTION_TITLES) + r")\b.*$",
+    re.M | re.I
+)
+
+def parse_plan_sections(plan_text):
+    """Split a plan into (preamble, [(title, heading_line, body), ...]) in document order
+
+    Titles are normalized to the canonical PLAN_SECTION_TITLES spelling so they
+    can be matched against SECTION_DEPENDENCIES.
+    """
+    canonical = {title.lower(): title for title in PLAN_SECTION_TITLES}
+    matches = list(_SECTION_HEADING_RE.finditer(plan_text))
+    preamble = plan_text[:matches[0].start()] if matches else plan_text
+    
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(plan_text)
+        body = plan_text[match.end():end]
+        sections.append((canonical[match.group(1).lower()], match.group(0), body))
+    return preamble, sections
+
+def changed_profile_fields(old_profile, new_profile):
+    """Return the set of profile fields whose values differ"""
+    return {
+        field for field in PROFILE_FIELDS
+        if str(old_profile.get(field, "")).strip() != str(new_profile.get(field, "")).strip()
+    }
+
+def sections_affected_by(changed_fields):
+    """Return the plan section titles that depend on any of the changed fields, in plan order"""
+    changed_fields = set(changed_fields)
+    return [title for title in PLAN_SECTION_TITLES if SECTION_DEPENDENCIES[title] & changed_fields]
+
+def format_profile_details(student_profile, fields):
+    """Render a subset of profile fields as the bullet list used in prompts"""
+    return "\n".join(
+        f"- {PROFILE_FIELD_LABELS[field]}: {student_profile.get(field, '')}"
+        for field in PROFILE_FIELDS if field in fields
+    )
+
+def split_subjects(subjects):
+    """Split a free-text subject list on commas/semicolons that are not inside parentheses"""
+    parts, depth, current = [], 0, []
+    for char in subjects:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        if char in ",;\n" and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+def read_plan_file(path):
+    """Read a saved plan, unwrapping the JSON chain result written by save_study_plan"""
+    with open(path, 'r') as f:
+        content = f.read()
+    try:
+        return extract_plan_text(json.loads(content))
+    except (ValueError, AttributeError):
+        return content
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Fixed subject table for parsed schedules: codes mean the same thing in every
+# plan, so grids can be compared, aggregated and drawn with one legend.
+SCHEDULE_SUBJECTS = ['Free', 'Math', 'Physics', 'Chemistry', 'Biology', 'English', 'History',
+                     'CS', 'Languages', 'Test Prep', 'Review', 'Break', 'Extracurricular', 'Other']
+SCHEDULE_COLORS = ['#FFFFFF', '#FF9999', '#99FF99', '#66CCAA', '#CCEE88', '#9999FF', '#FFFF99',
+                   '#FF99FF', '#FFCC88', '#FF8866', '#BBBBEE', '#CCCCCC', '#99FFFF', '#DDBB99']
+
+# Keywords mapping an activity description onto SCHEDULE_SUBJECTS; the
+# leftmost keyword in the description wins
+_SCHEDULE_KEYWORDS = {
+    'Math': r"math\w*|calculus|algebra|geometry|trig\w*|statistics|precalc\w*|integration|derivatives?",
+    'Physics': r"physics|mechanics|thermodynamics",
+    'Chemistry': r"chem\w*",
+    'Biology': r"bio\w*|anatomy",
+    'English': r"english|literature|essay\w*|writing|reading|annotation",
+    'History': r"history|historical|civics|government|social studies",
+    'CS': r"computer science|programming|coding|java|python|algorithms?|\bcs\b|\bapcs\b",
+    'Languages': r"spanish|french|german|chinese|latin|japanese|vocab\w*",
+    'Test Prep': r"\bsat\b|\bact\b|practice (?:exam|test)s?|mock exam",
+    'Review': r"review|flashcards?|spaced repetition|preparation|planning|reflection",
+    'Break': r"break|rest|dinner|lunch|breakfast|meal|nap|sleep|free time|relax\w*|exercise|walk",
+    'Extracurricular': r"basketball|soccer|football|baseball|tennis|swim\w*|track|sports?|team|club|job|work shift|game|band|choir|volunteer\w*|tutoring center",
+}
+# Whole descriptions meaning nothing is scheduled ("Free" table cells)
+_FREE_CELLS = ("free", "open", "off", "none", "nothing scheduled")
+_SCHEDULE_KEYWORD_RE = re.compile(
+    "|".join(f"(?P<g{SCHEDULE_SUBJECTS.index(name)}>{pattern})" for name, pattern in _SCHEDULE_KEYWORDS.items()),
+    re.I
+)
+_DAY_NAMES_RE = r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekdays?|weekends?|daily|every ?day"
+# Full day names, or abbreviations ("Mon/Wed/Fri", "Tue, Thu 4-7 PM") followed by a
+# separator, another day or a time; upper-case "SAT" is the exam, never Saturday
+_DAY_ABBREVIATIONS_RE = r"(?:mon|tues?|wed|thu(?:rs?)?|fri|sat|sun)\.?(?=\s*(?:[/,&]|-\s*[a-z]|and\b|to\b|\d|$))"
+_DAY_MENTION_RE = re.compile(
+    r"\b((?:" + _DAY_NAMES_RE + r")s?\b|(?-i:(?!SAT\b))" + _DAY_ABBREVIATIONS_RE + ")", re.I
+)
+_DAY_RANGE_GAP_RE = re.compile(r"\s*(?:-|–|to|through|thru)\s*", re.I)
+# Heading/list-item prefix before the days a schedule line starts with
+_DAY_LINE_PREFIX_RE = re.compile(r"^\s*(?:#+\s*|[-*]\s*)?\**\s*")
+_TIME_RANGE_RE = re.compile(
+    r"(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*(?:-|–|—|to)\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?",
+    re.I
+)
+
+def _day_indexes(first, last=None):
+    """Expand a day name (or range / weekday keyword) into DAYS indexes"""
+    def index(name):
+        return next(i for i, day in enumerate(DAYS) if day.lower().startswith(name.lower()[:3]))
+    first = first.lower()
+    if first.startswith("weekday"):
+        return [0, 1, 2, 3, 4]
+    if first.startswith("weekend"):
+        return [5, 6]
+    if first in ("daily", "everyday", "every day"):
+        return list(range(7))
+    start = index(first)
+    if last and not last.lower().startswith(("weekday", "weekend", "daily", "every")):
+        end = index(last)
+        return list(range(start, end + 1)) if end >= start else [start]
+    return [start]
+
+def _leading_days(text):
+    """Days named by a list at the start of text ("### Tuesday & Thursday", "**Mon/Wed/Fri:**")
+
+    Returns (sorted DAYS indexes, end of the list in text); the indexes are
+    empty when text does not start with a day. Ranges ("Monday-Friday") and
+    "Weekdays"/"Weekends" expand to every day they cover.
+    """
+    groups, previous = [], None
+    end = _DAY_LINE_PREFIX_RE.match(text).end()
+    for match in _DAY_MENTION_RE.finditer(text, end):
+        gap = text[end:match.start()]
+        name = match.group(1).lower().rstrip(".")
+        if groups and _DAY_RANGE_GAP_RE.fullmatch(gap):
+            groups[-1] = _day_indexes(previous, name)
+        elif gap.strip(" *,&/").lower() in (("", "and", "or") if groups else ("",)):
+            groups.append(_day_indexes(name))
+        else:
+            break
+        previous, end = name, match.end()
+    return sorted({day for days in groups for day in days}), end
+
+def _parse_time_range(match):
+    """Convert a _TIME_RANGE_RE match to (start_minute, end_minute) of the day, or None"""
+    h1, m1, mer1, h2, m2, mer2 = match.groups()
+    h1, h2 = int(h1), int(h2)
+    m1, m2 = int(m1 or 0), int(m2 or 0)
+    if h1 > 24 or h2 > 24 or m1 > 59 or m2 > 59:
+        return None
+    mer1 = mer1[0].lower() if mer1 else None
+    mer2 = mer2[0].lower() if mer2 else None
+    
+    def to_minutes(hour, minute, meridiem):
+        if meridiem == "p" and hour < 12:
+            hour += 12
+        elif meridiem == "a" and hour == 12:
+            hour = 0
+        return hour * 60 + minute
+    
+    bare_start = mer1 is None
+    if mer1 is None and mer2 is None:
+        # Bare times: study plans rarely schedule 1-5 AM, so read those as afternoon
+        mer1 = mer2 = "p" if 1 <= h2 <= 5 or 1 <= h1 <= 5 else None
+    end = to_minutes(h2, m2, mer2)
+    start = to_minutes(h1, m1, mer1 or mer2)
+    if start >= end and bare_start:
+        # "11:30-1:00 PM" and "9-5" start in the morning
+        start = to_minutes(h1, m1, "a")
+    if start >= end or end > 24 * 60:
+        return None
+    return start, end
+
+def classify_activity(description):
+    """Map a free-text activity description to a SCHEDULE_SUBJECTS code (0 for free time)"""
+    if description.strip(" .*").lower() in _FREE_CELLS:
+        return 0
+    match = _SCHEDULE_KEYWORD_RE.search(description)
+    if not match:
+        return SCHEDULE_SUBJECTS.index('Other')
+    return int(match.lastgroup[1:])
+
+class StudySchedule:
+    """A weekly schedule extracted from a plan
+
+    grid is a (7, 24) uint8 array of SCHEDULE_SUBJECTS codes, one row per day
+    in DAYS order and one column per hour of the day (0 = free). blocks keeps
+    the parsed (day_index, start_minute, end_minute, code, description) entries.
+    """
+    __slots__ = ("grid", "blocks")
+    
+    subjects = SCHEDULE_SUBJECTS
+    
+    def __init__(self, grid, blocks):
+        self.grid = grid
+        self.blocks = blocks
+    
+    def is_empty(self):
+        return not self.blocks
+    
+    def hours_by_subject(self):
+        """Scheduled hours per subject for the week, excluding free time"""
+        import numpy as np
+        counts = np.bincount(self.grid.ravel(), minlength=len(SCHEDULE_SUBJECTS))
+        return {SCHEDULE_SUBJECTS[code]: int(count) for code, count in enumerate(counts) if code and count}
+    
+    def to_rows(self):
+        """Flat (day, start, end, subject, description) rows for tabular exports"""
+        return [
+            (DAYS[day], f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}",
+             SCHEDULE_SUBJECTS[code], description)
+            for day, start, end, code, description in self.blocks
+        ]
+    
+    def to_csv(self, path):
+        """Write the parsed blocks as CSV"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["day", "start", "end", "subject", "description"])
+            writer.writerows(self.to_rows())
+        return path
+
+def _schedule_section(plan_text):
+    """Return the Weekly Master Schedule section of a plan, or the whole plan if it has none"""
+    _, sections = parse_plan_sections(plan_text)
+    for title, _, body in sections:
+        if title == "Weekly Master Schedule":
+            return body
+    return plan_text
+
+def parse_weekly_schedule(plan_text):
+    """Parse a plan's Weekly Master Schedule into a StudySchedule in one pass over its lines
+
+    Understands per-day lists ("### Monday" followed by "- 6:00-6:45 AM: ...",
+    including "Weekdays"/"Monday-Friday" groupings) and Markdown tables with
+    one column per day.
+    """
+    blocks = []
+    current_days = []
+    table_days = None
+    
+    for line in _schedule_section(extract_plan_text(plan_text)).splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        
+        if stripped.startswith("|"):
+            cells = [cell.strip(" *") for cell in stripped.strip("|").split("|")]
+            header_days = [_leading_days(cell)[0] for cell in cells[1:]]
+            if header_days and all(header_days):
+                table_days = header_days
+                continue
+            time_match = _TIME_RANGE_RE.search(cells[0]) if table_days else None
+            span = _parse_time_range(time_match) if time_match else None
+            if span:
+                for days, cell in zip(table_days, cells[1:]):
+                    code = classify_activity(cell) if cell not in ("", "-", "—") else 0
+                    if code:
+                        for day in days:
+                            blocks.append((day, span[0], span[1], code, cell))
+            continue
+        table_days = None
+        
+        time_match = _TIME_RANGE_RE.search(stripped)
+        line_days, days_end = _leading_days(stripped)
+        if line_days and (not time_match or days_end <= time_match.start()):
+            current_days = line_days
+            if not time_match:
+                continue
+        if not time_match or not current_days:
+            continue
+        
+        span = _parse_time_range(time_match)
+        if not span:
+            continue
+        description = stripped[time_match.end():].strip(" :-–—*|")
+        code = classify_activity(description or stripped)
+        if not code:
+            continue
+        for day in current_days:
+            blocks.append((day, span[0], span[1], code, description))
+    
+    return StudySchedule(_schedule_grid(blocks), blocks)
+
+def _schedule_grid(blocks):
+    """Rasterize (day, start_minute, end_minute, code, description) blocks into a (7, 24) code grid"""
+    import numpy as np
+    grid = np.zeros((len(DAYS), 24), dtype=np.uint8)
+    covered = np.zeros((len(DAYS), 24), dtype=np.int16)
+    for day, start, end, code, _ in blocks:
+        # An hour belongs to the block covering most of it, if that is at least
+        # half of it (or all of a short block)
+        for hour in range(start // 60, (end + 59) // 60):
+            overlap = min(end, (hour + 1) * 60) - max(start, hour * 60)
+            if overlap >= min(30, end - start) and overlap >= covered[day, hour]:
+                grid[day, hour] = code
+                covered[day, hour] = overlap
+    return grid
+
+# Local schedule optimizer: profiles' free-text availability and commitments
+# become 15-minute slot bitmaps, and study blocks are allocated greedily
+SCHEDULE_SLOT_MINUTES = 15
+_SLOTS_PER_DAY = 24 * 60 // SCHEDULE_SLOT_MINUTES
+_TRAILING_DAYS_RE = re.compile(r"\s*(?:(?:on|every)\s+)?", re.I)
+_DURATION_AFTER_RE = re.compile(r"\s*(?:hours?|hrs?|minutes?|mins?)\b", re.I)
+_PEAK_WORDS_RE = re.compile(r"energy|focus|alert|peak|productive|concentrat", re.I)
+_LABEL_FILLER_RE = re.compile(r"^(?:(?:on|and|or|to|through|thru|alternate|every|from|at|in|during)\b\s*)+|(?:\s+(?:on|and|or|to|through|thru|alternate|every|from|at|in|during))+\s*$", re.I)
+# Letter grades; a hyphen followed by a letter ("A-level", "E-commerce") is a word, not a grade
+_GRADE_RE = re.compile(r"(?<![A-Za-z])([A-DF])([+-]?)(?![A-Za-z]|-[A-Za-z])")
+_PERCENT_RE = re.compile(r"(\d{2,3})\s*%")
+_MONTH_NAMES = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+# Full month names or exact abbreviations only: "essay on the novel" is not November
+_EXAM_DATE_RE = re.compile(
+    r"\b(january|february|march|april|may|june|july|august|september|october|november|december|"
+    r"jan|feb|mar|apr|jun|jul|aug|sept?|oct|nov|dec)\b\.?(?:\s+(\d{1,2})(?:st|nd|rd|th)?\b)?",
+    re.I
+)
+_RELATIVE_DATE_RE = re.compile(r"(\d+)\s*(week|day)s?\s+(?:from now|away|left)|\bin\s+(\d+)\s*(week|day)s?\b", re.I)
+_EXAM_LABEL_RE = re.compile(r"\s*\(|\s+(?:scheduled|on|due|beginning|starting|in|at|for|covering|next)\b", re.I)
+
+# Relative study load per letter grade: weaker grades get more time
+GRADE_DIFFICULTY = {"A": 1.0, "B": 1.3, "C": 1.6, "D": 1.9, "F": 2.2}
+
+def _window_label(segment):
+    """Turn the text before a time range ("Coding Club (Thursdays") into a short activity label"""
+    label = _DAY_MENTION_RE.sub(" ", segment)
+    label = re.sub(r"[(),;:/&]", " ", label)
+    label = _LABEL_FILLER_RE.sub("", " ".join(label.split()))
+    return label.strip(" .-")
+
+def parse_time_windows(text):
+    """Parse free-text day/time windows into (7, slots) bitmaps
+
+    Each time range applies to the days named since the previous range
+    (specific days win over "weekdays"/"weekends"), to days listed right
+    after it ("Work 9-5 Saturdays") when none were named before it, to the
+    previous range's days otherwise, or to every day when the text names none.
+    Durations such as "2-3 hours" are not ranges. Returns (windows, peaks,
+    ranges): peaks marks ranges introduced by energy/focus wording, and
+    ranges lists (day, start_minute, end_minute, label) entries.
+    """
+    import numpy as np
+    windows = np.zeros((len(DAYS), _SLOTS_PER_DAY), dtype=bool)
+    peaks = np.zeros_like(windows)
+    ranges = []
+    
+    events = sorted(
+        [(m.start(), 0, m) for m in _DAY_MENTION_RE.finditer(text)]
+        + [(m.start(), 1, m) for m in _TIME_RANGE_RE.finditer(text)],
+        key=lambda event: event[:2]
+    )
+    pending, last_days, position, last_label, group = [], None, 0, "", ""
+    previous_day, consumed = None, 0
+    for _, is_time, match in events:
+        if not is_time:
+            if match.start() < consumed:
+                continue
+            name = match.group(1).lower().rstrip(".")
+            if pending and _DAY_RANGE_GAP_RE.fullmatch(text, previous_day.end(), match.start()):
+                # "Monday to Friday"
+                pending[-1] = (_day_indexes(previous_day.group(1), name), False)
+            else:
+                pending.append((_day_indexes(name), name.startswith(("weekday", "weekend", "daily", "every"))))
+            previous_day = match
+            continue
+        if _DURATION_AFTER_RE.match(text, match.end()):
+            continue
+        span = _parse_time_range(match)
+        if not span:
+            continue
+        specific = [entry for entry in pending if not entry[1]]
+        trailing = _TRAILING_DAYS_RE.match(text, match.end())
+        following, following_end = [], 0
+        if not pending and not match.group(0).endswith("."):
+            following, following_end = _leading_days(text[trailing.end():])
+            if text[trailing.end() + following_end:].lstrip(" *").startswith(":"):
+                # "Weekends:" introduces the next ranges
+                following = []
+        if pending:
+            days = sorted({day for indexes, _ in (specific or pending) for day in indexes})
+        elif following:
+            days = following
+            consumed = trailing.end() + following_end
+        else:
+            days = last_days or list(range(len(DAYS)))
+        segment = text[position:match.start()]
+        label = _window_label(segment)
+        # "Team (practice Mon 3-5, games Tue 4-7)": later entries in the parentheses keep the team name
+        if "(" in segment:
+            group = _window_label(segment.rsplit("(", 1)[0].rsplit(")", 1)[-1])
+        elif ")" in segment:
+            group = ""
+        if label and group and not label.startswith(group):
+            label = f"{group} {label}"
+        label = label or last_label
+        first, last = span[0] // SCHEDULE_SLOT_MINUTES, -(-span[1] // SCHEDULE_SLOT_MINUTES)
+        windows[days, first:last] = True
+        if _PEAK_WORDS_RE.search(segment):
+            peaks[days, first:last] = True
+        ranges.extend((day, span[0], span[1], label) for day in days)
+        pending, last_days, position, last_label = [], days, match.end(), label
+    return windows, peaks, ranges
+
+def parse_upcoming_exams(text, today=None):
+    """Parse upcoming_exams into [(label, schedule_code, weeks_away or None), ...]
+
+    "(3 weeks from now)" wins over calendar dates such as "February 3rd";
+    a month on its own counts from the 1st, and dates already past roll
+    over to next year.
+    """
+    from datetime import date
+    today = today or date.today()
+    exams = []
+    for item in split_subjects(text):
+        label = _EXAM_LABEL_RE.split(item, 1)[0].strip() or item
+        in_label = _EXAM_DATE_RE.search(label)
+        if in_label and in_label.start() and (in_label.group(2) or in_label.group(1).lower() != "may"):
+            label = label[:in_label.start()].strip()  # "Physics midterm Feb. 3rd"
+        code = classify_activity(label)
+        if SCHEDULE_SUBJECTS[code] == "Other":
+            code = classify_activity(item)
+        weeks = None
+        relative = _RELATIVE_DATE_RE.search(item)
+        if relative:
+            count = int(relative.group(1) or relative.group(3))
+            unit = (relative.group(2) or relative.group(4)).lower()
+            weeks = count if unit == "week" else count / 7
+        else:
+            for match in _EXAM_DATE_RE.finditer(item):
+                month = _MONTH_NAMES.index(match.group(1).lower()[:3]) + 1
+                if month == 5 and not match.group(2):
+                    continue  # "may" is usually the verb
+                try:
+                    when = date(today.year, month, int(match.group(2) or 1))
+                except ValueError:
+                    continue
+                if (when - today).days < -7:
+                    when = when.replace(year=today.year + 1)
+                weeks = max(0.0, (when - today).days / 7)
+                break
+        exams.append((label, code, weeks))
+    return exams
+
+def subject_difficulty(subject, academic_performance):
+    """Study-load weight for a subject from its grade in academic_performance (1.3 when unknown)"""
+    code = classify_activity(subject)
+    words = {word for word in re.findall(r"[a-z]{4,}", subject.lower())}
+    for item in split_subjects(academic_performance):
+        head = item.split("(", 1)[0].lower()
+        if not (code != SCHEDULE_SUBJECTS.index("Other") and classify_activity(item) == code
+                or words & set(re.findall(r"[a-z]{4,}", head))):
+            continue
+        # Prefer the grade in parentheses: "Honors Physics (C+, ...)"
+        detail = item[item.find("("):] if "(" in item else item
+        grade = _GRADE_RE.search(detail) or _GRADE_RE.search(item)
+        if grade:
+            offset = {"+": -0.1, "-": 0.1}.get(grade.group(2), 0.0)
+            return round(GRADE_DIFFICULTY.get(grade.group(1), GRADE_DIFFICULTY["B"]) + offset, 2)
+        percent = _PERCENT_RE.search(item)
+        if percent:
+            letter = "ABCD"[min(3, max(0, (99 - int(percent.group(1))) // 10))] if int(percent.group(1)) >= 60 else "F"
+            return GRADE_DIFFICULTY[letter]
+    return GRADE_DIFFICULTY["B"]
+
+def optimize_weekly_schedule(student_profile, block_minutes=45, break_minutes=15, today=None):
+    """Build a weekly study schedule locally from a profile's availability, commitments, grades and exams
+
+    Available study windows minus extracurricular commitments are cut into
+    study blocks separated by breaks. Subjects get a share of blocks
+    proportional to their grade-based difficulty times exam proximity;
+    blocks are filled greedily, peak-energy blocks first going to the
+    hardest subjects, with a penalty for repeating a subject on one day.
+    Returns a StudySchedule (empty when no availability could be parsed).
+    """
+    import numpy as np
+    available, peaks, _ = parse_time_windows(student_profile.get("available_study_time", ""))
+    busy, _, commitments = parse_time_windows(student_profile.get("extracurricular_activities", ""))
+    free = available & ~busy
+    
+    # Study items: each subject, plus exams (e.g. SAT) that match no subject
+    items = []
+    for subject in split_subjects(student_profile.get("subjects", "")):
+        name = re.sub(r"\s*\([^)]*\)", "", subject).strip() or subject
+        items.append({"name": name, "code": classify_activity(subject), "exams": [],
+                      "difficulty": subject_difficulty(subject, student_profile.get("academic_performance", ""))})
+    for label, code, weeks in parse_upcoming_exams(student_profile.get("upcoming_exams", ""), today):
+        item = next((item for item in items if item["code"] == code), None)
+        if item is None:
+            item = {"name": f"{label} prep", "code": code, "exams": [], "difficulty": GRADE_DIFFICULTY["A"]}
+            items.append(item)
+        item["exams"].append((label, weeks))
+    
+    blocks = [(day, start, end, SCHEDULE_SUBJECTS.index("Extracurricular"), label or "Commitment")
+              for day, start, end, label in commitments]
+    if not items or not free.any():
+        return StudySchedule(_schedule_grid(blocks), sorted(blocks))
+    
+    # Cut every free run into study blocks separated by breaks
+    block_slots = max(1, block_minutes // SCHEDULE_SLOT_MINUTES)
+    break_slots = max(0, break_minutes // SCHEDULE_SLOT_MINUTES)
+    min_slots = min(block_slots, 2)
+    study_blocks, breaks = [], []
+    for day in range(len(DAYS)):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], free[day].astype(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            slot = start
+            while end - slot >= min_slots:
+                length = min(block_slots, end - slot)
+                study_blocks.append((day, slot, slot + length, peaks[day, slot:slot + length].mean()))
+                slot += length
+                if end - slot < break_slots + min_slots:
+                    break
+                if break_slots:
+                    breaks.append((day, slot, slot + break_slots))
+                    slot += break_slots
+    
+    # Target share of study time per item: difficulty x exam proximity
+    weights = np.array([
+        item["difficulty"] * max([1.0] + [1.25 if weeks is None else 1 + 2 / (1 + weeks) for _, weeks in item["exams"]])
+        for item in items
+    ])
+    lengths = np.array([end - start for _, start, end, _ in study_blocks], dtype=float)
+    target = weights / weights.sum() * lengths.sum()
+    difficulty = np.array([item["difficulty"] for item in items])
+    spread = difficulty.max() - difficulty.min()
+    hardness = (difficulty - difficulty.min()) / spread if spread else np.zeros(len(items))
+    assigned = np.zeros(len(items))
+    per_day = np.zeros((len(DAYS), len(items)))
+    
+    order = sorted(range(len(study_blocks)), key=lambda i: (-study_blocks[i][3], study_blocks[i][:2]))
+    choice = {}
+    for i in order:
+        day, start, end, peak = study_blocks[i]
+        score = (target - assigned) / target + 0.5 * peak * hardness - 0.6 * per_day[day]
+        k = int(np.argmax(score))
+        choice[i] = k
+        assigned[k] += end - start
+        per_day[day, k] += 1
+    
+    for i, (day, start, end, _) in enumerate(study_blocks):
+        item = items[choice[i]]
+        description = item["name"]
+        upcoming = [(weeks, label) for label, weeks in item["exams"] if weeks is not None and weeks <= 4]
+        if upcoming:
+            description += f" ({min(upcoming)[1]} prep)"
+        blocks.append((day, start * SCHEDULE_SLOT_MINUTES, end * SCHEDULE_SLOT_MINUTES, item["code"], description))
+    for day, start, end in breaks:
+        blocks.append((day, start * SCHEDULE_SLOT_MINUTES, end * SCHEDULE_SLOT_MINUTES, SCHEDULE_SUBJECTS.index("Break"), "Break"))
+    blocks.sort()
+    return StudySchedule(_schedule_grid(blocks), blocks)
+
+def _clock(minute):
+    """Format a minute of the day as "6:45 PM\""""
+    hour, minute = divmod(minute, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 or hour == 24 else 'PM'}"
+
+def format_weekly_schedule(schedule):
+    """Render a StudySchedule as the per-day Markdown lists parse_weekly_schedule reads back"""
+    hours = {}
+    for _, start, end, code, description in schedule.blocks:
+        if SCHEDULE_SUBJECTS[code] not in ("Break", "Extracurricular"):
+            hours[description.split(" (")[0]] = hours.get(description.split(" (")[0], 0) + (end - start) / 60
+    lines = []
+    if hours:
+        lines.append("Weekly study time: " + ", ".join(f"{name} {total:g}h" for name, total in hours.items()))
+        lines.append("")
+    for day_index, day in enumerate(DAYS):
+        lines.append(f"### {day}")
+        day_blocks = [block for block in schedule.blocks if block[0] == day_index]
+        lines.extend(f"- {_clock(start)}-{_clock(end)}: {description}" for _, start, end, _, description in day_blocks)
+        if not day_blocks:
+            lines.append("- Rest day")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+def insert_weekly_schedule(plan_text, schedule_markdown):
+    """Append a schedule to the plan's Weekly Master Schedule section, adding the section if it is missing"""
+    preamble, sections = parse_plan_sections(plan_text)
+    parts, inserted = [preamble], False
+    for title, heading_line, body in sections:
+        if not inserted and PLAN_SECTION_TITLES.index(title) > PLAN_SECTION_TITLES.index("Weekly Master Schedule"):
+            parts.append(f"## {PLAN_SECTION_TITLES.index('Weekly Master Schedule') + 1}. Weekly Master Schedule\n\n{schedule_markdown}\n")
+            inserted = True
+        parts.append(heading_line)
+        if title == "Weekly Master Schedule" and not inserted:
+            parts.append(f"\n\n{body.strip()}\n\n{schedule_markdown}\n" if body.strip() else f"\n\n{schedule_markdown}\n")
+            inserted = True
+        else:
+            parts.append(body)
+    if not inserted:
+        parts.append(f"\n\n## {PLAN_SECTION_TITLES.index('Weekly Master Schedule') + 1}. Weekly Master Schedule\n\n{schedule_markdown}")
+    return "".join(parts).rstrip() + "\n"
+
+def safe_filename(name):
+    """Replace every non-alphanumeric character so a student name can be used in a path"""
+    return "".join([c if c.isalnum() else "_" for c in name])
+
+class ScheduleRenderer:
+    """Reusable Agg renderer for StudySchedule grids
+
+    The figure, axes, ticks and a legend covering every SCHEDULE_SUBJECTS entry
+    are laid out and rasterized once. PNGs without a per-plot title are then
+    produced by painting the grid straight into a copy of that cached raster,
+    skipping matplotlib drawing entirely; titled PNGs swap the image data and
+    redraw. SVGs are written directly from the grid as one rect per run of
+    equal cells, and npy writes the raw grid.
+    """
+    hours = list(range(6, 23))  # 6 AM to 10 PM
+    default_title = "Weekly Study Schedule"
+    
+    def __init__(self, dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.colors import ListedColormap, to_rgba_array
+        from matplotlib.patches import Patch
+        import numpy as np
+        
+        self.figure = Figure(figsize=(12, 8), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        self.image = ax.imshow(
+            np.zeros((len(DAYS), len(self.hours)), dtype=np.uint8),
+            cmap=ListedColormap(SCHEDULE_COLORS), aspect='auto',
+            vmin=-0.5, vmax=len(SCHEDULE_SUBJECTS) - 0.5, interpolation='nearest'
+        )
+        
+        ax.set_xticks(np.arange(len(self.hours)))
+        ax.set_yticks(np.arange(len(DAYS)))
+        ax.set_xticklabels([f"{h}:00" for h in self.hours], rotation=45, ha="right", rotation_mode="anchor")
+        ax.set_yticklabels(DAYS)
+        
+        legend_elements = [Patch(facecolor=color, edgecolor='#888888', label=subject)
+                           for subject, color in zip(SCHEDULE_SUBJECTS[1:], SCHEDULE_COLORS[1:])]
+        ax.legend(handles=legend_elements, bbox_to_anchor=(1.05, 1), loc='upper left')
+        self.title = ax.set_title(self.default_title)
+        self.figure.tight_layout()
+        
+        # Cache the rendered background and the pixel box of the plot area
+        self.canvas.draw()
+        self.background = np.asarray(self.canvas.buffer_rgba()).copy()
+        height = self.background.shape[0]
+        x0, y0, x1, y1 = ax.get_window_extent().extents
+        # Stay one pixel inside the spines so the frame is preserved
+        self.top, self.bottom = int(round(height - y1)) + 1, int(round(height - y0)) - 1
+        self.left, self.right = int(round(x0)) + 1, int(round(x1)) - 1
+        self.colors = (to_rgba_array(SCHEDULE_COLORS) * 255).round().astype(np.uint8)
+        # Pixel height of each day row and width of each hour column
+        rows = np.arange(self.bottom - self.top) * len(DAYS) // (self.bottom - self.top)
+        cols = np.arange(self.right - self.left) * len(self.hours) // (self.right - self.left)
+        self._row_repeats = np.bincount(rows, minlength=len(DAYS))
+        self._col_repeats = np.bincount(cols, minlength=len(self.hours))
+    
+    def rasterize(self, schedule):
+        """Return the rendered schedule as an RGBA uint8 array without invoking matplotlib"""
+        import numpy as np
+        cells = self.colors[schedule.grid[:, self.hours[0]:self.hours[-1] + 1]]
+        cells = np.repeat(np.repeat(cells, self._col_repeats, axis=1), self._row_repeats, axis=0)
+        frame = self.background.copy()
+        frame[self.top:self.bottom, self.left:self.right] = cells
+        return frame
+    
+    def svg(self, schedule, title=None):
+        """Return the schedule as an SVG document built from the grid without invoking matplotlib"""
+        from html import escape
+        cell_width, cell_height, left, top = 48, 80, 100, 60
+        right, bottom = left + cell_width * len(self.hours), top + cell_height * len(DAYS)
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{right + 220}" height="{bottom + 70}" '
+            f'font-family="sans-serif" font-size="12">',
+            '<rect width="100%" height="100%" fill="#FFFFFF"/>',
+            f'<text x="{(left + right) // 2}" y="{top - 20}" font-size="16" text-anchor="middle">'
+            f'{escape(title or self.default_title)}</text>'
+        ]
+        grid = schedule.grid[:, self.hours[0]:self.hours[-1] + 1]
+        for day_index, day in enumerate(DAYS):
+            y = top + day_index * cell_height
+            parts.append(f'<text x="{left - 8}" y="{y + cell_height // 2 + 4}" text-anchor="end">{day}</text>')
+            start = 0
+            # One rect per run of equal cells keeps the file small
+            for hour_index in range(1, len(self.hours) + 1):
+                if hour_index < len(self.hours) and grid[day_index, hour_index] == grid[day_index, start]:
+                    continue
+                parts.append(f'<rect x="{left + start * cell_width}" y="{y}" width="{(hour_index - start) * cell_width}" '
+                             f'height="{cell_height}" fill="{SCHEDULE_COLORS[grid[day_index, start]]}"/>')
+                start = hour_index
+        for hour_index, hour in enumerate(self.hours):
+            x = left + hour_index * cell_width + cell_width // 2
+            parts.append(f'<text x="{x}" y="{bottom + 14}" text-anchor="end" '
+                         f'transform="rotate(-45 {x} {bottom + 14})">{hour}:00</text>')
+        parts.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" fill="none" stroke="#000000"/>')
+        for index, (subject, color) in enumerate(zip(SCHEDULE_SUBJECTS[1:], SCHEDULE_COLORS[1:])):
+            y = top + index * 20
+            parts.append(f'<rect x="{right + 20}" y="{y}" width="14" height="14" fill="{color}" stroke="#888888"/>')
+            parts.append(f'<text x="{right + 40}" y="{y + 11}">{escape(subject)}</text>')
+        parts.append("</svg>\n")
+        return "\n".join(parts)
+    
+    def render(self, schedule, output_path, title=None):
+        """Draw schedule into output_path; the format follows the file extension"""
+        import numpy as np
+        format_type = Path(output_path).suffix.lstrip(".").lower() or "png"
+        if format_type == "npy":
+            np.save(output_path, schedule.grid)
+            return output_path
+        
+        if format_type == "png" and not title:
+            from PIL import Image
+            Image.fromarray(self.rasterize(schedule)).save(output_path, compress_level=1)
+            return output_path
+        if format_type == "svg":
+            with open(output_path, "w") as f:
+                f.write(self.svg(schedule, title))
+            return output_path
+        
+        self.image.set_data(schedule.grid[:, self.hours[0]:self.hours[-1] + 1])
+        self.title.set_text(title or self.default_title)
+        self.figure.savefig(output_path, format=format_type)
+        return output_path
+
+# Per-process renderer for render_schedules worker pools
+_worker_renderer = None
+
+def _render_schedule_job(job):
+    """Parse and render one (plan_text, output_path) job; used by worker processes"""
+    global _worker_renderer
+    plan_text, output_path = job
+    try:
+        if _worker_renderer is None:
+            _worker_renderer = ScheduleRenderer()
+        return _worker_renderer.render(parse_weekly_schedule(plan_text), output_path)
+    except Exception as e:
+        logger.error(f"Error rendering schedule {output_path}: {e}")
+        return None
+
+def iter_saved_plans(source):
+    """Yield (name, plan_text) from a directory of saved plans, a plan archive or a batch results JSONL file"""
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(source.iterdir()):
+            if path.suffix in (".txt", ".md", ".html") and path.is_file():
+                yield path.stem, read_plan_file(path)
+        return
+    if source.suffix in (".db", ".sqlite"):
+        archive = PlanArchive(source)
+        try:
+            for record in archive.iter_plans():
+                yield f"{record['id']:06d}_{safe_filename(record['student_name'])}", record["study_plan"]
+        finally:
+            archive.close()
+        return
+    with open(source, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("status", "ok") == "ok" and record.get("study_plan"):
+                name = f"{record.get('index', 0):05d}_{safe_filename(record.get('student_name', 'student'))}"
+                yield name, record["study_plan"]
+
+def render_schedules(plans, output_dir="visualizations", format_type="png", processes=None):
+    """Render the schedules of many (name, plan_text) pairs to <output_dir>/<name>_schedule.<format>
+
+    Rendering reuses one figure per process and the student is identified by
+    the file name, which keeps PNGs on the cached-raster fast path. With
+    processes > 1 the work is spread over a process pool. Returns the list of
+    written paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = (
+        (plan_text, os.path.join(output_dir, f"{name}_schedule.{format_type}"))
+        for name, plan_text in plans
+    )
+    
+    if processes and processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_render_schedule_job, jobs, chunksize=64))
+    else:
+        results = [_render_schedule_job(job) for job in jobs]
+    return [path for path in results if path]
 
 def create_sample_student_profile():
     """Create a sample student profile with enhanced details to demonstrate the prompt template"""
@@ -204,22 +1328,2124 @@ def create_sample_student_profile():
         "special_considerations": "Processes information more slowly than peers but with higher retention when given adequate time. Benefits from movement breaks during study sessions. Slight auditory processing delay means recorded lectures work better than live ones because they can be paused/replayed. Strong preference for visual organization systems."
     }
 
+def load_student_profiles(path):
+    """Load student profiles from a JSONL, JSON (list) or CSV file
+
+    Missing optional fields are filled with an empty string so every profile
+    renders against the prompt template; a student_name is required.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    
+    with open(path, 'r', newline='') as f:
+        if suffix == ".csv":
+            records = list(csv.DictReader(f))
+        elif suffix == ".json":
+            records = json.load(f)
+            if isinstance(records, dict):
+                records = [records]
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    
+    profiles = []
+    for line_number, record in enumerate(records, start=1):
+        if not record.get("student_name"):
+            raise ValueError(f"{path}: profile #{line_number} has no student_name")
+        profiles.append({field: str(record.get(field) or "") for field in PROFILE_FIELDS})
+    return profiles
+
+def extract_plan_text(study_plan):
+    """Return the generated plan text from a chain result or plain string"""
+    if isinstance(study_plan, dict):
+        return study_plan.get("text", "")
+    return getattr(study_plan, "content", study_plan) or ""
+
+_PLAN_FILENAME_RE = re.compile(r"^(?P<name>.+)_study_plan_(?P<timestamp>\d{8}_\d{6})$")
+
+def render_plan_html(plan_text, title=None):
+    """Render a Markdown plan (headings, lists, bold text, paragraphs) as a standalone HTML page"""
+    import html
+    
+    def inline(text):
+        return re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", html.escape(text))
+    
+    body, list_tag = [], None
+    for line in plan_text.splitlines():
+        stripped = line.strip()
+        heading = re.match(r"^(#{1,6})\s+(.*)", stripped)
+        item = re.match(r"^(?:[-*+]|(\d+)[.)])\s+(.*)", stripped)
+        tag = ("ol" if item.group(1) else "ul") if item else None
+        if list_tag and tag != list_tag:
+            body.append(f"</{list_tag}>")
+            list_tag = None
+        if heading:
+            level = len(heading.group(1))
+            body.append(f"<h{level}>{inline(heading.group(2))}</h{level}>")
+        elif item:
+            if not list_tag:
+                body.append(f"<{tag}>")
+                list_tag = tag
+            body.append(f"<li>{inline(item.group(2))}</li>")
+        elif stripped:
+            body.append(f"<p>{inline(stripped)}</p>")
+    if list_tag:
+        body.append(f"</{list_tag}>")
+    
+    title = html.escape(f"Study Plan - {title}" if title else "Study Plan")
+    return (
+        f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{title}</title>\n</head>\n"
+        f"<body>\n" + "\n".join(body) + "\n</body>\n</html>\n"
+    )
+
+def format_plan(study_plan, format_type="txt", student_name=None):
+    """Return the file contents save_study_plan writes for a plan in format_type
+
+    html renders the plan as a page; txt and md files hold the plan text
+    itself, without the profile fields of a chain result.
+    """
+    if format_type == "html":
+        return render_plan_html(extract_plan_text(study_plan), student_name)
+    return extract_plan_text(study_plan)
+
+def _percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers (pct in 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+# Upper bounds (seconds) of the span and time-to-first-token histograms
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+class MetricsRegistry:
+    """In-process counters and histograms rendered in the Prometheus text format"""
+    
+    def __init__(self):
+        import threading
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+    
+    def inc(self, name, value=1, help_text=None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help_text:
+                self.help.setdefault(name, help_text)
+    
+    def observe(self, name, value, help_text=None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(METRIC_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(METRIC_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+            if help_text:
+                self.help.setdefault(name, help_text)
+    
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (
+            f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+    
+    def render(self, gauges=None):
+        """Prometheus exposition text for every metric (plus optional {name: value} gauges)"""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{self._labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(METRIC_BUCKETS, histogram["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class _NoopSpan:
+    """Span returned while tracing is disabled: every operation is a no-op"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+    
+    def set(self, **attrs):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+    
+    def __enter__(self):
+        parent = self.tracer._current.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(4).hex()
+        self._token = self.tracer._current.set(self)
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        return self
+    
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.tracer._current.reset(self._token)
+        self.tracer._finish(self, duration, exc)
+        return False
+
+class Tracer:
+    """Span-based timing for the generation pipeline
+
+    Disabled by default, in which case span() hands back a shared no-op and
+    count()/observe() return immediately. Once enabled, every finished span
+    is recorded in the metrics registry (duration histogram and error
+    counter per span name) and, when a trace file is set, appended to it as
+    one JSON object per line with its trace/parent ids, timing and
+    attributes. Parent spans are tracked per asyncio task via contextvars.
+    """
+    
+    def __init__(self):
+        import contextvars
+        self.enabled = False
+        self.trace_path = None
+        self.metrics = MetricsRegistry()
+        self._current = contextvars.ContextVar("study_plan_span", default=None)
+        self._file = None
+    
+    def enable(self, trace_path=None):
+        """Turn on metrics, and JSONL span export when trace_path is given"""
+        self.enabled = True
+        if trace_path and trace_path != self.trace_path:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._file = open(trace_path, "a", buffering=1)
+            self.trace_path = trace_path
+    
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, attrs)
+    
+    def annotate(self, **attrs):
+        """Add attributes to the innermost open span"""
+        if self.enabled:
+            current = self._current.get()
+            if current is not None:
+                current.set(**attrs)
+    
+    def count(self, name, value=1, help_text=None, **labels):
+        if self.enabled:
+            self.metrics.inc(f"study_plan_{name}_total", value, help_text, **labels)
+    
+    def observe(self, name, value, help_text=None, **labels):
+        if self.enabled:
+            self.metrics.observe(f"study_plan_{name}", value, help_text, **labels)
+    
+    def _finish(self, span, duration, exc):
+        self.metrics.observe("study_plan_span_duration_seconds", duration, "Time spent in each pipeline span", span=span.name)
+        if exc is not None:
+            self.metrics.inc("study_plan_span_errors_total", 1, "Spans that raised", span=span.name)
+        if self._file is None:
+            return
+        record = {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "start": round(span.start_wall, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "status": "error" if exc is not None else "ok",
+            "attrs": span.attrs
+        }
+        if exc is not None:
+            record["error"] = str(exc) or type(exc).__name__
+        self._file.write(json.dumps(record, default=str) + "\n")
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# Shared tracer; enabled by --trace/--metrics-file or the trace_file config key
+tracer = Tracer()
+
+_CO_COROUTINE = 0x80  # inspect.CO_COROUTINE, without importing inspect at startup
+
+def traced(name):
+    """Decorator running a function or coroutine function inside a tracer span"""
+    import functools
+    
+    def decorate(func):
+        if func.__code__.co_flags & _CO_COROUTINE:
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class PlanCache:
+    """Persistent on-disk cache of generated plans
+
+    Entries are content-addressed by a hash of the rendered prompt, the model
+    and the temperature, stored one JSON file per key, and evicted oldest-first
+    once the cache exceeds its entry count, byte size or age limits.
+    """
+    
+    def __init__(self, cache_dir, max_entries=1000, max_bytes=200 * 1024 * 1024, max_age_seconds=30 * 86400):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def make_key(prompt, model, temperature, variant=None):
+        """Hash the exact prompt text together with the sampling settings
+
+        variant distinguishes plans generated from the same prompt by a
+        different pipeline (e.g. the sectioned engine).
+        """
+        parts = [prompt, model, float(temperature)]
+        if variant:
+            parts.append(variant)
+        payload = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+    
+    def get(self, key):
+        """Return the cached plan text for key, or None on a miss or expired entry"""
+        path = self._path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            # Touch the entry so eviction is least-recently-used rather than oldest-written
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return entry["text"]
+    
+    def put(self, key, text, **metadata):
+        """Store plan text under key and enforce the eviction limits"""
+        entry = {"text": text, "created_at": datetime.now().isoformat(), **metadata}
+        tmp_path = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.error(f"Error writing plan cache entry: {e}")
+            return
+        self._evict()
+    
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until within limits"""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age_seconds:
+                Path(entry.path).unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            Path(path).unlink(missing_ok=True)
+            total_bytes -= size
+    
+    def clear(self):
+        """Remove every cache entry"""
+        for path in self.cache_dir.glob("*.json"):
+            path.unlink(missing_ok=True)
+    
+    def stats(self):
+        """Hit/miss counters for this process"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+class PlanArchive:
+    """Append-only SQLite archive of generated plans
+
+    One database file replaces a directory of per-plan text files. Profiles
+    and plan text are stored zlib-compressed next to the model, temperature
+    and timing metadata, and an index on (student, created_at) makes lookups
+    of a student's latest plan or the plan in effect at a given time a single
+    index probe. Plans are never updated in place; a new plan for the same
+    student is a new row.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS plans (
+            id INTEGER PRIMARY KEY,
+            student_key TEXT NOT NULL,
+            student_name TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            model TEXT,
+            temperature REAL,
+            generation_seconds REAL,
+            source TEXT,
+            plan_chars INTEGER NOT NULL,
+            profile BLOB,
+            plan BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS plans_student_time ON plans (student_key, created_at);
+        CREATE INDEX IF NOT EXISTS plans_time ON plans (created_at);
+    """
+    METADATA_COLUMNS = ("id", "student_name", "created_at", "model", "temperature", "generation_seconds", "source", "plan_chars")
+    
+    def __init__(self, path):
+        import sqlite3
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+    
+    @staticmethod
+    def student_key(student_name):
+        return safe_filename(student_name.strip()).lower()
+    
+    @staticmethod
+    def _pack(text):
+        import zlib
+        return zlib.compress(text.encode("utf-8"), 6)
+    
+    @staticmethod
+    def _unpack(blob):
+        import zlib
+        return zlib.decompress(blob).decode("utf-8") if blob is not None else None
+    
+    def add(self, student_name, plan_text, student_profile=None, model=None, temperature=None,
+            generation_seconds=None, created_at=None, source=None, commit=True):
+        """Append one plan and return its id"""
+        profile = json.dumps(student_profile, ensure_ascii=False) if student_profile else None
+        cursor = self.db.execute(
+            "INSERT INTO plans (student_key, student_name, created_at, model, temperature, generation_seconds, "
+            "source, plan_chars, profile, plan) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.student_key(student_name), student_name, created_at or time.time(), model, temperature,
+             generation_seconds, source, len(plan_text), self._pack(profile) if profile else None, self._pack(plan_text))
+        )
+        if commit:
+            self.db.commit()
+        return cursor.lastrowid
+    
+    def _record(self, row, with_content=True):
+        record = dict(zip(self.METADATA_COLUMNS, row[:len(self.METADATA_COLUMNS)]))
+        if with_content:
+            profile = self._unpack(row[-2])
+            record["student_profile"] = json.loads(profile) if profile else None
+            record["study_plan"] = self._unpack(row[-1])
+        return record
+    
+    def _select(self, where="", params=(), with_content=True, order="created_at, id", limit=None):
+        columns = ", ".join(self.METADATA_COLUMNS + (("profile", "plan") if with_content else ()))
+        query = f"SELECT {columns} FROM plans {where} ORDER BY {order}"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        for row in self.db.execute(query, params):
+            yield self._record(row, with_content)
+    
+    def get(self, plan_id):
+        """Return the plan with this id, or None"""
+        return next(self._select("WHERE id = ?", (plan_id,)), None)
+    
+    def find(self, student_name, at=None):
+        """Return the student's latest plan, or the latest one created at or before `at` (epoch seconds)"""
+        if at is None:
+            where, params = "WHERE student_key = ?", (self.student_key(student_name),)
+        else:
+            where, params = "WHERE student_key = ? AND created_at <= ?", (self.student_key(student_name), at)
+        return next(self._select(where, params, order="created_at DESC, id DESC", limit=1), None)
+    
+    def iter_plans(self, student_name=None, since=None, until=None, with_content=True):
+        """Stream plans oldest first, optionally for one student and/or a time window"""
+        clauses, params = [], []
+        if student_name:
+            clauses.append("student_key = ?")
+            params.append(self.student_key(student_name))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(where, tuple(params), with_content)
+    
+    def export(self, output_dir, format_type="txt", student_name=None):
+        """Write plans back out as one <student>_study_plan_<timestamp>.<format> file each; returns the count"""
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        for record in self.iter_plans(student_name):
+            timestamp = datetime.fromtimestamp(record["created_at"]).strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(output_dir, f"{safe_filename(record['student_name'])}_study_plan_{timestamp}.{format_type}")
+            if os.path.exists(path):
+                path = f"{path[:-len(format_type) - 1]}_{record['id']}.{format_type}"
+            with open(path, "w") as f:
+                f.write(format_plan(record["study_plan"], format_type, record["student_name"]))
+            count += 1
+        return count
+    
+    def import_directory(self, source_dir):
+        """Archive every plan file saved by save_study_plan under source_dir; returns the count
+
+        The student and timestamp come from the file name (or the JSON chain
+        result, when the file holds one); unparseable names fall back to the
+        file's modification time. The files themselves are left in place.
+        Files already archived (by source path) are skipped, so importing the
+        same directory again only adds new plans.
+        """
+        imported = {row[0] for row in self.db.execute("SELECT source FROM plans WHERE source IS NOT NULL")}
+        count = 0
+        for path in sorted(Path(source_dir).rglob("*")):
+            if path.suffix not in (".txt", ".md", ".html") or not path.is_file():
+                continue
+            source = str(path.resolve())
+            if source in imported or str(path) in imported:
+                continue
+            with open(path, 'r') as f:
+                content = f.read()
+            try:
+                result = json.loads(content)
+            except ValueError:
+                result = None
+            profile = {k: v for k, v in result.items() if k in PROFILE_FIELDS} if isinstance(result, dict) else None
+            
+            match = _PLAN_FILENAME_RE.match(path.stem)
+            if match:
+                student_name = match.group("name").replace("_", " ")
+                created_at = datetime.strptime(match.group("timestamp"), "%Y%m%d_%H%M%S").timestamp()
+            else:
+                student_name = path.stem
+                created_at = path.stat().st_mtime
+            if profile and profile.get("student_name"):
+                student_name = profile["student_name"]
+            
+            self.add(student_name, extract_plan_text(result) if isinstance(result, dict) else content,
+                     student_profile=profile, created_at=created_at, source=source, commit=False)
+            imported.add(source)
+            count += 1
+            if count % 1000 == 0:
+                self.db.commit()
+        self.db.commit()
+        return count
+    
+    def stats(self):
+        plans, students, chars = self.db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT student_key), COALESCE(SUM(plan_chars), 0) FROM plans"
+        ).fetchone()
+        return {
+            "plans": plans,
+            "students": students,
+            "plan_chars": chars,
+            "file_bytes": self.path.stat().st_size if self.path.exists() else 0
+        }
+    
+    def close(self):
+        self.db.close()
+
+def profile_fingerprint(student_profile):
+    """Short stable hash of a profile, used to notice edited input files on resume"""
+    payload = json.dumps({field: student_profile.get(field, "") for field in PROFILE_FIELDS}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class JobJournal:
+    """Append-only JSONL journal of a batch run's per-profile state
+
+    The first line describes the run (input and output files, model,
+    temperature); every later line is one profile's state change: in_flight,
+    done (with where its plan was written) or failed. Replaying the file
+    gives each profile's latest state, so an interrupted run can resume with
+    only the outstanding profiles. done and failed records are fsync'd before
+    the profile counts as finished; in_flight records are only flushed, as
+    losing one just runs that profile again. A torn last line left by a
+    crash is skipped on replay.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.run = None
+        self.states = {}
+        self.session = []
+        self._file = None
+        self._torn = False
+        if self.path.exists():
+            self._replay()
+    
+    def _replay(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                self._torn = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable line {line_number} of job journal {self.path}")
+                    continue
+                if record.get("type") == "run":
+                    self.run = record
+                else:
+                    self.states[record["index"]] = record
+    
+    def _append(self, record, sync=True):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._torn:
+                # Terminate a partial line from a crash so this record starts on its own line
+                self._file.write("\n")
+                self._torn = False
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+    
+    def start(self, **run):
+        """Begin a new run, discarding any earlier journal at this path"""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding="utf-8")
+        self._torn = False
+        self.run = {"type": "run", "created_at": time.time(), **run}
+        self.states = {}
+        self._append(self.run)
+    
+    def record(self, index, key, state, **fields):
+        """Append a state change for the profile at index"""
+        record = {"type": "profile", "index": index, "key": key, "state": state, "at": round(time.time(), 3), **fields}
+        self._append(record, sync=state != "in_flight")
+        self.states[index] = record
+        if state != "in_flight":
+            self.session.append(record)
+    
+    def outstanding(self, keys):
+        """Indexes of profiles not yet done (or whose profile changed since), in input order"""
+        return [
+            index for index, key in enumerate(keys)
+            if not (self.states.get(index, {}).get("state") == "done" and self.states[index].get("key") == key)
+        ]
+    
+    def counts(self, keys):
+        """Number of profiles per state for the current input"""
+        counts = {"pending": 0, "in_flight": 0, "done": 0, "failed": 0}
+        for index, key in enumerate(keys):
+            record = self.states.get(index)
+            counts[record["state"] if record and record.get("key") == key else "pending"] += 1
+        return counts
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+_SEARCH_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+_SEARCH_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their them they this to was "
+    "were will with he she his her you your who what when where which how can not but if into than then".split()
+)
+
+def search_tokens(text):
+    """Lowercased word unigrams and bigrams used for hashing-vector similarity"""
+    words = [w for w in _SEARCH_TOKEN_RE.findall(text.lower()) if w not in _SEARCH_STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def profile_search_text(student_profile):
+    """The profile fields (as in create_sample_student_profile) that describe a student, as one string"""
+    return "\n".join(str(student_profile.get(field, "")) for field in PROFILE_FIELDS if field != "student_name")
+
+def hash_vector(text, dim=512, weights=None):
+    """Hash text into an L2-normalised log-term-frequency vector of length dim"""
+    import numpy as np
+    import zlib
+    buckets = [zlib.crc32(token.encode("utf-8")) % dim for token in search_tokens(text)]
+    vector = np.log1p(np.bincount(buckets, minlength=dim).astype(np.float32)) if buckets else np.zeros(dim, np.float32)
+    if weights is not None:
+        vector *= weights
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def normalize_profile(student_profile):
+    """Canonical form of a profile for similarity matching
+
+    The student's name is dropped and replaced by a placeholder wherever it
+    appears in the free text; values are lowercased with whitespace collapsed,
+    and subjects are sorted so their order does not matter.
+    """
+    name = str(student_profile.get("student_name", "")).strip().lower()
+    names = [n for n in (name, name.split()[0] if name else "") if len(n) > 1]
+    normalized = {}
+    for field in PROFILE_FIELDS:
+        if field == "student_name":
+            continue
+        value = " ".join(str(student_profile.get(field, "")).lower().split())
+        for n in names:
+            value = re.sub(rf"\b{re.escape(n)}\b", "<name>", value)
+        if field == "subjects":
+            value = ", ".join(sorted(s.lower() for s in split_subjects(value)))
+        normalized[field] = value
+    return normalized
+
+def personalize_plan(plan_text, old_name, new_name):
+    """Swap one student's full and first name for another's throughout a plan"""
+    if not old_name or not new_name or old_name == new_name:
+        return plan_text
+    pairs = [(old_name, new_name), (old_name.split()[0], new_name.split()[0])]
+    for old, new in pairs + [(old.upper(), new.upper()) for old, new in pairs]:
+        if old != new:
+            plan_text = re.sub(rf"\b{re.escape(old)}\b", lambda _: new, plan_text)
+    return plan_text
+
+class PlanIndex:
+    """Keyword and similarity search over the plans in a PlanArchive
+
+    Keywords go into an SQLite FTS5 inverted index inside the archive
+    database (contentless, ranked with BM25). Every plan also gets a
+    fixed-size hashing vector of its profile fields and, at lower weight, its
+    plan text (log term frequencies of unigrams and bigrams, L2-normalised);
+    vectors are appended to <archive>.vec and scored with one NumPy
+    matrix-vector product, with IDF weights applied to the query from
+    per-bucket document frequencies. update() only indexes plans added since
+    the last call, and search() calls it first.
+    """
+    
+    PLAN_TEXT_WEIGHT = 0.3
+    
+    def __init__(self, archive, dim=512):
+        self.archive = archive
+        self.dim = dim
+        self.vector_path = Path(f"{archive.path}.vec")
+        self.ids_path = Path(f"{archive.path}.vec.ids")
+        self.df_path = Path(f"{archive.path}.vec.df.npy")
+        archive.db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS plan_fts USING fts5(student_name, profile, plan, content='')"
+        )
+        archive.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS plan_fts_vocab USING fts5vocab(plan_fts, 'row')")
+        self._ids = None
+        self._vectors = None
+        self._df = None
+    
+    def vectorize(self, text, weights=None):
+        return hash_vector(text, self.dim, weights)
+    
+    def _document_vector(self, profile_text, plan_text):
+        import numpy as np
+        vector = self.vectorize(profile_text) + self.PLAN_TEXT_WEIGHT * self.vectorize(plan_text)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+    
+    def _load(self):
+        """Map the vector files, trimming any rows a crash left without a matching id"""
+        import numpy as np
+        ids = np.fromfile(self.ids_path, dtype=np.int64) if self.ids_path.exists() else np.zeros(0, np.int64)
+        rows = self.vector_path.stat().st_size // (4 * self.dim) if self.vector_path.exists() else 0
+        count = min(len(ids), rows)
+        self._ids = ids[:count]
+        self._vectors = (np.memmap(self.vector_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+                         if count else np.zeros((0, self.dim), np.float32))
+        self._df = np.load(self.df_path) if self.df_path.exists() else np.zeros(self.dim, np.int64)
+    
+    def update(self, batch_size=1000):
+        """Index plans added to the archive since the last update; returns how many were added"""
+        import numpy as np
+        if self._ids is None:
+            self._load()
+        last_id = int(self._ids[-1]) if len(self._ids) else 0
+        # Rewrite the files at their consistent length before appending
+        for path, size in ((self.vector_path, len(self._ids) * 4 * self.dim), (self.ids_path, len(self._ids) * 8)):
+            if path.exists() and path.stat().st_size != size:
+                os.truncate(path, size)
+        
+        added = 0
+        df = self._df.copy()
+        while True:
+            batch = list(self.archive._select("WHERE id > ?", (last_id,), order="id", limit=batch_size))
+            if not batch:
+                break
+            vectors = []
+            for record in batch:
+                profile_text = profile_search_text(record["student_profile"] or {})
+                vector = self._document_vector(profile_text, record["study_plan"])
+                vectors.append(vector)
+                df += vector > 0
+                self.archive.db.execute(
+                    "INSERT INTO plan_fts (rowid, student_name, profile, plan) VALUES (?, ?, ?, ?)",
+                    (record["id"], record["student_name"], profile_text, record["study_plan"])
+                )
+            with open(self.vector_path, "ab") as f:
+                np.asarray(vectors, dtype=np.float32).tofile(f)
+            with open(self.ids_path, "ab") as f:
+                np.asarray([record["id"] for record in batch], dtype=np.int64).tofile(f)
+            np.save(self.df_path, df)
+            self.archive.db.commit()
+            added += len(batch)
+            last_id = batch[-1]["id"]
+        
+        if added:
+            self._load()
+            logger.info(f"Indexed {added} new plans ({len(self._ids)} total)")
+        return added
+    
+    def keyword_search(self, query, limit=10):
+        """BM25-ranked plan ids matching any of the query's words, as [(id, score)]
+
+        Words found in more than half of the indexed plans are dropped (unless
+        every word is that common): they barely change the ranking but make
+        BM25 score almost the whole corpus.
+        """
+        words = list(dict.fromkeys(w for w in _SEARCH_TOKEN_RE.findall(query.lower()) if w not in _SEARCH_STOPWORDS))
+        if not words:
+            return []
+        total = len(self._ids) if self._ids is not None else 0
+        if total:
+            frequency = dict(self.archive.db.execute(
+                f"SELECT term, doc FROM plan_fts_vocab WHERE term IN ({', '.join('?' * len(words))})", words
+            ).fetchall())
+            words = [w for w in words if frequency.get(w, 0) <= total / 2] or words
+        match = " OR ".join(f'"{w}"' for w in words)
+        rows = self.archive.db.execute(
+            "SELECT rowid, bm25(plan_fts, 2.0, 1.0, 0.3) FROM plan_fts WHERE plan_fts MATCH ? ORDER BY 2 LIMIT ?",
+            (match, limit)
+        )
+        # bm25() is negative, smaller is better
+        return [(plan_id, -score) for plan_id, score in rows]
+    
+    def vector_search(self, query, limit=10):
+        """Plan ids most similar to the query text by IDF-weighted cosine, as [(id, score)]"""
+        import numpy as np
+        if self._ids is None:
+            self._load()
+        if not len(self._ids):
+            return []
+        idf = np.log((1 + len(self._ids)) / (1 + self._df)).astype(np.float32) + 1
+        scores = self._vectors @ self.vectorize(query, idf)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+    
+    def search(self, query, limit=10, mode="hybrid"):
+        """Search plans by keyword, vector similarity or both (reciprocal rank fusion)
+
+        Returns archive records (without plan text) with a "score" added,
+        best first.
+        """
+        self.update()
+        if mode == "keyword":
+            ranked = self.keyword_search(query, limit)
+        elif mode == "vector":
+            ranked = self.vector_search(query, limit)
+        else:
+            fused = {}
+            for results in (self.keyword_search(query, limit * 3), self.vector_search(query, limit * 3)):
+                for rank, (plan_id, _) in enumerate(results):
+                    fused[plan_id] = fused.get(plan_id, 0.0) + 1.0 / (60 + rank)
+            ranked = sorted(fused.items(), key=lambda item: -item[1])[:limit]
+        
+        records = []
+        for plan_id, score in ranked:
+            record = next(self.archive._select("WHERE id = ?", (plan_id,), with_content=False), None)
+            if record is not None:
+                records.append({**record, "score": round(score, 4)})
+        return records
+    
+    def similar_plans(self, student_profile, limit=5, mode="vector"):
+        """Past plans for students like this one (e.g. as few-shot examples or cache candidates)"""
+        return self.search(profile_search_text(student_profile), limit, mode)
+
+class SemanticPlanCache:
+    """Similarity cache of generated plans keyed by normalised profile
+
+    Profiles are normalised (normalize_profile), hashed into vectors and
+    compared by cosine similarity against earlier plans generated with the
+    same model and temperature. A match must also agree exactly on
+    exact_fields (grade level, subjects, upcoming exams and special
+    considerations by default). Only the newest
+    max_entries plans are matched; new entries are appended to a JSONL file
+    (and a row to the vector matrix) and the file is compacted back to
+    max_entries once it holds twice that many. File writes run on a
+    background thread so callers on the event loop never block on disk.
+    The counters record hits, misses and the prompt/output tokens and
+    generation time the hits avoided.
+    """
+    
+    def __init__(self, path, threshold=0.95, dim=512, max_entries=1000,
+                 exact_fields=("grade_level", "subjects", "upcoming_exams", "special_considerations")):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.dim = dim
+        self.max_entries = max(1, max_entries)
+        self.exact_fields = tuple(exact_fields)
+        self.entries = []
+        self._matrix = None
+        self._writer = None
+        self.counters = {
+            "lookups": 0, "template_hits": 0, "edit_hits": 0, "misses": 0,
+            "saved_prompt_tokens": 0, "saved_output_tokens": 0, "saved_seconds": 0.0
+        }
+        self._load()
+    
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    self.entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        self.entries = self.entries[-self.max_entries:]
+    
+    def _vectors(self):
+        """Vectors of the newest max_entries entries (a view into a matrix with room to grow)"""
+        import numpy as np
+        if self._matrix is None:
+            self._matrix = np.zeros((max(2 * self.max_entries, len(self.entries)), self.dim), dtype=np.float32)
+            for i, entry in enumerate(self.entries):
+                self._matrix[i] = hash_vector(self._vector_text(entry["normalized"]), self.dim)
+        return self._matrix[self._window_start():len(self.entries)]
+    
+    def _window_start(self):
+        return max(0, len(self.entries) - self.max_entries)
+    
+    @staticmethod
+    def _vector_text(normalized):
+        return "\n".join(f"{field}: {value}" for field, value in normalized.items())
+    
+    def match(self, student_profile, model, temperature):
+        """Return (entry, similarity, differing_fields) for the closest usable entry, or None"""
+        self.counters["lookups"] += 1
+        if not self.entries:
+            self.counters["misses"] += 1
+            return None
+        normalized = normalize_profile(student_profile)
+        similarities = self._vectors() @ hash_vector(self._vector_text(normalized), self.dim)
+        offset = self._window_start()
+        
+        best = None
+        for i in similarities.argsort()[::-1]:
+            if similarities[i] < self.threshold:
+                break
+            entry = self.entries[offset + i]
+            if entry["model"] != model or entry["temperature"] != float(temperature):
+                continue
+            if any(entry["normalized"].get(field) != normalized.get(field) for field in self.exact_fields):
+                continue
+            differing = {field for field, value in normalized.items() if entry["normalized"].get(field) != value}
+            best = (entry, float(similarities[i]), differing)
+            break
+        if best is None:
+            self.counters["misses"] += 1
+        return best
+    
+    def record_hit(self, entry, kind, saved_fraction=1.0, elapsed=0.0):
+        """Count a hit of kind "template" or "edit" and the work it saved"""
+        self.counters[f"{kind}_hits"] += 1
+        if kind == "template":
+            self.counters["saved_prompt_tokens"] += entry.get("prompt_tokens") or 0
+        self.counters["saved_output_tokens"] += int((entry.get("output_tokens") or 0) * saved_fraction)
+        self.counters["saved_seconds"] += max(0.0, (entry.get("generation_seconds") or 0.0) - elapsed)
+    
+    def add(self, student_profile, plan_text, model, temperature, prompt_tokens=None, generation_seconds=None):
+        """Remember a freshly generated plan"""
+        entry = {
+            "student_profile": {field: student_profile.get(field, "") for field in PROFILE_FIELDS},
+            "normalized": normalize_profile(student_profile),
+            "plan": plan_text,
+            "model": model,
+            "temperature": float(temperature),
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": count_tokens(plan_text, model),
+            "generation_seconds": generation_seconds,
+            "created_at": time.time()
+        }
+        self.entries.append(entry)
+        if self._matrix is not None:
+            if len(self.entries) > len(self._matrix):
+                import numpy as np
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._matrix[len(self.entries) - 1] = hash_vector(self._vector_text(entry["normalized"]), self.dim)
+        
+        if len(self.entries) >= 2 * self.max_entries:
+            # Compact: keep the newest max_entries in memory and on disk
+            drop = len(self.entries) - self.max_entries
+            self.entries = self.entries[drop:]
+            if self._matrix is not None:
+                self._matrix[:len(self.entries)] = self._matrix[drop:drop + len(self.entries)]
+            self._write("w", [json.dumps(e) + "\n" for e in self.entries])
+        else:
+            self._write("a", [json.dumps(entry) + "\n"])
+    
+    def _write(self, mode, lines):
+        """Queue a write of the serialised lines on the background writer thread"""
+        if self._writer is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+        self._writer.submit(self._write_lines, mode, lines)
+    
+    def _write_lines(self, mode, lines):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, mode) as f:
+                f.writelines(lines)
+        except OSError as e:
+            logger.error(f"Error writing semantic cache entry: {e}")
+    
+    def flush(self):
+        """Wait for queued file writes to finish"""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+    
+    def clear(self):
+        self.flush()
+        self.entries = []
+        self._matrix = None
+        self.path.unlink(missing_ok=True)
+    
+    def stats(self):
+        hits = self.counters["template_hits"] + self.counters["edit_hits"]
+        return {
+            **self.counters,
+            "saved_seconds": round(self.counters["saved_seconds"], 2),
+            "hit_rate": round(hits / self.counters["lookups"], 3) if self.counters["lookups"] else 0.0,
+            "entries": min(len(self.entries), self.max_entries)
+        }
+
+class LLMClientRegistry:
+    """Long-lived ChatOpenAI clients that share one pooled HTTP session
+
+    Clients are cached per (model, temperature, base_url) (and API key, so
+    different credentials never share a client object). Every client uses
+    the same httpx connection pool with keep-alive, and HTTP/2 when the `h2`
+    package is installed, so only the first request to a host pays for TCP
+    and TLS setup. The async pool is kept per event loop because pooled
+    connections cannot outlive the loop that opened them.
+    """
+    
+    def __init__(self, max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 http2=True, timeout=120.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.info("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1 keep-alive")
+        self.timeout = timeout
+        self._clients = {}
+        self._http_client = None
+        self._http_async_client = None
+        self._async_transport = None
+        self.created = 0
+        self.reused = 0
+        self.requests = 0
+    
+    def _transport_options(self):
+        import httpx
+        return {
+            "http2": self.http2,
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            )
+        }
+    
+    def _count_request(self, request):
+        self.requests += 1
+    
+    async def _acount_request(self, request):
+        self.requests += 1
+    
+    def _shared_http_clients(self):
+        """Create the shared sync and async httpx clients on first use"""
+        if self._http_client is None:
+            import httpx
+            
+            class PerLoopAsyncTransport(httpx.AsyncBaseTransport):
+                """Delegate to one pooled transport per running event loop"""
+                
+                def __init__(self, **options):
+                    import weakref
+                    self.options = options
+                    self.transports = weakref.WeakKeyDictionary()
+                
+                async def handle_async_request(self, request):
+                    import asyncio
+                    loop = asyncio.get_running_loop()
+                    transport = self.transports.get(loop)
+                    if transport is None:
+                        transport = self.transports[loop] = httpx.AsyncHTTPTransport(**self.options)
+                    return await transport.handle_async_request(request)
+                
+                async def aclose(self):
+                    import asyncio
+                    transport = self.transports.pop(asyncio.get_running_loop(), None)
+                    if transport is not None:
+                        await transport.aclose()
+                    # Pools opened on other loops cannot be closed from this one
+                    self.transports.clear()
+            
+            self._http_client = httpx.Client(
+                transport=httpx.HTTPTransport(**self._transport_options()),
+                timeout=self.timeout,
+                event_hooks={"request": [self._count_request]}
+            )
+            self._async_transport = PerLoopAsyncTransport(**self._transport_options())
+            self._http_async_client = httpx.AsyncClient(
+                transport=self._async_transport,
+                timeout=self.timeout,
+                event_hooks={"request": [self._acount_request]}
+            )
+        return self._http_client, self._http_async_client
+    
+    def get(self, api_key, model, temperature, base_url, default_headers=None, max_retries=None):
+        """Return the cached client for these settings, creating it on first use
+
+        max_retries=None keeps the OpenAI SDK's built-in retries; callers that
+        schedule their own retries (the HTTP service) pass 0.
+        """
+        key = (model, float(temperature), base_url, hashlib.sha256(str(api_key).encode()).hexdigest(), max_retries)
+        client = self._clients.get(key)
+        if client is not None:
+            self.reused += 1
+            return client
+        
+        from langchain_openai import ChatOpenAI
+        http_client, http_async_client = self._shared_http_clients()
+        options = {} if max_retries is None else {"max_retries": max_retries}
+        client = ChatOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+            temperature=temperature,
+            default_headers=default_headers,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **options
+        )
+        self._clients[key] = client
+        self.created += 1
+        return client
+    
+    def stats(self):
+        """Pool statistics: cached clients, cache reuse and HTTP requests/connections"""
+        connections = 0
+        try:
+            if self._http_client is not None:
+                connections += len(self._http_client._transport._pool.connections)
+            if self._async_transport is not None:
+                connections += sum(len(t._pool.connections) for t in self._async_transport.transports.values())
+        except AttributeError:
+            # Pool internals are private to httpcore; report what we can
+            pass
+        return {
+            "clients": len(self._clients),
+            "clients_created": self.created,
+            "clients_reused": self.reused,
+            "http_requests": self.requests,
+            "open_connections": connections,
+            "max_connections": self.max_connections,
+            "http2": self.http2
+        }
+    
+    def close(self):
+        """Close the shared HTTP session and forget all clients"""
+        if self._http_client is not None:
+            self._http_client.close()
+        self._clients.clear()
+        self._http_client = self._http_async_client = self._async_transport = None
+    
+    async def aclose(self):
+        """Close the async pool of the running event loop as well, then the rest of the session"""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        self.close()
+
+# OpenRouter models offered by the CLI and considered by the router. Costs are
+# USD per million input/output tokens; expected_seconds is a prior for a full
+# plan until the router has observed real latencies; quality ranks plan depth.
+MODEL_CATALOG = [
+    {"name": "gpt-3.5-turbo", "provider": "OpenAI", "description": "Balanced performance and cost",
+     "quality": 2, "context": 16385, "input_cost": 0.5, "output_cost": 1.5, "expected_seconds": 20},
+    {"name": "gpt-4-turbo", "provider": "OpenAI", "description": "Advanced reasoning capabilities",
+     "quality": 5, "context": 128000, "input_cost": 10.0, "output_cost": 30.0, "expected_seconds": 60},
+    {"name": "claude-3-haiku", "provider": "Anthropic", "description": "Fast and efficient assistant",
+     "quality": 3, "context": 200000, "input_cost": 0.25, "output_cost": 1.25, "expected_seconds": 15},
+    {"name": "claude-3-sonnet", "provider": "Anthropic", "description": "Strong reasoning and helpfulness",
+     "quality": 4, "context": 200000, "input_cost": 3.0, "output_cost": 15.0, "expected_seconds": 40},
+    {"name": "gemini-pro", "provider": "Google", "description": "Strong at multilingual content",
+     "quality": 3, "context": 32760, "input_cost": 0.125, "output_cost": 0.375, "expected_seconds": 25},
+    {"name": "mistral-large", "provider": "Mistral AI", "description": "Excellent open model performance",
+     "quality": 4, "context": 32000, "input_cost": 8.0, "output_cost": 24.0, "expected_seconds": 45},
+    {"name": "llama-2-70b-chat", "provider": "Meta", "description": "Powerful open source model",
+     "quality": 2, "context": 4096, "input_cost": 0.7, "output_cost": 0.9, "expected_seconds": 35},
+    {"name": "mixtral-8x7b", "provider": "Mistral AI", "description": "Excellent for diverse tasks",
+     "quality": 3, "context": 32768, "input_cost": 0.24, "output_cost": 0.24, "expected_seconds": 20},
+    {"name": "phi-2", "provider": "Microsoft", "description": "Lightweight model with good performance",
+     "quality": 1, "context": 2048, "input_cost": 0.1, "output_cost": 0.1, "expected_seconds": 10}
+]
+
+# Upper bounds (seconds) of the router's latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 20, 30, 45, 60, 90, 120, float("inf"))
+
+class ModelRouter:
+    """Pick a model per request and fall back (or hedge) to faster models on failure
+
+    The router keeps a rolling window of (latency, ok) samples per model.
+    route() ranks the catalog for a prompt: models whose context cannot hold
+    the prompt plus the expected plan, whose cost exceeds max_cost, or whose
+    recent error rate is above max_error_rate are dropped; the highest-quality
+    model expected to meet the latency SLO goes first (cheapest on ties) and
+    the rest follow fastest-first as fallbacks. Routing depends only on the
+    recorded samples and the clock, so it is reproducible with a fake LLM and
+    a fixed clock.
+    """
+    
+    def __init__(self, catalog=None, latency_slo=60, max_cost=None, expected_output_tokens=3000,
+                 max_error_rate=0.5, min_samples=3, window=100, window_seconds=600,
+                 max_attempts=3, clock=time.monotonic):
+        self.catalog = {entry["name"]: entry for entry in (catalog or MODEL_CATALOG)}
+        self.latency_slo = latency_slo
+        self.max_cost = max_cost
+        self.expected_output_tokens = expected_output_tokens
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.window_seconds = window_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._samples = {}
+        self.counters = {"routed": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0}
+    
+    def record(self, model, latency, ok):
+        """Add one observed call to the model's rolling window"""
+        from collections import deque
+        self._samples.setdefault(model, deque(maxlen=self.window)).append((self.clock(), latency, ok))
+    
+    def _recent(self, model):
+        cutoff = self.clock() - self.window_seconds
+        return [(latency, ok) for at, latency, ok in self._samples.get(model, ()) if at >= cutoff]
+    
+    def error_rate(self, model):
+        samples = self._recent(model)
+        if len(samples) < self.min_samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+    
+    def expected_latency(self, model):
+        """Observed p95 latency of successful calls, or the catalog prior"""
+        latencies = [latency for latency, ok in self._recent(model) if ok]
+        if len(latencies) >= self.min_samples:
+            return _percentile(latencies, 95)
+        return self.catalog.get(model, {}).get("expected_seconds", 60)
+    
+    def estimate_cost(self, model, prompt_tokens):
+        entry = self.catalog[model]
+        return (prompt_tokens * entry["input_cost"] + self.expected_output_tokens * entry["output_cost"]) / 1e6
+    
+    def route(self, prompt_tokens, latency_slo=None, max_cost=None):
+        """Return the models to try for a prompt, best first, at most max_attempts long"""
+        latency_slo = latency_slo or self.latency_slo
+        max_cost = max_cost if max_cost is not None else self.max_cost
+        
+        usable = []
+        for name, entry in self.catalog.items():
+            if prompt_tokens + self.expected_output_tokens > entry["context"]:
+                continue
+            if max_cost is not None and self.estimate_cost(name, prompt_tokens) > max_cost:
+                continue
+            if self.error_rate(name) > self.max_error_rate:
+                continue
+            usable.append(name)
+        if not usable:
+            # Nothing fits every constraint; fall back to whatever can hold the prompt
+            usable = [name for name, entry in self.catalog.items()
+                      if prompt_tokens + self.expected_output_tokens <= entry["context"]] or list(self.catalog)
+        
+        by_speed = sorted(usable, key=lambda name: (self.expected_latency(name), self.estimate_cost(name, prompt_tokens)))
+        within_slo = [name for name in usable if self.expected_latency(name) <= latency_slo]
+        if within_slo:
+            primary = min(within_slo, key=lambda name: (-self.catalog[name]["quality"], self.estimate_cost(name, prompt_tokens)))
+        else:
+            primary = by_speed[0]
+        candidates = [primary] + [name for name in by_speed if name != primary]
+        return candidates[:self.max_attempts]
+    
+    async def _timed_call(self, call, model, timeout):
+        import asyncio
+        start = self.clock()
+        with tracer.span("llm.attempt", model=model):
+            try:
+                result = await asyncio.wait_for(call(model), timeout)
+            except Exception:
+                self.record(model, self.clock() - start, False)
+                tracer.count("llm_attempts", 1, "Routed LLM attempts by model and result", model=model, result="error")
+                raise
+        self.record(model, self.clock() - start, True)
+        tracer.count("llm_attempts", 1, "Routed LLM attempts by model and result", model=model, result="ok")
+        return result
+    
+    async def run(self, call, candidates, timeout=None, hedge_after=None):
+        """Await call(model) on the candidates in order until one succeeds
+
+        Each attempt is cut off after timeout seconds. With hedge_after set, a
+        second request to the next candidate starts if the current one has not
+        answered within that many seconds, and the first success wins (the
+        other request is cancelled). Returns (model, result).
+        """
+        import asyncio
+        self.counters["routed"] += 1
+        remaining = list(candidates)
+        errors = []
+        while remaining:
+            model = remaining.pop(0)
+            if errors:
+                self.counters["fallbacks"] += 1
+                tracer.count("router_fallbacks", 1, "Requests handed to a fallback model")
+                logger.warning(f"Falling back to {model}")
+            tasks = {asyncio.ensure_future(self._timed_call(call, model, timeout)): model}
+            hedged = False
+            while tasks:
+                wait = hedge_after if hedge_after and not hedged and remaining else None
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    hedge = remaining.pop(0)
+                    self.counters["hedges"] += 1
+                    tracer.count("router_hedges", 1, "Hedged second requests")
+                    logger.info(f"{model} has not answered after {hedge_after}s; hedging with {hedge}")
+                    tasks[asyncio.ensure_future(self._timed_call(call, hedge, timeout))] = hedge
+                    continue
+                for task in done:
+                    task_model = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        for other in tasks:
+                            other.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                        if task_model != model:
+                            self.counters["hedge_wins"] += 1
+                        return task_model, task.result()
+                    error = error if str(error) else type(error).__name__
+                    logger.warning(f"Model {task_model} failed: {error}")
+                    errors.append(f"{task_model}: {error}")
+        raise RuntimeError(f"All routed models failed ({'; '.join(errors)})")
+    
+    def stats(self):
+        """Per-model rolling sample counts, error rate, latency percentiles and histogram"""
+        models = {}
+        for name in self._samples:
+            samples = self._recent(name)
+            if not samples:
+                continue
+            latencies = [latency for latency, _ in samples]
+            histogram = {}
+            for latency in latencies:
+                bucket = next(bound for bound in LATENCY_BUCKETS if latency <= bound)
+                label = f"le_{bucket:g}" if bucket != float("inf") else "le_inf"
+                histogram[label] = histogram.get(label, 0) + 1
+            models[name] = {
+                "calls": len(samples),
+                "error_rate": round(sum(1 for _, ok in samples if not ok) / len(samples), 3),
+                "p50_seconds": round(_percentile(latencies, 50), 3),
+                "p95_seconds": round(_percentile(latencies, 95), 3),
+                "histogram": histogram
+            }
+        return {**self.counters, "models": models}
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+async def _read_http_request(reader):
+    """Read one HTTP/1.1 request; returns (method, path, headers, body), or None if the client sent nothing"""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length") or 0))
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+async def _write_http_response(writer, status, body=b"", content_type="application/json", headers=None):
+    """Write a complete HTTP/1.1 response and close the connection afterwards"""
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+    head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Error')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Connection: close"]
+    head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+class TokenBucket:
+    """Async token bucket allowing `rate` requests per second with bursts up to `capacity`
+
+    pause() stops all acquirers until a deadline, used to honour provider
+    Retry-After responses across every worker sharing the bucket.
+    """
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+    
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        import asyncio
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def _retry_after_seconds(error):
+    """Return the Retry-After delay carried by a provider error, if any"""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(parsedate_to_datetime(value).tzinfo)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+def _is_retryable(error):
+    """Rate limits, provider 5xx errors, timeouts and connection failures are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectError", "ReadTimeout")
+
+class PlanService:
+    """Async HTTP front end for StudyPlanGenerator
+
+    POST /jobs queues a profile and returns a job id; GET /jobs/<id> polls it
+    and GET /jobs/<id>/stream follows the plan as server-sent events. Jobs wait
+    in a bounded queue (full queue -> 503 with Retry-After) and are run by a
+    worker pool under per-model concurrency limits and per-model token
+    buckets; "auto" jobs take those limits for each model the router tries.
+    Provider 429s and transient errors are retried with jittered
+    exponential backoff that honours Retry-After. Finished jobs are kept for
+    job_ttl seconds and at most max_jobs are remembered. GET /metrics reports
+    queue depth, job counts and latency percentiles.
+    """
+    
+    TERMINAL = ("done", "failed")
+    
+    def __init__(self, generator, api_key, queue_size=100, workers=8, model_concurrency=4,
+                 requests_per_minute=60, max_retries=5, backoff_base=1.0, backoff_cap=60.0,
+                 job_ttl=3600, max_jobs=10000):
+        self.generator = generator
+        self.api_key = api_key
+        self.queue_size = queue_size
+        self.worker_count = workers
+        self.model_concurrency = model_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.queue = None
+        self._semaphores = {}
+        self._buckets = {}
+        self._latencies = []
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "retries": 0, "rate_limited": 0, "expired": 0}
+    
+    def _semaphore(self, model):
+        import asyncio
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.model_concurrency)
+        return self._semaphores[model]
+    
+    def _bucket(self, model):
+        if model not in self._buckets:
+            self._buckets[model] = TokenBucket(self.requests_per_minute / 60.0)
+        return self._buckets[model]
+    
+    def _model_slot(self, model):
+        """Async context manager holding one of the model's concurrency slots and a rate token"""
+        import contextlib
+        
+        @contextlib.asynccontextmanager
+        async def slot():
+            async with self._semaphore(model):
+                await self._bucket(model).acquire()
+                try:
+                    yield
+                except Exception as e:
+                    if getattr(e, "status_code", None) == 429:
+                        self._rate_limited(model, _retry_after_seconds(e) or self.backoff_base)
+                    raise
+        return slot()
+    
+    def _rate_limited(self, model, delay):
+        """Count a provider 429 and hold the model's bucket for delay seconds"""
+        self.counters["rate_limited"] += 1
+        tracer.count("rate_limited", 1, "Provider 429 responses", model=model)
+        self._bucket(model).pause(delay)
+    
+    def expire_jobs(self):
+        """Forget finished jobs older than job_ttl, then the oldest finished ones beyond max_jobs"""
+        cutoff = time.time() - self.job_ttl
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in self.TERMINAL]
+        excess = len(self.jobs) + 1 - self.max_jobs  # leave room for the job being submitted
+        for job_id in finished:
+            if self.jobs[job_id]["finished_at"] < cutoff or excess > 0:
+                del self.jobs[job_id]
+                excess -= 1
+                self.counters["expired"] += 1
+    
+    def submit(self, payload):
+        """Validate and enqueue a job; returns the job record or raises ValueError / asyncio.QueueFull"""
+        import asyncio
+        import uuid
+        if not isinstance(payload, dict):
+            raise ValueError("request body must be a JSON object")
+        profile = payload.get("profile", payload)
+        if not isinstance(profile, dict) or not profile.get("student_name"):
+            raise ValueError("request must contain a profile with a student_name")
+        model = payload.get("model") or self.generator.config.get("default_model", "gpt-4-turbo")
+        if model != "auto" and model not in self.generator.router.catalog:
+            # Per-model limits are created on demand, so only catalog models may create them
+            raise ValueError(f"unknown model {model!r}; use 'auto' or one of {sorted(self.generator.router.catalog)}")
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "student_name": profile["student_name"],
+            "profile": {field: str(profile.get(field) or "") for field in PROFILE_FIELDS},
+            "model": model,
+            "temperature": float(payload.get("temperature", self.generator.config.get("temperature", 0.7))),
+            "submitted_at": time.time(),
+            "attempts": 0,
+            "chunks": [],
+            "error": None,
+            "updated": asyncio.Event()
+        }
+        self.expire_jobs()
+        self.queue.put_nowait(job)
+        self.jobs[job["id"]] = job
+        self.counters["submitted"] += 1
+        return job
+    
+    def _notify(self, job):
+        job["updated"].set()
+        job["updated"].clear()
+    
+    def job_view(self, job, include_plan=True):
+        """Public JSON view of a job"""
+        view = {key: job.get(key) for key in ("id", "status", "student_name", "model", "routed_model", "attempts", "error")}
+        view["queue_seconds"] = round(job.get("started_at", time.time()) - job["submitted_at"], 3)
+        if "finished_at" in job:
+            view["latency_seconds"] = round(job["finished_at"] - job["submitted_at"], 3)
+        if include_plan and job["status"] == "done":
+            view["study_plan"] = "".join(job["chunks"])
+        return view
+    
+    def metrics(self):
+        """Queue depth, job counts by status and end-to-end latency percentiles"""
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        recent = self._latencies[-1000:]
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_capacity": self.queue_size,
+            "workers": self.worker_count,
+            "jobs": statuses,
+            "counters": dict(self.counters),
+            "latency_p50_seconds": round(_percentile(recent, 50), 3),
+            "latency_p95_seconds": round(_percentile(recent, 95), 3),
+            "in_flight_by_model": {
+                model: self.model_concurrency - semaphore._value for model, semaphore in self._semaphores.items()
+            },
+            "router": self.generator.router.stats()
+        }
+    
+    def prometheus_metrics(self):
+        """Tracer metrics plus the service's queue gauges, in the Prometheus text format"""
+        gauges = {
+            "study_plan_service_queue_depth": self.queue.qsize() if self.queue else 0,
+            "study_plan_service_queue_capacity": self.queue_size,
+            "study_plan_service_workers": self.worker_count,
+        }
+        for name, value in self.counters.items():
+            gauges[f"study_plan_service_jobs_{name}"] = value
+        return tracer.metrics.render(gauges)
+    
+    async def _generate(self, job):
+        """Run one generation attempt, streaming chunks into the job record"""
+        generator = self.generator
+        profile, model, temperature = job["profile"], job["model"], job["temperature"]
+        if model == "auto":
+            # Routed jobs fall back between models inside one attempt, so they are not streamed;
+            # each model tried is held to its own concurrency limit and token bucket
+            result = await generator._agenerate_routed(self.api_key, profile, temperature, limiter=self._model_slot)
+            job["chunks"] = [extract_plan_text(result)]
+            job["routed_model"] = result.get("model")
+            return
+        if generator.engine == "sectioned":
+            cache_key, cached_plan = generator._cache_lookup(profile, model, temperature, variant=generator._sectioned_cache_variant())
+        else:
+            prompt, fitted_profile = generator._prepare_prompt(profile, model)
+            cache_key, cached_plan = generator._cache_lookup(profile, model, temperature, prompt=prompt)
+        if cached_plan is not None:
+            job["chunks"] = [cached_plan["text"]]
+            return
+        if generator.engine == "sectioned":
+            result = await generator.agenerate_study_plan(self.api_key, model, profile, temperature)
+            job["chunks"] = [extract_plan_text(result)]
+            return
+        
+        llm = generator._setup_llm(self.api_key, model, temperature, max_retries=0)
+        if job["chunks"]:
+            # Start a retry from scratch; streams notice the new list and reset
+            job["chunks"] = []
+        start = time.perf_counter()
+        with tracer.span("llm.stream", model=model):
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    if not job["chunks"]:
+                        tracer.observe("ttft_seconds", time.perf_counter() - start, "Time to first streamed token", model=model)
+                    job["chunks"].append(chunk.content)
+                    self._notify(job)
+        if "weekly_schedule" in fitted_profile:
+            # Splice in the locally computed schedule; streams see a reset and resend the full plan
+            job["chunks"] = [insert_weekly_schedule("".join(job["chunks"]), fitted_profile["weekly_schedule"])]
+            self._notify(job)
+        generator._cache_store(cache_key, {"text": "".join(job["chunks"])}, model, temperature)
+    
+    async def _process(self, job):
+        with tracer.span("service.job", job=job["id"], student=job["student_name"], model=job["model"]) as span:
+            await self._process_job(job)
+            span.set(status=job["status"], attempts=job["attempts"])
+    
+    async def _process_job(self, job):
+        import asyncio
+        import random
+        import contextlib
+        model = job["model"]
+        while True:
+            # Each attempt holds a model slot; it is released while backing off so other jobs can run.
+            # Routed jobs take per-model limits around each attempt instead (see _model_slot)
+            async with self._semaphore(model) if model != "auto" else contextlib.nullcontext():
+                if job["attempts"] == 0:
+                    job["status"] = "running"
+                    job["started_at"] = time.time()
+                    self._notify(job)
+                if model != "auto":
+                    await self._bucket(model).acquire()
+                job["attempts"] += 1
+                try:
+                    await self._generate(job)
+                    job["status"] = "done"
+                    break
+                except Exception as e:
+                    if not _is_retryable(e) or job["attempts"] > self.max_retries:
+                        logger.error(f"Service job {job['id']} ({job['student_name']}) failed: {e}")
+                        job["status"], job["error"] = "failed", str(e)
+                        break
+                    # Full-jitter exponential backoff, never shorter than the provider's Retry-After
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (job["attempts"] - 1)))
+                    retry_after = _retry_after_seconds(e)
+                    if getattr(e, "status_code", None) == 429 and model != "auto":
+                        delay = max(delay, retry_after or self.backoff_base)
+                        self._rate_limited(model, delay)
+                    elif retry_after:
+                        delay = max(delay, retry_after)
+                    self.counters["retries"] += 1
+                    tracer.count("llm_retries", 1, "Retried LLM attempts", model=model)
+                    logger.warning(f"Service job {job['id']} attempt {job['attempts']} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        
+        job["finished_at"] = time.time()
+        self.counters[job["status"]] += 1
+        if job["status"] == "done":
+            self._latencies.append(job["finished_at"] - job["submitted_at"])
+            if len(self._latencies) > 10000:
+                del self._latencies[:5000]
+        self._notify(job)
+    
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Service worker error on job {job['id']}: {e}")
+            finally:
+                self.queue.task_done()
+    
+    async def _stream_job(self, writer, job):
+        """Send the job's plan as server-sent events while it is generated"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        chunks, sent = job["chunks"], 0
+        while True:
+            if job["chunks"] is not chunks:
+                # A retry restarted generation with a fresh chunk list
+                writer.write(b"event: reset\ndata: {}\n\n")
+                chunks, sent = job["chunks"], 0
+            for chunk in chunks[sent:]:
+                writer.write(f"data: {json.dumps({'text': chunk})}\n\n".encode("utf-8"))
+            sent = len(chunks)
+            await writer.drain()
+            if job["chunks"] is not chunks or sent < len(chunks):
+                continue
+            if job["status"] in self.TERMINAL:
+                writer.write(f"event: {job['status']}\ndata: {json.dumps(self.job_view(job, include_plan=False))}\n\n".encode("utf-8"))
+                await writer.drain()
+                return
+            # No await between the checks above and this wait, so no update can be missed
+            await job["updated"].wait()
+    
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        try:
+            request = await _read_http_request(reader)
+            if request is None:
+                return
+            method, path, _, body = request
+            parts = [part for part in path.split("/") if part]
+            
+            if parts == ["jobs"] and method == "POST":
+                try:
+                    job = self.submit(json.loads(body or b"{}"))
+                except (ValueError, TypeError) as e:
+                    await _write_http_response(writer, 400, {"error": str(e)})
+                except asyncio.QueueFull:
+                    self.counters["rejected"] += 1
+                    await _write_http_response(writer, 503, {"error": "queue full"}, headers={"Retry-After": "5"})
+                else:
+                    await _write_http_response(writer, 202, {"id": job["id"], "status": job["status"]},
+                                               headers={"Location": f"/jobs/{job['id']}"})
+            elif len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+                job = self.jobs.get(parts[1])
+                if job is None:
+                    await _write_http_response(writer, 404, {"error": "unknown job"})
+                elif len(parts) == 3 and parts[2] == "stream":
+                    await self._stream_job(writer, job)
+                else:
+                    await _write_http_response(writer, 200, self.job_view(job))
+            elif parts == ["metrics"] and method == "GET":
+                await _write_http_response(writer, 200, self.metrics())
+            elif parts == ["metrics", "prometheus"] and method == "GET":
+                await _write_http_response(writer, 200, self.prometheus_metrics().encode("utf-8"),
+                                           content_type="text/plain; version=0.0.4")
+            elif parts == ["healthz"]:
+                await _write_http_response(writer, 200, {"status": "ok"})
+            else:
+                await _write_http_response(writer, 404, {"error": "not found"})
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            try:
+                await _write_http_response(writer, 400, {"error": f"malformed request: {e}"})
+            except ConnectionError:
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self, host="127.0.0.1", port=8000):
+        """Start the workers and serve HTTP until cancelled"""
+        import asyncio
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Plan service listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await self.generator.clients.aclose()
+
+class StubOpenAIServer:
+    """Minimal OpenAI-compatible chat completions server for local testing
+
+    Answers POST /v1/chat/completions (plain and streamed) with a canned plan
+    containing every PLAN_SECTIONS heading after `latency` seconds. Every
+    `rate_limit_every`-th request is rejected with 429 and Retry-After so
+    retry and backoff behaviour can be exercised without OpenRouter.
+    """
+    
+    def __init__(self, latency=0.5, chunk_size=64, rate_limit_every=0, retry_after=1):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = 0
+    
+    def _plan(self, model):
+        return "\n\n".join(
+            f"## {number}. {title}\nStub content for {title.lower()} generated by {model}."
+            for number, title in enumerate(PLAN_SECTION_TITLES, start=1)
+        ) + "\n"
+    
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        try:
+            request = await _read_http_request(reader)
+            if request is None:
+                return
+            method, path, _, body = request
+            if method != "POST" or not path.endswith("/chat/completions"):
+                await _write_http_response(writer, 404, {"error": {"message": "not found"}})
+                return
+            
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                await _write_http_response(writer, 429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                           headers={"Retry-After": str(self.retry_after)})
+                return
+            
+            request = json.loads(body or b"{}")
+            model = request.get("model", "stub")
+            text = self._plan(model)
+            await asyncio.sleep(self.latency)
+            
+            if not request.get("stream"):
+                await _write_http_response(writer, 200, {
+                    "id": f"stub-{self.requests}", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                })
+                return
+            
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+            for start in range(0, len(text), self.chunk_size):
+                chunk = {"id": f"stub-{self.requests}", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": text[start:start + self.chunk_size]},
+                                                      "finish_reason": None}]}
+                writer.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                await writer.drain()
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self, host="127.0.0.1", port=8001):
+        import asyncio
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Stub OpenAI server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def fake_study_plan(student_name, subjects, narrate_schedule=False):
+    """A deterministic plan with every section and a parseable weekly schedule, for benchmarks
+
+    narrate_schedule answers like a prompt with a precomputed schedule: a
+    short rationale instead of the hour-by-hour schedule.
+    """
+    subjects = split_subjects(subjects) or ["Mathematics", "English"]
+    first_name = student_name.split()[0] if student_name else "The student"
+    times = ["6:30-7:15 PM", "7:30-8:15 PM", "8:30-9:00 PM"]
+    schedule = []
+    for day_index, day in enumerate(DAYS):
+        schedule.append(f"### {day}")
+        for slot, period in enumerate(times):
+            subject = subjects[(day_index + slot) % len(subjects)]
+            schedule.append(f"- {period}: {subject} practice problems and review")
+    bodies = {
+        "Executive Summary": f"{first_name} will follow a balanced weekly routine built around {', '.join(subjects)}.",
+        "Weekly Master Schedule": (
+            "- The hardest subjects sit in the peak-energy blocks\n- Subjects with exams soon get extra sessions\n"
+            "- Short breaks separate every study block" if narrate_schedule else "\n".join(schedule)
+        ),
+        "Subject-Specific Action Plans": "\n\n".join(
+            f"### {subject}\n- Spaced practice three times a week\n- Weekly self-test with worked solutions"
+            for subject in subjects
+        )
+    }
+    for title in PLAN_SECTION_TITLES:
+        bodies.setdefault(title, f"- Guidance on {title.lower()} tailored to {first_name}\n- Review progress every Sunday")
+    text = f"# PERSONALIZED STUDY PLAN FOR {student_name.upper()}\n\n" + "\n\n".join(
+        f"## {number}. {title}\n\n{bodies[title]}" for number, title in enumerate(PLAN_SECTION_TITLES, start=1)
+    ) + "\n"
+    return text, bodies
+
+_FAKE_CHAT_MODEL_CLASS = None
+
+def make_fake_chat_model(ttft=0.05, tokens_per_second=2000.0, jitter=0.0, model_name="fake"):
+    """Build a LangChain chat model that answers like an LLM without any network calls
+
+    Replies are fake_study_plan() for the student named in the prompt (or
+    just the requested section for section prompts), delivered after `ttft`
+    seconds and then at `tokens_per_second` (a token is ~4 characters). jitter
+    scales latency by up to +/- that fraction, derived from a hash of the
+    prompt so the same prompt always takes the same time.
+    """
+    global _FAKE_CHAT_MODEL_CLASS
+    if _FAKE_CHAT_MODEL_CLASS is None:
+        import asyncio
+        import zlib
+        from langchain_core.language_models.chat_models import BaseChatModel
+        from langchain_core.messages import AIMessage, AIMessageChunk
+        from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+        
+        class FakeChatModel(BaseChatModel):
+            ttft: float = 0.05
+            tokens_per_second: float = 2000.0
+            jitter: float = 0.0
+            model_name: str = "fake"
+            
+            @property
+            def _llm_type(self):
+                return "fake-study-plan"
+            
+            def _reply(self, messages):
+                prompt = "\n".join(str(message.content) for message in messages)
+                name = re.search(r"- Name: (.+)|plan for (.+?)\.\n", prompt)
+                name = (name.group(1) or name.group(2)).strip() if name else "Student"
+                subjects = re.search(r"- Subjects: (.+)", prompt)
+                narrate = "will be inserted after your text automatically" in prompt
+                text, bodies = fake_study_plan(name, subjects.group(1) if subjects else "", narrate)
+                section = re.search(r"# SECTION TO WRITE\n## \d+\. ([^\n]+)", prompt)
+                if section:
+                    text = bodies.get(section.group(1).strip(), "")
+                scale = 1 + self.jitter * (zlib.crc32(prompt.encode("utf-8")) / 0xFFFFFFFF * 2 - 1)
+                return text, self.ttft * scale, scale / self.tokens_per_second
+            
+            @staticmethod
+            def _chunks(text):
+                # ~20 ms of tokens per chunk keeps the number of sleeps small
+                return [text[i:i + 160] for i in range(0, len(text), 160)]
+            
+            def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+                text, first, per_token = self._reply(messages)
+                time.sleep(first + len(text) / 4 * per_token)
+                return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+            
+            async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+                text, first, per_token = self._reply(messages)
+                await asyncio.sleep(first + len(text) / 4 * per_token)
+                return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+            
+            def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+                text, first, per_token = self._reply(messages)
+                time.sleep(first)
+                for chunk in self._chunks(text):
+                    time.sleep(len(chunk) / 4 * per_token)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+            
+            async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+                text, first, per_token = self._reply(messages)
+                await asyncio.sleep(first)
+                for chunk in self._chunks(text):
+                    await asyncio.sleep(len(chunk) / 4 * per_token)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        
+        _FAKE_CHAT_MODEL_CLASS = FakeChatModel
+    return _FAKE_CHAT_MODEL_CLASS(ttft=ttft, tokens_per_second=tokens_per_second, jitter=jitter, model_name=model_name)
+
+def synthetic_profiles(count, seed=0):
+    """Varied but reproducible student profiles derived from the sample profile"""
+    import random
+    rng = random.Random(seed)
+    first_names = ["Alex", "Maria", "Sam", "Priya", "Jordan", "Wei", "Fatima", "Liam", "Aisha", "Noah"]
+    last_names = ["Johnson", "Garcia", "Lee", "Patel", "Smith", "Chen", "Khan", "Brown", "Okafor", "Silva"]
+    subjects = ["AP Calculus AB", "Honors Physics", "AP English Literature", "Modern World History",
+                "AP Computer Science A", "Chemistry", "Biology", "Spanish III", "Statistics"]
+    styles = ["Visual learner who relies on diagrams", "Auditory learner who prefers discussion",
+              "Kinesthetic learner who needs hands-on practice", "Reading/writing learner who takes detailed notes"]
+    challenges = ["test anxiety", "procrastination", "time management", "difficulty memorizing formulas",
+                  "losing focus during long readings", "careless errors under time pressure"]
+    profiles = []
+    for i in range(count):
+        profile = create_sample_student_profile()
+        profile.update(
+            student_name=f"{rng.choice(first_names)} {rng.choice(last_names)} {i}",
+            grade_level=f"{rng.randint(9, 12)}th Grade",
+            subjects=", ".join(rng.sample(subjects, rng.randint(3, 5))),
+            learning_style=rng.choice(styles),
+            challenges=", ".join(rng.sample(challenges, 2))
+        )
+        profiles.append(profile)
+    return profiles
+
 class StudyPlanGenerator:
     def __init__(self):
-        self.config = self._load_config()
-        self.console = Console()
+        with tracer.span("config.load"):
+            self.config = self._load_config()
+        if self.config.get("trace_file") or self.config.get("metrics_file"):
+            tracer.enable(self.config.get("trace_file"))
+        self.console = console
         # Force OpenRouter configuration for this simplified version
-        self.config["default_model"] = "gpt-4-turbo"
+        self.config.setdefault("default_model", "gpt-4-turbo")
         self.config["openrouter_api_base"] = "https://openrouter.ai/api/v1"
+        self.cache = self._setup_cache()
+        self.semantic_cache = self._setup_semantic_cache()
+        self.semantic_cache_mode = self.config.get("semantic_cache_mode", "edit")
+        self.refresh_cache = False
+        self.engine = self.config.get("engine", "monolithic")
+        self.prompt_template = self.config.get("prompt_template", "full")
+        self.token_budget = self.config.get("prompt_token_budget")
+        self.schedule_optimizer = self.config.get("schedule_optimizer", True)
+        self.max_concurrent_requests = self.config.get("max_concurrent_requests", 16)
+        self._request_limit = (None, None)
+        self._renderer = None
+        self.clients = LLMClientRegistry(
+            max_connections=self.config.get("http_pool_size", 20),
+            max_keepalive_connections=self.config.get("http_keepalive_connections", 10),
+            http2=self.config.get("http2", True),
+            timeout=self.config.get("http_timeout", 120)
+        )
+        self._chains = {}
+        self.router = ModelRouter(
+            latency_slo=self.config.get("router_latency_slo", 60),
+            max_cost=self.config.get("router_max_cost"),
+            expected_output_tokens=self.config.get("router_expected_output_tokens", 3000),
+            max_attempts=self.config.get("router_max_attempts", 3)
+        )
+        self.route_timeout = self.config.get("router_timeout", 120)
+        self.hedge_after = self.config.get("router_hedge_after")
+        self.plan_storage = self.config.get("plan_storage", "archive")
+        self._archive = None
+        self._index = None
+        # When set, _setup_llm returns llm_factory(model, temperature) instead of an OpenRouter client
+        self.llm_factory = None
     
     def _load_config(self):
         """Load configuration from config file if exists, otherwise use defaults"""
+        import yaml
         config_path = Path("config.yaml")
         default_config = {
             "default_model": "gpt-4-turbo",
             "temperature": 0.7,
             "output_dir": "study_plans",
-            "openrouter_api_base": "https://openrouter.ai/api/v1"
+            "plan_storage": "archive",
+            "archive_path": "study_plans/plans.db",
+            "search_vector_dim": 512,
+            "openrouter_api_base": "https://openrouter.ai/api/v1",
+            "batch_concurrency": 8,
+            "batch_journal_dir": None,
+            "max_concurrent_requests": 16,
+            "engine": "monolithic",
+            "prompt_template": "full",
+            "prompt_token_budget": None,
+            "schedule_optimizer": True,
+            "schedule_block_minutes": 45,
+            "schedule_break_minutes": 15,
+            "http_pool_size": 20,
+            "http_keepalive_connections": 10,
+            "http2": True,
+            "http_timeout": 120,
+            "service_queue_size": 100,
+            "service_workers": 8,
+            "service_model_concurrency": 4,
+            "service_requests_per_minute": 60,
+            "service_max_retries": 5,
+            "service_job_ttl": 3600,
+            "service_max_jobs": 10000,
+            "router_latency_slo": 60,
+            "router_max_cost": None,
+            "router_expected_output_tokens": 3000,
+            "router_max_attempts": 3,
+            "router_timeout": 120,
+            "router_hedge_after": None,
+            "cache_enabled": True,
+            "cache_dir": ".plan_cache",
+            "cache_max_entries": 1000,
+            "cache_max_mb": 200,
+            "cache_max_age_days": 30,
+            "semantic_cache_enabled": True,
+            "semantic_cache_threshold": 0.95,
+            "semantic_cache_mode": "edit",
+            "semantic_cache_exact_fields": ["grade_level", "subjects", "upcoming_exams", "special_considerations"],
+            "trace_file": None,
+            "metrics_file": None
         }
         
         if config_path.exists():
@@ -240,47 +3466,248 @@ class StudyPlanGenerator:
             
             return default_config
     
-    def _setup_llm(self, api_key, model=None, temperature=None):
-        """Set up the language model for OpenRouter"""
+    def _setup_cache(self):
+        """Create the on-disk plan cache unless disabled in config"""
+        if not self.config.get("cache_enabled", True):
+            return None
+        try:
+            return PlanCache(
+                self.config.get("cache_dir", ".plan_cache"),
+                max_entries=self.config.get("cache_max_entries", 1000),
+                max_bytes=self.config.get("cache_max_mb", 200) * 1024 * 1024,
+                max_age_seconds=self.config.get("cache_max_age_days", 30) * 86400
+            )
+        except OSError as e:
+            logger.error(f"Error creating plan cache: {e}")
+            return None
+    
+    def _prepare_prompt(self, student_profile, model=None):
+        """Render the configured template variant for a profile within the token budget
+
+        Returns (prompt, fitted_profile) and logs the request's token stats.
+        With the local schedule optimizer on, fitted_profile also carries the
+        weekly_schedule the model is asked to narrate (see _with_local_schedule).
+        """
+        model = model or self.config.get("default_model", "gpt-4-turbo")
+        weekly_schedule = self.local_schedule(student_profile)
+        template_name = STUDY_PLAN_TEMPLATE_VARIANTS[self.prompt_template]
+        if weekly_schedule:
+            template_name = f"scheduled_{template_name}"
+        template = _PROMPT_TEMPLATES[template_name][1]
+        with tracer.span("prompt.render", template=self.prompt_template) as span:
+            prompt, fitted, stats = fit_profile_to_budget(
+                student_profile, template, self.token_budget, model,
+                {"weekly_schedule": weekly_schedule} if weekly_schedule else None
+            )
+            span.set(prompt_tokens=stats["prompt_tokens"], truncated_fields=stats["truncated_fields"])
+        tracer.count("prompt_tokens", stats["prompt_tokens"], "Prompt tokens rendered", model=model)
+        
+        message = (
+            f"Prompt for {student_profile.get('student_name')} ({self.prompt_template}, {model}): "
+            f"{stats['prompt_tokens']} tokens ({stats['static_tokens']} static of which {stats['prefix_tokens']} prefix, "
+            f"{stats['profile_tokens']} profile"
+            + (f", {stats['extra_tokens']} schedule)" if stats["extra_tokens"] else ")")
+        )
+        if stats["truncated_fields"]:
+            message += f"; shortened {', '.join(stats['truncated_fields'])} to fit {self.token_budget}"
+        logger.info(message)
+        if stats["over_budget"]:
+            logger.warning(f"Prompt still exceeds the {self.token_budget} token budget after shortening ({stats['prompt_tokens']} tokens)")
+        return prompt, fitted
+    
+    def local_schedule(self, student_profile):
+        """Weekly schedule computed locally for a profile, as Markdown
+
+        None when the optimizer is off or the profile's available_study_time
+        has no parseable time ranges; the model then writes the schedule.
+        """
+        if not self.schedule_optimizer:
+            return None
+        with tracer.span("schedule.optimize") as span:
+            schedule = optimize_weekly_schedule(
+                student_profile,
+                block_minutes=self.config.get("schedule_block_minutes", 45),
+                break_minutes=self.config.get("schedule_break_minutes", 15)
+            )
+            span.set(blocks=len(schedule.blocks))
+        non_study = (SCHEDULE_SUBJECTS.index("Break"), SCHEDULE_SUBJECTS.index("Extracurricular"))
+        if not any(code not in non_study for _, _, _, code, _ in schedule.blocks):
+            logger.info(f"No study windows parsed for {student_profile.get('student_name')}; the model writes the schedule")
+            return None
+        return format_weekly_schedule(schedule)
+    
+    @staticmethod
+    def _with_local_schedule(study_plan):
+        """Splice the weekly_schedule passed through the chain inputs into the generated plan text"""
+        if not isinstance(study_plan, dict) or "weekly_schedule" not in study_plan:
+            return study_plan
+        plan = {key: value for key, value in study_plan.items() if key != "weekly_schedule"}
+        plan["text"] = insert_weekly_schedule(extract_plan_text(study_plan), study_plan["weekly_schedule"])
+        return plan
+    
+    def _setup_semantic_cache(self):
+        """Create the near-duplicate profile cache unless disabled in config"""
+        if not (self.config.get("cache_enabled", True) and self.config.get("semantic_cache_enabled", True)):
+            return None
+        return SemanticPlanCache(
+            Path(self.config.get("cache_dir", ".plan_cache")) / "semantic.jsonl",
+            threshold=self.config.get("semantic_cache_threshold", 0.95),
+            max_entries=self.config.get("cache_max_entries", 1000),
+            exact_fields=self.config.get(
+                "semantic_cache_exact_fields", ["grade_level", "subjects", "upcoming_exams", "special_considerations"]
+            )
+        )
+    
+    def _semantic_match(self, student_profile, model, temperature, refresh_cache=None):
+        """Find a cached plan for a near-identical profile; None when disabled, refreshing or no match"""
+        if self.semantic_cache is None or (refresh_cache if refresh_cache is not None else self.refresh_cache):
+            return None
+        match = self.semantic_cache.match(
+            student_profile, model or self.config.get("default_model", "gpt-4-turbo"), temperature
+        )
+        if match is None:
+            tracer.count("cache_lookups", 1, "Plan cache lookups by cache and result", cache="semantic", result="miss")
+        return match
+    
+    async def _areuse_similar_plan(self, api_key, match, student_profile, model, temperature):
+        """Adapt a near-duplicate's plan to this profile
+
+        The other student's name is swapped for this one's. When nothing
+        else differs the plan is reused as is (a "template" hit). Otherwise
+        the sections depending on the differing fields are regenerated (an
+        "edit" hit), in either semantic_cache_mode: even a 0.98 similarity
+        can hide another student's exam dates or accommodations.
+        """
+        entry, similarity, differing = match
+        plan_text = personalize_plan(entry["plan"], entry["student_profile"].get("student_name"), student_profile.get("student_name"))
+        kind = "template"
+        start = time.perf_counter()
+        stale = []
+        if differing - {"student_name"}:
+            kind = "edit"
+            base_profile = {**entry["student_profile"], "student_name": student_profile.get("student_name")}
+            plan_text, stale = await self.aregenerate_plan_sections(
+                api_key, plan_text, base_profile, student_profile, model, temperature
+            )
+        elapsed = time.perf_counter() - start
+        self.semantic_cache.record_hit(entry, kind, 1 - len(stale) / len(PLAN_SECTION_TITLES), elapsed)
+        tracer.count("cache_lookups", 1, "Plan cache lookups by cache and result", cache="semantic", result=kind)
+        logger.info(
+            f"Semantic cache {kind} hit for {student_profile.get('student_name')} "
+            f"(similarity {similarity:.3f}, differing fields: {sorted(differing) or 'none'})"
+        )
+        return {**student_profile, "text": plan_text}
+    
+    def _cache_lookup(self, student_profile, model, temperature, refresh_cache=None, variant=None, prompt=None):
+        """Return (cache_key, cached_result) for a request; cached_result is None on a miss"""
+        if self.cache is None:
+            return None, None
+        model = model or self.config.get("default_model", "gpt-4-turbo")
+        if prompt is None:
+            prompt = PERSONALIZED_STUDY_PLAN_TEMPLATE.format(**student_profile)
+        key = PlanCache.make_key(prompt, model, temperature, variant)
+        
+        if refresh_cache if refresh_cache is not None else self.refresh_cache:
+            return key, None
+        
+        text = self.cache.get(key)
+        tracer.count("cache_lookups", 1, "Plan cache lookups by cache and result", cache="exact", result="miss" if text is None else "hit")
+        if text is None:
+            return key, None
+        logger.info(f"Plan cache hit for {student_profile.get('student_name')} ({model})")
+        return key, {**student_profile, "text": text}
+    
+    def _cache_store(self, key, study_plan, model, temperature, student_profile=None, prompt=None, generation_seconds=None):
+        """Store a freshly generated plan under its cache key (and in the semantic cache, given the profile)"""
+        model = model or self.config.get("default_model", "gpt-4-turbo")
+        if tracer.enabled:
+            tracer.count("output_tokens", count_tokens(extract_plan_text(study_plan), model), "Generated plan tokens", model=model)
+        if self.semantic_cache is not None and student_profile is not None:
+            self.semantic_cache.add(
+                student_profile,
+                extract_plan_text(study_plan),
+                model,
+                temperature,
+                prompt_tokens=count_tokens(prompt, model) if prompt else None,
+                generation_seconds=generation_seconds
+            )
+        if self.cache is None or key is None:
+            return
+        self.cache.put(
+            key,
+            extract_plan_text(study_plan),
+            model=model,
+            temperature=temperature
+        )
+    
+    def _setup_llm(self, api_key, model=None, temperature=None, max_retries=None, prompt_tokens=0):
+        """Set up the language model for OpenRouter (reused across generations)"""
         if temperature is None:
             temperature = self.config.get("temperature", 0.7)
             
         if not model:
             model = self.config.get("default_model", "gpt-4-turbo")
+        if model == "auto":
+            # Paths without fallback (streaming, sectioned) use the router's first choice
+            model = self.router.route(prompt_tokens)[0]
+            logger.info(f"Router selected {model}")
+        with tracer.span("llm.setup", model=model):
+            if self.llm_factory is not None:
+                return self.llm_factory(model, temperature)
             
-        return ChatOpenAI(
-            api_key=api_key,
-            base_url=self.config.get("openrouter_api_base", "https://openrouter.ai/api/v1"),
-            model=model,
-            temperature=temperature,
-            default_headers={
-                "HTTP-Referer": "https://study-plan-generator.app",
-                "X-Title": "Personalized Study Plan Generator"
-            }
-        )
+            return self.clients.get(
+                api_key=api_key,
+                base_url=self.config.get("openrouter_api_base", "https://openrouter.ai/api/v1"),
+                model=model,
+                temperature=temperature,
+                default_headers={
+                    "HTTP-Referer": "https://study-plan-generator.app",
+                    "X-Title": "Personalized Study Plan Generator"
+                },
+                max_retries=max_retries
+            )
+    
+    def use_fake_llm(self, ttft=0.05, tokens_per_second=2000.0, jitter=0.0):
+        """Answer every generation with make_fake_chat_model() instead of calling OpenRouter"""
+        models = {}
+        
+        def factory(model, temperature):
+            if model not in models:
+                models[model] = make_fake_chat_model(ttft, tokens_per_second, jitter, model_name=model)
+            return models[model]
+        
+        self.llm_factory = factory
+    
+    def _study_plan_chain(self, llm, scheduled=False):
+        """Return the (cached) LLMChain pairing llm with the configured study plan prompt
+
+        scheduled selects the variant that narrates a precomputed weekly_schedule.
+        """
+        template_name = STUDY_PLAN_TEMPLATE_VARIANTS[self.prompt_template]
+        if scheduled:
+            template_name = f"scheduled_{template_name}"
+        chain = self._chains.get((id(llm), template_name))
+        if chain is None or chain.llm is not llm:
+            from langchain.chains import LLMChain
+            chain = LLMChain(
+                llm=llm,
+                prompt=get_prompt_template(template_name)
+            )
+            self._chains[(id(llm), template_name)] = chain
+        return chain
     
     def display_available_models(self):
         """Display available models on OpenRouter"""
+        from rich.table import Table
         table = Table(title="Available Models on OpenRouter")
         table.add_column("Number", justify="right", style="cyan")
         table.add_column("Model", style="green")
         table.add_column("Provider", style="yellow")
         table.add_column("Description", style="magenta")
         
-        models = [
-            ("1", "gpt-3.5-turbo", "OpenAI", "Balanced performance and cost"),
-            ("2", "gpt-4-turbo", "OpenAI", "Advanced reasoning capabilities"),
-            ("3", "claude-3-haiku", "Anthropic", "Fast and efficient assistant"),
-            ("4", "claude-3-sonnet", "Anthropic", "Strong reasoning and helpfulness"),
-            ("5", "gemini-pro", "Google", "Strong at multilingual content"),
-            ("6", "mistral-large", "Mistral AI", "Excellent open model performance"),
-            ("7", "llama-2-70b-chat", "Meta", "Powerful open source model"),
-            ("8", "mixtral-8x7b", "Mistral AI", "Excellent for diverse tasks"),
-            ("9", "phi-2", "Microsoft", "Lightweight model with good performance")
-        ]
-        
-        for model in models:
-            table.add_row(*model)
+        table.add_row("0", "auto", "Router", "Pick per request by profile size, latency SLO and cost")
+        for number, entry in enumerate(MODEL_CATALOG, 1):
+            table.add_row(str(number), entry["name"], entry["provider"], entry["description"])
                 
         console.print(table)
     
@@ -291,22 +3718,16 @@ class StudyPlanGenerator:
         model_choice = console.input("[bold yellow]Select a model (enter number or full model name, default: 2 for gpt-4-turbo): [/bold yellow]")
         
         # Map model choices
-        models_map = {
-            "1": "gpt-3.5-turbo",
-            "2": "gpt-4-turbo",
-            "3": "claude-3-haiku",
-            "4": "claude-3-sonnet",
-            "5": "gemini-pro",
-            "6": "mistral-large",
-            "7": "llama-2-70b-chat",
-            "8": "mixtral-8x7b",
-            "9": "phi-2",
-            "": "gpt-4-turbo"  # Default if empty
-        }
+        models_map = {str(number): entry["name"] for number, entry in enumerate(MODEL_CATALOG, 1)}
+        models_map["0"] = "auto"
+        models_map[""] = "gpt-4-turbo"  # Default if empty
         return models_map.get(model_choice, model_choice)
     
-    def get_api_key(self):
-        """Get OpenRouter API key"""
+    def get_api_key(self, api_key=None):
+        """Get OpenRouter API key, preferring one passed explicitly (e.g. --api-key)"""
+        if api_key:
+            return api_key
+        
         env_var_key = "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"
         if os.environ.get(env_var_key):
             api_key = os.environ.get(env_var_key)
@@ -353,101 +3774,768 @@ class StudyPlanGenerator:
         
         return profile
 
-    def generate_study_plan(self, api_key, model=None, student_profile=None, temperature=0.7):
+    @traced("generate")
+    def generate_study_plan(self, api_key, model=None, student_profile=None, temperature=0.7, refresh_cache=None, engine=None):
         """Generate a personalized study plan using the defined PromptTemplate"""
+        import asyncio
         if not student_profile:
             student_profile = create_sample_student_profile()
+        tracer.annotate(student=student_profile.get("student_name"), model=model or self.config.get("default_model"), engine=engine or self.engine)
+        
+        if (engine or self.engine) == "sectioned":
+            with console.status("[bold green]Generating personalized study plan (sectioned)...[/bold green]"):
+                return asyncio.run(self.agenerate_study_plan_sectioned(
+                    api_key, model, student_profile, temperature, refresh_cache
+                ))
+        if model == "auto":
+            with console.status("[bold green]Generating personalized study plan (routed)...[/bold green]"):
+                return asyncio.run(self.agenerate_study_plan(
+                    api_key, model, student_profile, temperature, refresh_cache
+                ))
+        
+        prompt, fitted_profile = self._prepare_prompt(student_profile, model)
+        cache_key, cached_plan = self._cache_lookup(student_profile, model, temperature, refresh_cache, prompt=prompt)
+        if cached_plan is not None:
+            return cached_plan
+        match = self._semantic_match(student_profile, model, temperature, refresh_cache)
+        if match is not None:
+            with console.status("[bold green]Adapting the plan of a similar student...[/bold green]"):
+                return asyncio.run(self._areuse_similar_plan(api_key, match, student_profile, model, temperature))
         
         # Set up the language model
         llm = self._setup_llm(api_key, model, temperature)
         
         # Create the chain with our prompt template
-        with console.status("[bold green]Generating personalized study plan...[/bold green]"):
-            study_plan_chain = LLMChain(
-                llm=llm,
-                prompt=personalized_study_plan_template
-            )
+        start = time.perf_counter()
+        with console.status("[bold green]Generating personalized study plan...[/bold green]"), tracer.span("llm.generate", model=model or self.config.get("default_model")):
+            study_plan_chain = self._study_plan_chain(llm, "weekly_schedule" in fitted_profile)
             
             # Run the chain to generate the study plan
-            study_plan = study_plan_chain.invoke(student_profile)
+            study_plan = self._with_local_schedule(study_plan_chain.invoke(fitted_profile))
         
+        self._cache_store(cache_key, study_plan, model, temperature, student_profile, prompt, time.perf_counter() - start)
         return study_plan
 
-    def visualize_study_schedule(self, plan_text):
-        """Create a simple visualization of the weekly study schedule"""
+    @traced("generate.stream")
+    def stream_study_plan(self, api_key, model=None, student_profile=None, temperature=0.7, output_path=None):
+        """Generate a study plan while rendering tokens live and appending them to output_path
+
+        Returns the same shape as generate_study_plan. Time-to-first-token and
+        total generation time are written to the log.
+        """
+        if not student_profile:
+            student_profile = create_sample_student_profile()
+        
+        out = open(output_path, "w") if output_path else None
         try:
-            # This is a simple placeholder for visualization
-            # In a real implementation, you would parse the study plan to extract the schedule
-            days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            hours = list(range(6, 23))  # 6 AM to 10 PM
+            prompt, fitted_profile = self._prepare_prompt(student_profile, model)
+            cache_key, cached_plan = self._cache_lookup(student_profile, model, temperature, prompt=prompt)
+            if cached_plan is not None:
+                console.print(cached_plan["text"], markup=False, highlight=False)
+                if out:
+                    out.write(cached_plan["text"])
+                return cached_plan
             
-            # Create a random schedule for demonstration
-            np.random.seed(42)  # For reproducibility
-            schedule = np.zeros((len(days), len(hours)))
-            subjects = ['Math', 'Physics', 'English', 'History', 'CS', 'Break', 'Extracurricular']
-            subject_colors = ['#FF9999', '#99FF99', '#9999FF', '#FFFF99', '#FF99FF', '#CCCCCC', '#99FFFF']
+            llm = self._setup_llm(api_key, model, temperature, prompt_tokens=count_tokens(prompt))
             
-            # Randomly assign subjects to time slots
-            for i in range(len(days)):
-                for j in range(len(hours)):
-                    if np.random.random() > 0.7:  # 30% chance of having a scheduled activity
-                        schedule[i, j] = np.random.randint(1, len(subjects) + 1)
-            
-            # Create the plot
-            fig, ax = plt.subplots(figsize=(12, 8))
-            im = ax.imshow(schedule, cmap='tab10', aspect='auto', vmin=0, vmax=len(subjects))
-            
-            # Set labels
-            ax.set_xticks(np.arange(len(hours)))
-            ax.set_yticks(np.arange(len(days)))
-            ax.set_xticklabels([f"{h}:00" for h in hours])
-            ax.set_yticklabels(days)
-            
-            # Rotate the tick labels and set their alignment
-            plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
-            
-            # Create legend
-            from matplotlib.patches import Patch
-            legend_elements = [Patch(facecolor=subject_colors[i], label=subjects[i]) 
-                              for i in range(len(subjects))]
-            ax.legend(handles=legend_elements, bbox_to_anchor=(1.05, 1), loc='upper left')
-            
-            # Add title and adjust layout
-            ax.set_title("Weekly Study Schedule")
-            fig.tight_layout()
+            chunks = []
+            first_token_time = None
+            start = time.perf_counter()
+            for chunk in llm.stream(prompt):
+                text = chunk.content
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start
+                chunks.append(text)
+                console.print(text, end="", markup=False, highlight=False, soft_wrap=True)
+                if out:
+                    out.write(text)
+                    out.flush()
+            total_time = time.perf_counter() - start
+            console.print()
+            plan_text = "".join(chunks)
+            if "weekly_schedule" in fitted_profile:
+                # The model only narrated the locally computed schedule; show it and splice it in
+                console.print(fitted_profile["weekly_schedule"], markup=False, highlight=False)
+                plan_text = insert_weekly_schedule(plan_text, fitted_profile["weekly_schedule"])
+                if out:
+                    out.seek(0)
+                    out.truncate()
+                    out.write(plan_text)
+        finally:
+            if out:
+                out.close()
+        
+        if first_token_time is not None:
+            tracer.observe("ttft_seconds", first_token_time, "Time to first streamed token", model=model or "default")
+            tracer.annotate(ttft_seconds=round(first_token_time, 4), chunks=len(chunks))
+        logger.info(
+            f"Streamed plan for {student_profile.get('student_name')}: "
+            f"time to first token {first_token_time or 0.0:.2f}s, total {total_time:.2f}s, "
+            f"{len(chunks)} chunks"
+        )
+        
+        study_plan = {**student_profile, "text": plan_text}
+        self._cache_store(cache_key, study_plan, model, temperature)
+        return study_plan
+
+    def _request_semaphore(self):
+        """Semaphore bounding in-flight section requests on the running event loop
+
+        Sized by max_concurrent_requests (--concurrency in batch mode), so a
+        sectioned plan's fan-out shares one budget with every other plan.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self._request_limit[0] is not loop:
+            self._request_limit = (loop, asyncio.Semaphore(max(1, int(self.max_concurrent_requests))))
+        return self._request_limit[1]
+
+    def _sectioned_cache_variant(self):
+        """Cache variant of sectioned plans; includes the schedule settings the plan was built with"""
+        if not self.schedule_optimizer:
+            return "sectioned:schedule=llm"
+        return (f"sectioned:schedule=local/{self.config.get('schedule_block_minutes', 45)}"
+                f"/{self.config.get('schedule_break_minutes', 15)}")
+
+    @traced("llm.section")
+    async def _agenerate_section(self, llm, student_profile, title, plan_context="", fields=None, focus=None, instructions=None):
+        """Write a single plan section with the smaller section prompt
+
+        focus narrows the section to one item, e.g. a single subject's action plan;
+        instructions replaces the section's instructions from the plan template.
+        """
+        number = PLAN_SECTION_TITLES.index(title) + 1
+        instructions = instructions or dict(PLAN_SECTIONS)[title]
+        heading_line = f"## {number}. {title}"
+        if focus:
+            heading_line += f"\n### {focus}"
+            instructions += f"\n\nCover only this subject: {focus}. Other subjects are written separately."
+        prompt = SECTION_STUDY_PLAN_TEMPLATE.format(
+            student_name=student_profile.get("student_name", ""),
+            profile_details=format_profile_details(
+                student_profile,
+                (fields if fields is not None else SECTION_DEPENDENCIES[title]) | {"student_name", "grade_level"}
+            ),
+            plan_context=plan_context or "(none)",
+            section_heading=heading_line,
+            section_instructions=instructions
+        )
+        tracer.annotate(section=title, focus=focus)
+        async with self._request_semaphore():
+            response = await llm.ainvoke(prompt)
+        text = extract_plan_text(response).strip()
+        # Models sometimes repeat the heading despite instructions; the caller owns it
+        heading = _SECTION_HEADING_RE.match(text)
+        if heading:
+            text = text[heading.end():].strip()
+        if focus and text.startswith("#"):
+            text = text.split("\n", 1)[1].strip() if "\n" in text else ""
+        return text
+
+    async def _agenerate_schedule_section(self, llm, student_profile, plan_context=""):
+        """Weekly Master Schedule body: the local schedule after a short model-written rationale"""
+        weekly_schedule = self.local_schedule(student_profile)
+        if not weekly_schedule:
+            return await self._agenerate_section(llm, student_profile, "Weekly Master Schedule", plan_context)
+        narration = await self._agenerate_section(
+            llm, student_profile, "Weekly Master Schedule", plan_context,
+            instructions=SCHEDULE_NARRATION_INSTRUCTIONS + "\n\n" + SCHEDULE_PROMPT_BLOCK.format(weekly_schedule=weekly_schedule)
+        )
+        return f"{narration}\n\n{weekly_schedule}".strip()
+
+    @traced("generate.sectioned")
+    async def agenerate_study_plan_sectioned(self, api_key, model=None, student_profile=None, temperature=0.7, refresh_cache=None):
+        """Generate a plan by fanning its sections out as concurrent, independent prompts
+
+        The Executive Summary is written first and shared with every other
+        section as context, so wall-clock time is roughly that step plus the
+        slowest remaining section rather than the length of the whole plan.
+        Subject-Specific Action Plans are split into one request per subject.
+        """
+        import asyncio
+        if not student_profile:
+            student_profile = create_sample_student_profile()
+        
+        cache_key, cached_plan = self._cache_lookup(
+            student_profile, model, temperature, refresh_cache, variant=self._sectioned_cache_variant()
+        )
+        if cached_plan is not None:
+            return cached_plan
+        
+        llm = self._setup_llm(api_key, model, temperature)
+        start = time.perf_counter()
+        
+        # Reduce step input: a short shared summary keeps the independent pieces consistent
+        summary = await self._agenerate_section(llm, student_profile, "Executive Summary", fields=set(PROFILE_FIELDS))
+        summary_time = time.perf_counter() - start
+        
+        # Map step: every remaining section (and every subject) in parallel
+        subjects = split_subjects(student_profile.get("subjects", "")) or [None]
+        jobs = []
+        for title in PLAN_SECTION_TITLES[1:]:
+            if title == "Subject-Specific Action Plans":
+                jobs.extend((title, subject) for subject in subjects)
+            else:
+                jobs.append((title, None))
+        bodies = await asyncio.gather(*[
+            self._agenerate_schedule_section(llm, student_profile, summary) if title == "Weekly Master Schedule"
+            else self._agenerate_section(llm, student_profile, title, plan_context=summary, focus=subject)
+            for title, subject in jobs
+        ])
+        
+        # Assemble in template order
+        parts = [f"# PERSONALIZED STUDY PLAN FOR {student_profile.get('student_name', '').upper()}\n\n",
+                 f"## 1. Executive Summary\n\n{summary}\n\n"]
+        current_title = None
+        for (title, subject), body in zip(jobs, bodies):
+            if title != current_title:
+                parts.append(f"## {PLAN_SECTION_TITLES.index(title) + 1}. {title}\n\n")
+                current_title = title
+            if subject:
+                parts.append(f"### {subject}\n\n")
+            parts.append(f"{body}\n\n")
+        
+        logger.info(
+            f"Sectioned plan for {student_profile.get('student_name')}: {len(jobs) + 1} requests, "
+            f"summary {summary_time:.2f}s, total {time.perf_counter() - start:.2f}s"
+        )
+        
+        study_plan = {**student_profile, "text": "".join(parts).rstrip() + "\n"}
+        self._cache_store(cache_key, study_plan, model, temperature)
+        return study_plan
+
+    def regenerate_plan_sections(self, api_key, plan_text, old_profile, new_profile, model=None, temperature=0.7):
+        """Regenerate only the sections of a saved plan affected by profile changes
+
+        Returns (updated_plan_text, regenerated_section_titles).
+        """
+        import asyncio
+        with console.status("[bold green]Regenerating affected sections...[/bold green]"):
+            return asyncio.run(self.aregenerate_plan_sections(
+                api_key, plan_text, old_profile, new_profile, model, temperature
+            ))
+
+    @traced("plan.update")
+    async def aregenerate_plan_sections(self, api_key, plan_text, old_profile, new_profile, model=None, temperature=0.7):
+        """Asynchronous regenerate_plan_sections"""
+        import asyncio
+        changed = changed_profile_fields(old_profile, new_profile)
+        if "student_name" in changed:
+            plan_text = personalize_plan(plan_text, old_profile.get("student_name"), new_profile.get("student_name"))
+        
+        stale = sections_affected_by(changed)
+        if not stale:
+            return plan_text, []
+        
+        preamble, sections = parse_plan_sections(plan_text)
+        existing = {title for title, _, _ in sections}
+        summary_body = next((body for title, _, body in sections if title == "Executive Summary"), "")
+        plan_context = summary_body.strip()[:1500]
+        
+        llm = self._setup_llm(api_key, model, temperature)
+        
+        start = time.perf_counter()
+        new_bodies = dict(zip(stale, await asyncio.gather(*[
+            self._agenerate_schedule_section(llm, new_profile, plan_context) if title == "Weekly Master Schedule"
+            else self._agenerate_section(llm, new_profile, title, plan_context)
+            for title in stale
+        ])))
+        logger.info(
+            f"Regenerated sections {stale} for {new_profile.get('student_name')} "
+            f"(changed fields: {sorted(changed)}) in {time.perf_counter() - start:.2f}s"
+        )
+        
+        # Splice the new bodies back in, keeping the original headings and order
+        parts = [preamble]
+        for title, heading_line, body in sections:
+            parts.append(heading_line)
+            parts.append(f"\n\n{new_bodies[title]}\n\n" if title in new_bodies else body)
+        for title in stale:
+            if title not in existing:
+                logger.warning(f"Section '{title}' missing from saved plan; appending it")
+                parts.append(f"## {PLAN_SECTION_TITLES.index(title) + 1}. {title}\n\n{new_bodies[title]}\n\n")
+        
+        return "".join(parts).rstrip() + "\n", stale
+
+    @traced("generate")
+    async def agenerate_study_plan(self, api_key, model=None, student_profile=None, temperature=0.7, refresh_cache=None, engine=None):
+        """Asynchronously generate a study plan; safe to run many of these concurrently"""
+        if not student_profile:
+            student_profile = create_sample_student_profile()
+        tracer.annotate(student=student_profile.get("student_name"), model=model or self.config.get("default_model"), engine=engine or self.engine)
+        
+        if (engine or self.engine) == "sectioned":
+            return await self.agenerate_study_plan_sectioned(api_key, model, student_profile, temperature, refresh_cache)
+        if model == "auto":
+            return await self._agenerate_routed(api_key, student_profile, temperature, refresh_cache)
+        
+        prompt, fitted_profile = self._prepare_prompt(student_profile, model)
+        cache_key, cached_plan = self._cache_lookup(student_profile, model, temperature, refresh_cache, prompt=prompt)
+        if cached_plan is not None:
+            return cached_plan
+        match = self._semantic_match(student_profile, model, temperature, refresh_cache)
+        if match is not None:
+            return await self._areuse_similar_plan(api_key, match, student_profile, model, temperature)
+        
+        start = time.perf_counter()
+        llm = self._setup_llm(api_key, model, temperature)
+        study_plan_chain = self._study_plan_chain(llm, "weekly_schedule" in fitted_profile)
+        with tracer.span("llm.generate", model=model or self.config.get("default_model")):
+            study_plan = self._with_local_schedule(await study_plan_chain.ainvoke(fitted_profile))
+        
+        self._cache_store(cache_key, study_plan, model, temperature, student_profile, prompt, time.perf_counter() - start)
+        return study_plan
+
+    @traced("generate.routed")
+    async def _agenerate_routed(self, api_key, student_profile, temperature=0.7, refresh_cache=None, limiter=None):
+        """Generate a plan on the router's choice of model, falling back or hedging as configured
+
+        limiter(model), when given, is an async context manager held around
+        each attempt so callers can apply their per-model limits to the
+        models actually tried.
+        """
+        prompt, fitted_profile = self._prepare_prompt(student_profile)
+        cache_key, cached_plan = self._cache_lookup(student_profile, "auto", temperature, refresh_cache, prompt=prompt)
+        if cached_plan is not None:
+            return cached_plan
+        match = self._semantic_match(student_profile, "auto", temperature, refresh_cache)
+        if match is not None:
+            return await self._areuse_similar_plan(api_key, match, student_profile, "auto", temperature)
+        
+        start = time.perf_counter()
+        candidates = self.router.route(count_tokens(prompt))
+        logger.info(f"Routing {student_profile.get('student_name')} to {', '.join(candidates)}")
+        
+        async def call(model):
+            # No client-level retries: a failing model should hand over to the next one
+            llm = self._setup_llm(api_key, model, temperature, max_retries=0)
+            chain = self._study_plan_chain(llm, "weekly_schedule" in fitted_profile)
+            if limiter is None:
+                return self._with_local_schedule(await chain.ainvoke(fitted_profile))
+            async with limiter(model):
+                return self._with_local_schedule(await chain.ainvoke(fitted_profile))
+        
+        model, study_plan = await self.router.run(
+            call, candidates, timeout=self.route_timeout, hedge_after=self.hedge_after
+        )
+        study_plan = {**study_plan, "model": model}
+        self._cache_store(cache_key, study_plan, "auto", temperature, student_profile, prompt, time.perf_counter() - start)
+        return study_plan
+
+    async def _generate_batch(self, profiles, api_key, model, temperature, output_path, concurrency,
+                              indexes=None, journal=None, progress=False):
+        """Generate plans for all profiles with at most `concurrency` requests in flight
+
+        indexes limits the run to those profiles (e.g. the outstanding ones of
+        a resumed run), and results are then appended to output_path. With a
+        journal, every profile's state is recorded as it changes; progress
+        shows a progress bar with an ETA. Sectioned plans fan out into many
+        requests, so the same limit also bounds their section requests.
+        """
+        import asyncio
+        semaphore = asyncio.Semaphore(concurrency)
+        self._request_limit = (asyncio.get_running_loop(), asyncio.Semaphore(concurrency))
+        indexes = list(range(len(profiles))) if indexes is None else indexes
+        keys = {index: profile_fingerprint(profiles[index]) for index in indexes} if journal else {}
+        
+        async def generate_one(index, profile):
+            async with semaphore:
+                if journal:
+                    journal.record(index, keys[index], "in_flight")
+                start = time.perf_counter()
+                try:
+                    result = await self.agenerate_study_plan(
+                        api_key=api_key,
+                        model=model,
+                        student_profile=profile,
+                        temperature=temperature
+                    )
+                    return index, profile, result, None, time.perf_counter() - start
+                except Exception as e:
+                    return index, profile, None, e, time.perf_counter() - start
+        
+        tasks = [asyncio.create_task(generate_one(i, profiles[i])) for i in indexes]
+        latencies = []
+        failures = 0
+        
+        bar = None
+        if progress:
+            from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn, TimeRemainingColumn
+            bar = Progress(TextColumn("[bold green]{task.description}"), BarColumn(), MofNCompleteColumn(),
+                           TextColumn("{task.fields[failed]} failed"), TimeElapsedColumn(), TextColumn("ETA"),
+                           TimeRemainingColumn())
+            progress_task = bar.add_task("Generating", total=len(profiles),
+                                         completed=len(profiles) - len(indexes), failed=0)
+            bar.start()
+        
+        try:
+            with open(output_path, "a" if len(indexes) < len(profiles) else "w") as out:
+                for next_done in asyncio.as_completed(tasks):
+                    index, profile, result, error, elapsed = await next_done
+                    record = {
+                        "index": index,
+                        "student_name": profile["student_name"],
+                        "model": (result or {}).get("model") or model or self.config.get("default_model"),
+                        "latency_seconds": round(elapsed, 3)
+                    }
+                    plan_id = None
+                    if error is None:
+                        latencies.append(elapsed)
+                        record.update(status="ok", study_plan=extract_plan_text(result))
+                        if self.plan_storage == "archive":
+                            plan_id = self.archive.add(
+                                profile["student_name"], record["study_plan"], student_profile=profile,
+                                model=record["model"], temperature=temperature, generation_seconds=record["latency_seconds"]
+                            )
+                    else:
+                        failures += 1
+                        logger.error(f"Batch profile #{index} ({profile['student_name']}) failed: {error}")
+                        record.update(status="error", error=str(error))
+                    # Write each result as soon as it is available so partial runs are useful
+                    offset = out.tell()
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    if journal:
+                        # The result must be on disk before the journal calls the profile finished
+                        os.fsync(out.fileno())
+                        location = {"output": output_path, "offset": offset}
+                        if plan_id is not None:
+                            location["plan"] = f"{self.archive.path}#{plan_id}"
+                        if error is None:
+                            journal.record(index, keys[index], "done", seconds=record["latency_seconds"], **location)
+                        else:
+                            journal.record(index, keys[index], "failed", seconds=record["latency_seconds"],
+                                           error=str(error), **location)
+                    if bar is not None:
+                        bar.update(progress_task, advance=1, failed=failures)
+        finally:
+            if bar is not None:
+                bar.stop()
+        
+        return latencies, failures
+
+    def batch_journal_path(self, input_path, model=None, temperature=0.7):
+        """Default journal for a batch: one per input file, model, temperature and engine"""
+        identity = f"{Path(input_path).resolve()}|{model or self.config.get('default_model')}|{temperature}|{self.engine}"
+        digest = hashlib.sha256(identity.encode("utf-8")).hexdigest()[:8]
+        journal_dir = self.config.get("batch_journal_dir") or f"{self.config.get('output_dir', 'study_plans')}/journals"
+        return f"{journal_dir}/{safe_filename(Path(input_path).stem)}_{digest}.journal"
+
+    @traced("batch")
+    def run_batch(self, input_path, api_key, model=None, temperature=0.7, output_path=None, concurrency=None,
+                  journal_path=None, restart=False):
+        """Generate study plans for every profile in a JSONL/CSV file without prompting
+
+        Progress is journaled (see JobJournal), so running the same batch
+        again after a crash or Ctrl-C only generates the profiles that are
+        not done yet, appending to the first run's output file. restart
+        discards the journal and starts over.
+        """
+        import asyncio
+        profiles = load_student_profiles(input_path)
+        concurrency = max(1, int(concurrency or self.config.get("batch_concurrency", 8)))
+        journal = JobJournal(journal_path or self.batch_journal_path(input_path, model, temperature))
+        keys = [profile_fingerprint(profile) for profile in profiles]
+        
+        if journal.run is not None and not restart:
+            if output_path and output_path != journal.run["output_path"]:
+                logger.warning(f"Resuming into {journal.run['output_path']}; ignoring output path {output_path}")
+            output_path = journal.run["output_path"]
+            pending = journal.outstanding(keys)
+            console.print(f"[bold green]Resuming batch from {journal.path}: {len(profiles) - len(pending)} of "
+                          f"{len(profiles)} done, {len(pending)} outstanding[/bold green]")
+        else:
+            if not output_path:
+                output_dir = self.config.get("output_dir", "study_plans")
+                os.makedirs(output_dir, exist_ok=True)
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                output_path = f"{output_dir}/batch_{timestamp}.jsonl"
+            journal.start(input_path=str(input_path), output_path=output_path, profiles=len(profiles),
+                          model=model, temperature=temperature)
+            pending = list(range(len(profiles)))
+        
+        if pending:
+            console.print(f"[bold green]Generating {len(pending)} study plans "
+                          f"(concurrency {concurrency})...[/bold green]")
+        else:
+            console.print("[bold green]Every profile is already done; use --restart to generate them again[/bold green]")
+        
+        async def generate():
+            try:
+                await self._generate_batch(profiles, api_key, model, temperature, output_path, concurrency,
+                                           indexes=pending, journal=journal, progress=True)
+            finally:
+                # Pooled async connections belong to this loop, so close them before it ends
+                await self.clients.aclose()
+        
+        start = time.perf_counter()
+        interrupted = False
+        try:
+            if pending:
+                asyncio.run(generate())
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            journal.close()
+        wall_time = time.perf_counter() - start
+        latencies = [record["seconds"] for record in journal.session if record["state"] == "done"]
+        failures = sum(1 for record in journal.session if record["state"] == "failed")
+        counts = journal.counts(keys)
+        remaining = counts["pending"] + counts["in_flight"] + counts["failed"]
+        if interrupted or remaining:
+            console.print(f"[bold yellow]{'Interrupted' if interrupted else 'Finished'} with {remaining} profiles "
+                          f"outstanding; run the same command again to resume[/bold yellow]")
+        
+        summary = {
+            "profiles": len(profiles),
+            "succeeded": len(latencies),
+            "failed": failures,
+            "done_total": counts["done"],
+            "outstanding": remaining,
+            "wall_seconds": round(wall_time, 2),
+            "plans_per_minute": round(len(latencies) / wall_time * 60, 2) if wall_time else 0.0,
+            "p50_latency_seconds": round(_percentile(latencies, 50), 2),
+            "p95_latency_seconds": round(_percentile(latencies, 95), 2),
+            "output_path": output_path,
+            "journal_path": str(journal.path)
+        }
+        if self.cache is not None:
+            summary.update({f"cache_{k}": v for k, v in self.cache.stats().items()})
+        if self.semantic_cache is not None:
+            summary.update({f"semantic_{k}": v for k, v in self.semantic_cache.stats().items()})
+        summary.update({f"pool_{k}": v for k, v in self.clients.stats().items()})
+        if model == "auto":
+            router_stats = self.router.stats()
+            summary.update({f"router_{k}": v for k, v in router_stats.items() if k != "models"})
+        logger.info(f"Batch run complete: {summary}")
+        
+        from rich.table import Table
+        table = Table(title="Batch Generation Summary")
+        table.add_column("Metric", style="cyan")
+        table.add_column("Value", style="green")
+        for key, value in summary.items():
+            table.add_row(key.replace('_', ' ').title(), str(value))
+        console.print(table)
+        if model == "auto":
+            self.display_router_stats()
+        
+        return summary
+
+    @traced("visualize")
+    def visualize_study_schedule(self, plan_text, output_path=None, student_name=None):
+        """Create a visualization of the weekly study schedule parsed from the plan"""
+        try:
+            schedule = plan_text if isinstance(plan_text, StudySchedule) else parse_weekly_schedule(plan_text)
+            if schedule.is_empty():
+                logger.warning("No weekly schedule found in plan; visualization will be empty")
             
-            # Save the figure
-            os.makedirs('visualizations', exist_ok=True)
-            plt.savefig('visualizations/study_schedule.png')
-            plt.close()
+            if not output_path:
+                prefix = f"{safe_filename(student_name)}_" if student_name else ""
+                output_path = f"visualizations/{prefix}study_schedule.png"
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
             
-            return 'visualizations/study_schedule.png'
+            # The renderer keeps its figure between calls, so repeated plots skip layout
+            if self._renderer is None:
+                self._renderer = ScheduleRenderer()
+            title = f"Weekly Study Schedule - {student_name}" if student_name else None
+            return self._renderer.render(schedule, output_path, title)
         except Exception as e:
             logger.error(f"Error creating visualization: {e}")
             return None
 
-    def save_study_plan(self, student_name, study_plan, format_type="txt"):
-        """Save the generated study plan to a file"""
+    def display_router_stats(self):
+        """Show the router's rolling per-model latency and error statistics"""
+        from rich.table import Table
+        table = Table(title="Model Router")
+        table.add_column("Model", style="cyan")
+        table.add_column("Calls", justify="right")
+        table.add_column("Error Rate", justify="right", style="red")
+        table.add_column("p50 (s)", justify="right", style="green")
+        table.add_column("p95 (s)", justify="right", style="green")
+        table.add_column("Latency Histogram", style="yellow")
+        for name, stats in self.router.stats()["models"].items():
+            table.add_row(
+                name,
+                str(stats["calls"]),
+                f"{stats['error_rate']:.0%}",
+                str(stats["p50_seconds"]),
+                str(stats["p95_seconds"]),
+                " ".join(f"{bucket[3:]}:{count}" for bucket, count in stats["histogram"].items())
+            )
+        console.print(table)
+    
+    def display_token_report(self, student_profile, model=None):
+        """Show per-field and per-template prompt token counts for a profile"""
+        from rich.table import Table
+        model = model or self.config.get("default_model", "gpt-4-turbo")
+        
+        # Report the templates exactly as _prepare_prompt would send them
+        weekly_schedule = self.local_schedule(student_profile)
+        extra_inputs = {"weekly_schedule": weekly_schedule} if weekly_schedule else None
+        reports = {}
+        for variant, template_name in STUDY_PLAN_TEMPLATE_VARIANTS.items():
+            if weekly_schedule:
+                template_name = f"scheduled_{template_name}"
+            template = _PROMPT_TEMPLATES[template_name][1]
+            reports[variant] = fit_profile_to_budget(student_profile, template, self.token_budget, model, extra_inputs)[2]
+        
+        table = Table(title=f"Profile Tokens ({model})")
+        table.add_column("Field", style="cyan")
+        table.add_column("Tokens", justify="right", style="green")
+        table.add_column("Fitted", justify="right", style="yellow")
+        fitted_tokens = reports[self.prompt_template]["field_tokens"]
+        for field in PROFILE_FIELDS:
+            table.add_row(
+                PROFILE_FIELD_LABELS[field],
+                str(count_tokens(str(student_profile.get(field, "")), model)),
+                str(fitted_tokens[field])
+            )
+        console.print(table)
+        
+        table = Table(title=f"Prompt Templates (budget: {self.token_budget or 'none'})")
+        table.add_column("Template", style="cyan")
+        table.add_column("Static Prefix", justify="right", style="green")
+        table.add_column("Static Total", justify="right", style="green")
+        table.add_column("Profile", justify="right", style="green")
+        table.add_column("Schedule", justify="right", style="green")
+        table.add_column("Total", justify="right", style="bold green")
+        table.add_column("Shortened Fields", style="yellow")
+        for variant, stats in reports.items():
+            table.add_row(
+                variant + (" *" if variant == self.prompt_template else ""),
+                str(stats["prefix_tokens"]),
+                str(stats["static_tokens"]),
+                str(stats["profile_tokens"]),
+                str(stats["extra_tokens"]) if weekly_schedule else "-",
+                str(stats["prompt_tokens"]),
+                ", ".join(stats["truncated_fields"]) or "-"
+            )
+        console.print(table)
+    
+    def display_schedule_summary(self, schedule):
+        """Print weekly hours per subject for a parsed schedule"""
+        from rich.table import Table
+        table = Table(title="Weekly Hours by Subject")
+        table.add_column("Subject", style="cyan")
+        table.add_column("Hours", justify="right", style="green")
+        for subject, hours in sorted(schedule.hours_by_subject().items(), key=lambda item: -item[1]):
+            table.add_row(subject, str(hours))
+        console.print(table)
+
+    @property
+    def archive(self):
+        """The plan archive, opened on first use"""
+        if self._archive is None:
+            output_dir = self.config.get("output_dir", "study_plans")
+            self._archive = PlanArchive(self.config.get("archive_path") or f"{output_dir}/plans.db")
+        return self._archive
+    
+    @property
+    def index(self):
+        """Keyword/similarity search index over the plan archive, opened on first use"""
+        if self._index is None:
+            self._index = PlanIndex(self.archive, dim=self.config.get("search_vector_dim", 512))
+        return self._index
+    
+    def _plan_filename(self, student_name, format_type="txt"):
+        """Build a timestamped output path for a student's plan, creating the output directory"""
         # Create directory if it doesn't exist
         output_dir = self.config.get("output_dir", "study_plans")
         os.makedirs(output_dir, exist_ok=True)
         
         # Generate filename based on student name and timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = "".join([c if c.isalnum() else "_" for c in student_name])
-        filename = f"{output_dir}/{safe_name}_study_plan_{timestamp}.{format_type}"
+        return f"{output_dir}/{safe_filename(student_name)}_study_plan_{timestamp}.{format_type}"
+
+    @traced("save")
+    def save_study_plan(self, student_name, study_plan, format_type="txt", filename=None,
+                        student_profile=None, model=None, temperature=None, generation_seconds=None):
+        """Save the generated study plan to the plan archive, or to a file
+
+        Plans go to the archive when plan_storage is "archive" and no filename
+        is given; the return value is then "<archive path>#<plan id>".
+        """
+        tracer.annotate(storage="archive" if not filename and self.plan_storage == "archive" else "file", format=format_type)
+        if not filename and self.plan_storage == "archive":
+            plan_id = self.archive.add(
+                student_name,
+                extract_plan_text(study_plan),
+                student_profile=student_profile,
+                model=(study_plan.get("model") if isinstance(study_plan, dict) else None) or model,
+                temperature=temperature,
+                generation_seconds=generation_seconds
+            )
+            console.print(f"[bold green]Study plan archived as #{plan_id} in {self.archive.path}[/bold green]")
+            return f"{self.archive.path}#{plan_id}"
+        
+        if not filename:
+            filename = self._plan_filename(student_name, format_type)
         
         with open(filename, "w") as f:
-          if isinstance(study_plan, dict):
-            f.write(json.dumps(study_plan, indent=4))
-          else:
-            f.write(str(study_plan))
+            f.write(format_plan(study_plan, format_type, student_name))
         
         console.print(f"[bold green]Study plan saved to {filename}[/bold green]")
         return filename
 
-    def run(self):
-        """Run the study plan generator"""
+    @traced("headless")
+    def run_headless(self, student_profile, api_key=None, model=None, temperature=None,
+                     output_path=None, format_type=None, visualize=False, stream=False):
+        """Generate, save and optionally visualize one plan without any prompts
+
+        Intended for schedulers and worker pools: nothing reads from stdin and
+        failures are logged and surfaced as a non-zero exit status.
+        """
+        api_key = self.get_api_key(api_key)
+        if temperature is None:
+            temperature = self.config.get("temperature", 0.7)
+        # An explicit format with archive storage archives the plan and exports that file as well
+        export = bool(format_type) and not output_path and not stream and self.plan_storage == "archive"
+        if not format_type:
+            format_type = Path(output_path).suffix.lstrip(".") if output_path else "txt"
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        elif stream or self.plan_storage != "archive":
+            # Streaming writes to a file as tokens arrive; everything else can go to the archive
+            output_path = self._plan_filename(student_profile["student_name"], format_type)
+        
+        try:
+            if stream:
+                study_plan = self.stream_study_plan(api_key, model, student_profile, temperature, output_path=output_path)
+                console.print(f"[bold green]Study plan saved to {output_path}[/bold green]")
+            else:
+                start = time.perf_counter()
+                study_plan = self.generate_study_plan(api_key, model, student_profile, temperature)
+                output_path = self.save_study_plan(
+                    student_profile["student_name"], study_plan, format_type, filename=output_path,
+                    student_profile=student_profile, model=model, temperature=temperature,
+                    generation_seconds=round(time.perf_counter() - start, 3)
+                )
+                if export:
+                    output_path = self.save_study_plan(
+                        student_profile["student_name"], study_plan, format_type,
+                        filename=self._plan_filename(student_profile["student_name"], format_type)
+                    )
+            
+            if visualize:
+                viz_path = self.visualize_study_schedule(study_plan, student_name=student_profile["student_name"])
+                if viz_path:
+                    console.print(f"[bold green]Visualization saved to {viz_path}[/bold green]")
+        except Exception as e:
+            logger.error(f"Headless generation failed for {student_profile.get('student_name')}: {e}")
+            console.print(f"[bold red]Error generating study plan: {e}[/bold red]")
+            raise SystemExit(1)
+        
+        return output_path
+
+    def run(self, stream=False, api_key=None, model=None, temperature=None):
+        """Run the study plan generator interactively
+
+        Any of api_key, model or temperature supplied up front (from the
+        command line) skips the corresponding prompt.
+        """
+        from rich.panel import Panel
         console.print(Panel.fit(
             "[bold cyan]Personalized Study Plan Generator[/bold cyan]\n"
             "Using LangChain with OpenRouter",
@@ -456,68 +4544,651 @@ class StudyPlanGenerator:
         ))
         
         # Get API key (uses the provided one)
-        api_key = self.get_api_key()
+        api_key = self.get_api_key(api_key)
         
         # Get model selection
-        model = self.get_model_selection()
+        if not model:
+            model = self.get_model_selection()
         
         # Get temperature setting
-        temp_input = console.input("[bold yellow]Enter temperature setting (0.0-1.0, default: 0.7): [/bold yellow]")
-        try:
-            temperature = float(temp_input) if temp_input else 0.7
-            if not 0 <= temperature <= 1:
+        if temperature is None:
+            temp_input = console.input("[bold yellow]Enter temperature setting (0.0-1.0, default: 0.7): [/bold yellow]")
+            try:
+                temperature = float(temp_input) if temp_input else 0.7
+                if not 0 <= temperature <= 1:
+                    console.print("[bold red]Invalid temperature value. Using default 0.7.[/bold red]")
+                    temperature = 0.7
+            except ValueError:
                 console.print("[bold red]Invalid temperature value. Using default 0.7.[/bold red]")
                 temperature = 0.7
-        except ValueError:
-            console.print("[bold red]Invalid temperature value. Using default 0.7.[/bold red]")
-            temperature = 0.7
         
         # Collect student information
         student_profile = self.collect_student_info()
         
         # Generate the study plan
-        study_plan = self.generate_study_plan(
-            api_key=api_key,
-            model=model,
-            student_profile=student_profile,
-            temperature=temperature
-        )
+        if stream:
+            # Tokens are printed and written to disk as they arrive
+            console.print("\n[bold green]===== PERSONALIZED STUDY PLAN =====[/bold green]\n")
+            filename = self._plan_filename(student_profile["student_name"], "md")
+            study_plan = self.stream_study_plan(
+                api_key=api_key,
+                model=model,
+                student_profile=student_profile,
+                temperature=temperature,
+                output_path=filename
+            )
+            console.print(f"[bold green]Study plan saved to {filename}[/bold green]")
+        else:
+            start = time.perf_counter()
+            study_plan = self.generate_study_plan(
+                api_key=api_key,
+                model=model,
+                student_profile=student_profile,
+                temperature=temperature
+            )
+            generation_seconds = round(time.perf_counter() - start, 3)
+        
+        if self.cache is not None:
+            logger.info(f"Plan cache stats: {self.cache.stats()}")
+        if self.semantic_cache is not None:
+            logger.info(f"Semantic cache stats: {self.semantic_cache.stats()}")
+        logger.info(f"LLM client pool stats: {self.clients.stats()}")
         
-        # Print the study plan
-        console.print("\n[bold green]===== PERSONALIZED STUDY PLAN =====[/bold green]\n")
-        console.print(study_plan)
+        if not stream:
+            # Print the study plan
+            console.print("\n[bold green]===== PERSONALIZED STUDY PLAN =====[/bold green]\n")
+            console.print(study_plan)
         
         # Save options
-        save_option = console.input("\n[bold yellow]Would you like to save the study plan? (y/n): [/bold yellow]").lower()
+        save_option = 'n' if stream else console.input("\n[bold yellow]Would you like to save the study plan? (y/n): [/bold yellow]").lower()
         if save_option == 'y':
-            format_options = ["txt", "md", "html"]
-            format_choice = console.input(f"[bold yellow]Choose format {format_options} (default: txt): [/bold yellow]").lower()
-            
-            if format_choice not in format_options:
-                format_choice = "txt"
+            format_choice = "txt"
+            if self.plan_storage != "archive":
+                format_options = ["txt", "md", "html"]
+                format_choice = console.input(f"[bold yellow]Choose format {format_options} (default: txt): [/bold yellow]").lower()
+                
+                if format_choice not in format_options:
+                    format_choice = "txt"
                 
-            self.save_study_plan(student_profile["student_name"], study_plan, format_choice)
+            self.save_study_plan(
+                student_profile["student_name"], study_plan, format_choice,
+                student_profile=student_profile, model=model, temperature=temperature,
+                generation_seconds=generation_seconds
+            )
         
         # Visualization option
         viz_option = console.input("\n[bold yellow]Would you like to generate a visual schedule? (y/n): [/bold yellow]").lower()
         if viz_option == 'y':
-            viz_path = self.visualize_study_schedule(study_plan)
+            schedule = parse_weekly_schedule(study_plan)
+            viz_path = self.visualize_study_schedule(schedule, student_name=student_profile["student_name"])
             if viz_path:
                 console.print(f"[bold green]Visualization saved to {viz_path}[/bold green]")
+                self.display_schedule_summary(schedule)
+
+def archived_plan_text(generator, student_or_id, at=None):
+    """Look up a plan in the generator's archive by "#<id>" or student name (latest, or in effect at `at`)"""
+    if student_or_id.startswith("#"):
+        record = generator.archive.get(int(student_or_id[1:]))
+    else:
+        timestamp = datetime.fromisoformat(at).timestamp() if at else None
+        record = generator.archive.find(student_or_id, timestamp)
+    if record is None:
+        raise SystemExit(f"No archived plan found for {student_or_id}")
+    return record["study_plan"]
+
+def run_archive_command(generator, args):
+    """Handle the --archive-* command-line actions"""
+    archive = generator.archive
+    if args.archive_import:
+        start = time.perf_counter()
+        count = archive.import_directory(args.archive_import)
+        console.print(f"[bold green]Imported {count} plans into {archive.path} in {time.perf_counter() - start:.1f}s[/bold green]")
+    if args.archive_export:
+        count = archive.export(args.archive_export, args.format or "txt", args.student)
+        console.print(f"[bold green]Exported {count} plans to {args.archive_export}[/bold green]")
+    if args.archive_list:
+        from rich.table import Table
+        table = Table(title=f"Plan Archive ({archive.path})")
+        for column in ("ID", "Student", "Created", "Model", "Seconds", "Characters"):
+            table.add_column(column)
+        for record in archive.iter_plans(args.student, with_content=False):
+            table.add_row(
+                str(record["id"]),
+                record["student_name"],
+                datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+                record["model"] or "-",
+                str(record["generation_seconds"] or "-"),
+                str(record["plan_chars"])
+            )
+        console.print(table)
+        console.print(archive.stats())
+    if args.archive_show:
+        console.print(archived_plan_text(generator, args.archive_show, args.at), markup=False, highlight=False)
+    if args.index_update:
+        start = time.perf_counter()
+        count = generator.index.update()
+        console.print(f"[bold green]Indexed {count} new plans in {time.perf_counter() - start:.1f}s[/bold green]")
+    if args.search or args.similar_to:
+        from rich.table import Table
+        generator.index.update()
+        query = args.search or profile_search_text(load_student_profiles(args.similar_to)[0])
+        start = time.perf_counter()
+        results = generator.index.search(query, args.top, args.search_mode)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        table = Table(title=f"Matching Plans ({args.search_mode}, {elapsed_ms:.1f} ms)")
+        for column in ("ID", "Student", "Created", "Model", "Score"):
+            table.add_column(column)
+        for record in results:
+            table.add_row(
+                str(record["id"]),
+                record["student_name"],
+                datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M"),
+                record["model"] or "-",
+                str(record["score"])
+            )
+        console.print(table)
+
+# Lazily imported dependencies, in the order a full generation run needs them
+STARTUP_PROFILE_MODULES = [
+    "yaml",
+    "rich.console",
+    "asyncio",
+    "numpy",
+    "matplotlib.figure",
+    "langchain.prompts",
+    "langchain.chains",
+    "langchain_openai"
+]
+
+def profile_startup():
+    """Report how long this module and each deferred dependency take to import"""
+    rows = [("main.py module body", _MODULE_LOAD_SECONDS, "")]
+    for module_name in STARTUP_PROFILE_MODULES:
+        if module_name in sys.modules:
+            rows.append((module_name, 0.0, "already imported"))
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            note = ""
+        except ImportError as e:
+            note = f"not installed ({e.name})"
+        rows.append((module_name, time.perf_counter() - start, note))
+    
+    # rich is imported (and measured) above before it is used for the report
+    from rich.table import Table
+    table = Table(title="Import Time Breakdown")
+    table.add_column("Module", style="cyan")
+    table.add_column("ms", justify="right", style="green")
+    table.add_column("Note", style="yellow")
+    for module_name, seconds, note in rows:
+        table.add_row(module_name, f"{seconds * 1000:.1f}", note)
+    console.print(table)
+    console.print(f"[bold]Fast path (--help, config-only): {rows[0][1] * 1000:.1f} ms; "
+                  f"full generation path: {sum(row[1] for row in rows) * 1000:.1f} ms[/bold]")
+    console.print("For a per-module tree run: python -X importtime main.py --help")
+
+def _benchmark_row(name, latencies, seconds, **settings):
+    """Summarise one benchmark stage: throughput, latency percentiles and peak RSS so far
+
+    peak_rss_mb is None where the resource module is unavailable (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        peak_mb = None
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak_mb = round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    return {
+        "name": name,
+        **settings,
+        "ops": len(latencies),
+        "seconds": round(seconds, 4),
+        "throughput_per_second": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": peak_mb
+    }
+
+def _time_each(items, operation):
+    """Run operation on every item, returning (per-item latencies, total seconds)
+
+    One untimed call first keeps lazy imports and first-use setup out of the numbers.
+    """
+    if items:
+        operation(items[0])
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        item_start = time.perf_counter()
+        operation(item)
+        latencies.append(time.perf_counter() - item_start)
+    return latencies, time.perf_counter() - start
+
+def run_benchmarks(generator, profile_counts=(10, 100), concurrency_levels=(1, 8, 32),
+                   ttft=0.05, tokens_per_second=2000.0, viz_limit=50, output_path=None):
+    """Benchmark the generation pipeline against the fake chat model and save the results as JSON
+
+    Covers prompt rendering, batch generation for every profile count and
+    concurrency level, saving to the archive and to files, schedule and
+    section parsing, and visualize_study_schedule. Caches are disabled and
+    all output goes to a temporary directory. Returns the results dict.
+    """
+    import asyncio
+    import platform
+    import subprocess
+    import tempfile
+    
+    generator.use_fake_llm(ttft, tokens_per_second)
+    generator.cache = None
+    generator.semantic_cache = None
+    model = generator.config.get("default_model", "gpt-4-turbo")
+    profiles = synthetic_profiles(max(profile_counts))
+    rows = []
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        generator.config["output_dir"] = work_dir
+        generator.config["archive_path"] = os.path.join(work_dir, "plans.db")
+        generator._archive = None
+        generator.plan_storage = "files"
+        
+        latencies, seconds = _time_each(profiles, lambda profile: generator._prepare_prompt(profile, model))
+        rows.append(_benchmark_row("render_prompt", latencies, seconds, profiles=len(profiles)))
+        
+        # Warm up the chain, client and event-loop machinery once
+        asyncio.run(generator._generate_batch(profiles[:1], "benchmark", model, 0.7, os.path.join(work_dir, "warmup.jsonl"), 1))
+        for count in profile_counts:
+            for concurrency in concurrency_levels:
+                batch_path = os.path.join(work_dir, f"batch_{count}_{concurrency}.jsonl")
+                start = time.perf_counter()
+                latencies, failures = asyncio.run(generator._generate_batch(
+                    profiles[:count], "benchmark", model, 0.7, batch_path, concurrency
+                ))
+                rows.append(_benchmark_row(
+                    "generate", latencies, time.perf_counter() - start,
+                    profiles=count, concurrency=concurrency, failures=failures
+                ))
+                console.print(f"generate: {count} profiles at concurrency {concurrency} done")
+        with open(batch_path, 'r') as f:
+            plans = [(record["student_name"], record["study_plan"]) for record in map(json.loads, f) if record["status"] == "ok"]
+        
+        # Saving prints one line per plan; keep it out of the report
+        console.begin_capture()
+        try:
+            generator.plan_storage = "archive"
+            latencies, seconds = _time_each(plans, lambda plan: generator.save_study_plan(plan[0], plan[1]))
+            rows.append(_benchmark_row("save_archive", latencies, seconds, profiles=len(plans)))
+            generator.plan_storage = "files"
+            for format_type in ("md", "html"):
+                latencies, seconds = _time_each(plans, lambda plan: generator.save_study_plan(plan[0], plan[1], format_type))
+                rows.append(_benchmark_row(f"save_{format_type}", latencies, seconds, profiles=len(plans)))
+        finally:
+            console.end_capture()
+        
+        latencies, seconds = _time_each(plans, lambda plan: parse_plan_sections(plan[1]))
+        rows.append(_benchmark_row("parse_sections", latencies, seconds, profiles=len(plans)))
+        latencies, seconds = _time_each(plans, lambda plan: parse_weekly_schedule(plan[1]))
+        rows.append(_benchmark_row("parse_schedule", latencies, seconds, profiles=len(plans)))
+        
+        viz_dir = os.path.join(work_dir, "viz")
+        latencies, seconds = _time_each(
+            plans[:viz_limit],
+            lambda plan: generator.visualize_study_schedule(plan[1], os.path.join(viz_dir, f"{safe_filename(plan[0])}.png"))
+        )
+        rows.append(_benchmark_row("visualize", latencies, seconds, profiles=len(latencies)))
+        
+        if generator._archive is not None:
+            generator._archive.close()
+            generator._archive = None
+    
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "profile_counts": list(profile_counts),
+            "concurrency_levels": list(concurrency_levels),
+            "fake_ttft": ttft,
+            "fake_tokens_per_second": tokens_per_second,
+            "model": model
+        },
+        "results": rows
+    }
+    
+    if not output_path:
+        os.makedirs("benchmarks", exist_ok=True)
+        output_path = f"benchmarks/benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    console.print(f"[bold green]Benchmark results saved to {output_path}[/bold green]")
+    return results
+
+def display_benchmark_results(results, baseline=None, tolerance=0.1):
+    """Print benchmark rows, with throughput/p95 change against a baseline run when given
+
+    Rows whose throughput dropped or whose p95 latency grew by more than
+    `tolerance` are marked as regressions. Returns the regressed row labels.
+    """
+    from rich.table import Table
+    
+    def label(row):
+        settings = [f"{key}={row[key]}" for key in ("profiles", "concurrency") if key in row]
+        return f"{row['name']} ({', '.join(settings)})"
+    
+    previous = {label(row): row for row in (baseline or {}).get("results", [])}
+    title = "Benchmark Results" + (f" vs {baseline.get('git_commit') or baseline.get('timestamp')}" if baseline else "")
+    table = Table(title=title)
+    for column in ("Benchmark", "Ops/s", "p50 ms", "p95 ms", "p99 ms", "Peak RSS MB"):
+        table.add_column(column, justify="left" if column == "Benchmark" else "right")
+    if baseline:
+        table.add_column("Ops/s Δ", justify="right")
+        table.add_column("p95 Δ", justify="right")
+    
+    regressions = []
+    for row in results["results"]:
+        cells = [label(row), f"{row['throughput_per_second']:.1f}", f"{row['p50_ms']:.2f}",
+                 f"{row['p95_ms']:.2f}", f"{row['p99_ms']:.2f}",
+                 "-" if row["peak_rss_mb"] is None else f"{row['peak_rss_mb']:.0f}"]
+        old = previous.get(label(row))
+        if baseline and old:
+            throughput_change = (row["throughput_per_second"] / old["throughput_per_second"] - 1) if old["throughput_per_second"] else 0.0
+            p95_change = (row["p95_ms"] / old["p95_ms"] - 1) if old["p95_ms"] else 0.0
+            regressed = throughput_change < -tolerance or p95_change > tolerance
+            if regressed:
+                regressions.append(label(row))
+            style = "red" if regressed else "green"
+            cells += [f"[{style}]{throughput_change:+.0%}[/{style}]", f"[{style}]{p95_change:+.0%}[/{style}]"]
+        elif baseline:
+            cells += ["new", "new"]
+        table.add_row(*cells)
+    console.print(table)
+    if regressions:
+        console.print(f"[bold red]Regressions beyond {tolerance:.0%}: {', '.join(regressions)}[/bold red]")
+    return regressions
+
+def finish_tracing(metrics_file=None):
+    """Write collected metrics to `metrics_file` (Prometheus text) and close the trace file"""
+    if metrics_file:
+        Path(metrics_file).parent.mkdir(parents=True, exist_ok=True)
+        Path(metrics_file).write_text(tracer.metrics.render(), encoding="utf-8")
+        logger.info(f"Metrics written to {metrics_file}")
+    tracer.close()
 
 def main():
     """Main function to run the script"""
     parser = argparse.ArgumentParser(description="Generate personalized study plans using LangChain and OpenRouter")
-    parser.add_argument("--model", help="Model name to use")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import-time breakdown of the CLI and exit")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark the pipeline against a fake LLM, save JSON results and exit")
+    parser.add_argument("--bench-profiles", default="10,100", help="Comma-separated profile counts for --benchmark")
+    parser.add_argument("--bench-concurrency", default="1,8,32", help="Comma-separated concurrency levels for --benchmark")
+    parser.add_argument("--bench-output", help="JSON file for --benchmark results (default: benchmarks/benchmark_<timestamp>.json)")
+    parser.add_argument("--bench-compare", metavar="BASELINE_JSON", help="Compare --benchmark results against an earlier run (exit 1 on regression)")
+    parser.add_argument("--fake-llm", action="store_true", help="Answer with a local fake chat model instead of OpenRouter (no network, no cost)")
+    parser.add_argument("--fake-ttft", type=float, default=0.05, help="Fake model time to first token in seconds")
+    parser.add_argument("--fake-tps", type=float, default=2000.0, help="Fake model output tokens per second")
+    parser.add_argument("--trace", nargs="?", const="traces/trace.jsonl", metavar="PATH", help="Record spans as JSON lines (default: traces/trace.jsonl)")
+    parser.add_argument("--metrics-file", metavar="PATH", help="Write Prometheus metrics for this run to PATH at exit")
+    parser.add_argument("--model", help="Model name to use (\"auto\" picks one per request)")
     parser.add_argument("--api-key", help="API key for OpenRouter")
     parser.add_argument("--sample", action="store_true", help="Use sample student profile")
-    parser.add_argument("--temp", type=float, default=0.7, help="Temperature setting (0.0-1.0)")
+    parser.add_argument("--temp", type=float, help="Temperature setting (0.0-1.0, default from config)")
+    parser.add_argument("--profile", "--input", dest="profile", metavar="PROFILE_FILE", help="Student profile file (JSON/JSONL/CSV); runs without prompts")
+    parser.add_argument("--output", help="Where to write the plan in non-interactive mode")
+    parser.add_argument("--format", choices=["txt", "md", "html"], help="Plan file format in non-interactive mode; with plan_storage: archive the plan is also exported in this format")
+    parser.add_argument("--viz", action=argparse.BooleanOptionalAction, help="Render the weekly schedule (--no-viz to skip)")
+    parser.add_argument("--batch", metavar="PROFILES", help="Generate plans for every profile in a JSONL/CSV file")
+    parser.add_argument("--batch-output", help="JSONL file for batch results (default: <output_dir>/batch_<timestamp>.jsonl)")
+    parser.add_argument("--journal", metavar="PATH", help="Job journal for --batch; rerunning with the same journal resumes (default: one per input file, model and temperature)")
+    parser.add_argument("--restart", action="store_true", help="With --batch, discard the job journal and generate every profile again")
+    parser.add_argument("--concurrency", type=int, help="Maximum concurrent LLM requests in batch mode")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk plan cache")
+    parser.add_argument("--refresh-cache", action="store_true", help="Regenerate plans and overwrite cached entries")
+    parser.add_argument("--no-semantic-cache", action="store_true", help="Do not reuse plans generated for near-identical profiles")
+    parser.add_argument("--semantic-threshold", type=float, help="Cosine similarity a profile needs to reuse a cached plan (default 0.95)")
+    parser.add_argument("--semantic-mode", choices=["edit", "template"], help="Regenerate sections for differing fields (edit) or reuse the similar plan as is (template); template falls back to edit unless only the name differs")
+    parser.add_argument("--clear-cache", action="store_true", help="Delete all cached plans and exit")
+    parser.add_argument("--stream", action="store_true", help="Stream the plan to the console and to disk as it is generated")
+    parser.add_argument("--engine", choices=["monolithic", "sectioned"], help="Generate the plan in one call or as concurrent per-section calls")
+    parser.add_argument("--storage", choices=["archive", "files"], help="Save plans to the plan archive or as one file each")
+    parser.add_argument("--archive", metavar="DB", help="Plan archive path (default: archive_path from config)")
+    parser.add_argument("--archive-import", metavar="DIR", help="Add every saved plan file under DIR to the archive and exit")
+    parser.add_argument("--archive-export", metavar="DIR", help="Write archived plans to DIR as --format files and exit")
+    parser.add_argument("--archive-list", action="store_true", help="List archived plans (optionally --student) and exit")
+    parser.add_argument("--archive-show", metavar="STUDENT_OR_ID", help="Print an archived plan (latest for a student, or #ID) and exit")
+    parser.add_argument("--student", help="Limit --archive-list/--archive-export to one student")
+    parser.add_argument("--at", help="With --archive-show, the plan in effect at this time (YYYY-MM-DD[ HH:MM])")
+    parser.add_argument("--search", metavar="QUERY", help="Search archived plans by keywords and similarity and exit")
+    parser.add_argument("--similar-to", metavar="PROFILE_FILE", help="Find archived plans for students like this profile and exit")
+    parser.add_argument("--search-mode", choices=["hybrid", "keyword", "vector"], default="hybrid", help="Ranking for --search/--similar-to")
+    parser.add_argument("--top", type=int, default=10, help="Number of results for --search/--similar-to")
+    parser.add_argument("--index-update", action="store_true", help="Index plans added to the archive since the last update and exit")
+    parser.add_argument("--latency-slo", type=float, metavar="SECONDS", help="With --model auto, prefer models expected to finish within this time")
+    parser.add_argument("--max-cost", type=float, metavar="USD", help="With --model auto, skip models whose estimated cost per plan exceeds this")
+    parser.add_argument("--hedge-after", type=float, metavar="SECONDS", help="With --model auto, race a second (faster) model if the first has not answered in time")
+    parser.add_argument("--prompt-template", choices=list(STUDY_PLAN_TEMPLATE_VARIANTS), help="Study plan prompt variant (cacheable/compact put the profile after a static prefix)")
+    parser.add_argument("--token-budget", type=int, help="Shorten low-priority profile fields so the prompt fits this many tokens")
+    parser.add_argument("--count-tokens", action="store_true", help="Show prompt token counts for --profile (or the sample profile) and exit")
+    parser.add_argument("--parse-schedule", metavar="PLAN_FILE", help="Extract the Weekly Master Schedule from a saved plan and summarize it")
+    parser.add_argument("--schedule-csv", help="With --parse-schedule or --optimize-schedule, also export the schedule blocks as CSV")
+    parser.add_argument("--schedule", choices=["local", "llm"], help="Compute the Weekly Master Schedule locally and have the model only explain it, or let the model write it")
+    parser.add_argument("--optimize-schedule", action="store_true", help="Compute the weekly schedule for --profile (or the sample profile) locally, print it and exit")
+    parser.add_argument("--render-schedules", metavar="SOURCE", help="Render schedules for every plan in a directory or batch results JSONL")
+    parser.add_argument("--viz-dir", default="visualizations", help="Output directory for --render-schedules")
+    parser.add_argument("--viz-format", choices=["png", "svg", "npy"], default="png", help="Output format for --render-schedules (png and svg are drawn straight from the grid; npy is the raw grid)")
+    parser.add_argument("--processes", type=int, help="Worker processes for --render-schedules")
+    parser.add_argument("--serve", action="store_true", help="Run the HTTP job service (POST /jobs, GET /jobs/<id>[/stream], GET /metrics)")
+    parser.add_argument("--stub-openai", action="store_true", help="Run a local OpenAI-compatible stub server for testing")
+    parser.add_argument("--stub-rate-limit", type=int, default=0, metavar="N", help="With --stub-openai, answer every Nth request with 429")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address for --serve/--stub-openai")
+    parser.add_argument("--port", type=int, default=8000, help="Port for --serve/--stub-openai")
+    parser.add_argument("--base-url", help="OpenAI-compatible API base URL (default: openrouter_api_base from config)")
+    parser.add_argument("--update-plan", metavar="PLAN_FILE", help="Regenerate only the sections of a saved plan affected by profile changes")
+    parser.add_argument("--old-profile", help="Profile (JSON) the saved plan was generated from")
+    parser.add_argument("--new-profile", help="Updated profile (JSON) to regenerate stale sections for")
     
     args = parser.parse_args()
     
+    if args.temp is not None and not 0 <= args.temp <= 1:
+        parser.error("--temp must be between 0.0 and 1.0")
+    
+    if args.profile_startup:
+        profile_startup()
+        return
+    
+    if args.stub_openai:
+        import asyncio
+        console.print(f"[bold green]Stub OpenAI server on http://{args.host}:{args.port}/v1[/bold green]")
+        asyncio.run(StubOpenAIServer(rate_limit_every=args.stub_rate_limit).serve(args.host, args.port))
+        return
+    
     # Create and run the generator
     generator = StudyPlanGenerator()
-    generator.run()
+    metrics_file = args.metrics_file or generator.config.get("metrics_file")
+    if args.trace or metrics_file or args.serve:
+        tracer.enable(args.trace or generator.config.get("trace_file"))
+    if tracer.enabled:
+        import atexit
+        atexit.register(finish_tracing, metrics_file)
+    if args.fake_llm:
+        generator.use_fake_llm(args.fake_ttft, args.fake_tps)
+    if args.benchmark:
+        results = run_benchmarks(
+            generator,
+            profile_counts=[int(n) for n in args.bench_profiles.split(",")],
+            concurrency_levels=[int(n) for n in args.bench_concurrency.split(",")],
+            ttft=args.fake_ttft,
+            tokens_per_second=args.fake_tps,
+            output_path=args.bench_output
+        )
+        baseline = None
+        if args.bench_compare:
+            with open(args.bench_compare, 'r') as f:
+                baseline = json.load(f)
+        if display_benchmark_results(results, baseline):
+            raise SystemExit(1)
+        return
+    if args.base_url:
+        generator.config["openrouter_api_base"] = args.base_url
+    if args.clear_cache:
+        if generator.cache is not None:
+            generator.cache.clear()
+        if generator.semantic_cache is not None:
+            generator.semantic_cache.clear()
+        console.print("[bold green]Plan cache cleared[/bold green]")
+        return
+    if args.no_cache or args.no_semantic_cache:
+        generator.semantic_cache = None
+    if args.no_cache:
+        generator.cache = None
+    if generator.semantic_cache is not None and args.semantic_threshold:
+        generator.semantic_cache.threshold = args.semantic_threshold
+    if args.semantic_mode:
+        generator.semantic_cache_mode = args.semantic_mode
+    generator.refresh_cache = args.refresh_cache
+    if args.engine:
+        generator.engine = args.engine
+    if args.latency_slo:
+        generator.router.latency_slo = args.latency_slo
+    if args.max_cost is not None:
+        generator.router.max_cost = args.max_cost
+    if args.hedge_after:
+        generator.hedge_after = args.hedge_after
+    if args.storage:
+        generator.plan_storage = args.storage
+    if args.archive:
+        generator.config["archive_path"] = args.archive
+    if args.archive_import or args.archive_export or args.archive_list or args.archive_show \
+            or args.search or args.similar_to or args.index_update:
+        run_archive_command(generator, args)
+        return
+    if args.prompt_template:
+        generator.prompt_template = args.prompt_template
+    if args.token_budget:
+        generator.token_budget = args.token_budget
+    if args.schedule:
+        generator.schedule_optimizer = args.schedule == "local"
+    if args.count_tokens:
+        student_profile = load_student_profiles(args.profile)[0] if args.profile else create_sample_student_profile()
+        generator.display_token_report(student_profile, args.model)
+        return
+    if args.optimize_schedule:
+        student_profile = load_student_profiles(args.profile)[0] if args.profile else create_sample_student_profile()
+        import numpy  # noqa: F401 - keep the one-off import out of the timing below
+        start = time.perf_counter()
+        schedule = optimize_weekly_schedule(
+            student_profile,
+            block_minutes=generator.config.get("schedule_block_minutes", 45),
+            break_minutes=generator.config.get("schedule_break_minutes", 15)
+        )
+        elapsed = time.perf_counter() - start
+        console.print(format_weekly_schedule(schedule), markup=False, highlight=False)
+        generator.display_schedule_summary(schedule)
+        console.print(f"[dim]Optimized in {elapsed * 1000:.1f} ms[/dim]")
+        if args.schedule_csv:
+            schedule.to_csv(args.schedule_csv)
+            console.print(f"[bold green]Schedule exported to {args.schedule_csv}[/bold green]")
+        return
+    temperature = args.temp if args.temp is not None else generator.config.get("temperature", 0.7)
+    if args.parse_schedule:
+        schedule = parse_weekly_schedule(read_plan_file(args.parse_schedule))
+        generator.display_schedule_summary(schedule)
+        if args.schedule_csv:
+            schedule.to_csv(args.schedule_csv)
+            console.print(f"[bold green]Schedule exported to {args.schedule_csv}[/bold green]")
+        return
+    if args.render_schedules:
+        start = time.perf_counter()
+        paths = render_schedules(
+            iter_saved_plans(args.render_schedules),
+            output_dir=args.viz_dir,
+            format_type=args.viz_format,
+            processes=args.processes
+        )
+        elapsed = time.perf_counter() - start
+        console.print(f"[bold green]Rendered {len(paths)} schedules to {args.viz_dir} in {elapsed:.1f}s[/bold green]")
+        return
+    if args.update_plan:
+        if not (args.old_profile and args.new_profile):
+            parser.error("--update-plan requires --old-profile and --new-profile")
+        new_profile = load_student_profiles(args.new_profile)[0]
+        updated_plan, regenerated = generator.regenerate_plan_sections(
+            api_key=generator.get_api_key(args.api_key),
+            plan_text=read_plan_file(args.update_plan) if os.path.exists(args.update_plan) else archived_plan_text(generator, args.update_plan),
+            old_profile=load_student_profiles(args.old_profile)[0],
+            new_profile=new_profile,
+            model=args.model,
+            temperature=temperature
+        )
+        console.print(f"[bold green]Regenerated sections: {', '.join(regenerated) or 'none'}[/bold green]")
+        format_type = Path(args.update_plan).suffix.lstrip(".") or "txt"
+        generator.save_study_plan(new_profile["student_name"], updated_plan, format_type)
+        return
+    if args.serve:
+        import asyncio
+        service = PlanService(
+            generator,
+            api_key=generator.get_api_key(args.api_key),
+            queue_size=generator.config.get("service_queue_size", 100),
+            workers=generator.config.get("service_workers", 8),
+            model_concurrency=generator.config.get("service_model_concurrency", 4),
+            requests_per_minute=generator.config.get("service_requests_per_minute", 60),
+            max_retries=generator.config.get("service_max_retries", 5),
+            job_ttl=generator.config.get("service_job_ttl", 3600),
+            max_jobs=generator.config.get("service_max_jobs", 10000)
+        )
+        console.print(f"[bold green]Study plan service on http://{args.host}:{args.port}[/bold green]")
+        asyncio.run(service.serve(args.host, args.port))
+        return
+    if args.batch:
+        generator.run_batch(
+            args.batch,
+            api_key=generator.get_api_key(args.api_key),
+            model=args.model,
+            temperature=temperature,
+            output_path=args.batch_output,
+            concurrency=args.concurrency,
+            journal_path=args.journal,
+            restart=args.restart
+        )
+        return
+    
+    # Headless whenever the profile comes from the command line
+    if args.profile or args.sample or args.output:
+        if args.profile:
+            student_profile = load_student_profiles(args.profile)[0]
+        elif args.sample:
+            student_profile = create_sample_student_profile()
+        else:
+            parser.error("non-interactive runs need --profile or --sample")
+        generator.run_headless(
+            student_profile,
+            api_key=args.api_key,
+            model=args.model,
+            temperature=temperature,
+            output_path=args.output,
+            format_type=args.format,
+            visualize=bool(args.viz),
+            stream=args.stream
+        )
+        return
+    
+    generator.run(
+        stream=args.stream,
+        api_key=args.api_key,
+        model=args.model,
+        temperature=args.temp
+    )
+
+_MODULE_LOAD_SECONDS = time.perf_counter() - _MODULE_LOAD_START
 
 if __name__ == "__main__": 
     main()
@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+
+def profile(name="Jordan Lee", **fields):
+    """A complete student profile; keyword arguments override single fields"""
+    return {
+        "student_name": name,
+        "grade_level": "10th Grade",
+        "subjects": "Algebra II, Chemistry, English",
+        "academic_performance": "Algebra II (B), Chemistry (C+), English (A-)",
+        "learning_style": "Visual learner who likes worked examples",
+        "extracurricular_activities": "Soccer practice Tuesdays and Thursdays 4-6 PM",
+        "goals": "Raise the Chemistry grade to a B",
+        "challenges": "Procrastination before tests",
+        "available_study_time": "Weekdays 6:00-9:00 PM, Sundays 10 AM-1 PM",
+        "upcoming_exams": "Chemistry unit test on March 3rd",
+        "preferred_resources": "Khan Academy videos",
+        "additional_info": "",
+        "special_considerations": "",
+        **fields
+    }
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    """A StudyPlanGenerator working in a temporary directory and answering with the fake LLM"""
+    monkeypatch.chdir(tmp_path)
+    generator = main.StudyPlanGenerator()
+    generator.use_fake_llm(ttft=0.0, tokens_per_second=1e6)
+    return generator
@@ -0,0 +1,37 @@
+import main
+
+
+def test_archive_import_skips_already_imported_files(tmp_path):
+    plans = tmp_path / "plans"
+    plans.mkdir()
+    (plans / "Ana_Ruiz_20240101_120000.txt").write_text("# Plan for Ana\n")
+    archive = main.PlanArchive(tmp_path / "plans.db")
+    assert archive.import_directory(plans) == 1
+    assert archive.import_directory(plans) == 0
+    (plans / "Ben_Cole_20240102_120000.md").write_text("# Plan for Ben\n")
+    assert archive.import_directory(plans) == 1
+    assert archive.stats()["plans"] == 2
+    archive.close()
+
+
+def test_archive_finds_latest_plan_at_a_time(tmp_path):
+    archive = main.PlanArchive(tmp_path / "plans.db")
+    profile = {"student_name": "Ana Ruiz", "grade_level": "10th"}
+    first = archive.add("Ana Ruiz", "Plan one", student_profile=profile, created_at=1000.0)
+    second = archive.add("ana ruiz", "Plan two", created_at=2000.0)
+    archive.add("Ben Cole", "Other plan", created_at=1500.0)
+    assert archive.find("Ana Ruiz")["id"] == second
+    assert archive.find("ANA RUIZ", at=1999.0)["study_plan"] == "Plan one"
+    assert archive.find("Ana Ruiz", at=999.0) is None
+    assert archive.get(first)["student_profile"] == profile
+    assert [record["id"] for record in archive.iter_plans(since=1200.0, with_content=False)] == [3, second]
+    archive.close()
+
+
+def test_archive_export_writes_one_file_per_plan(tmp_path):
+    archive = main.PlanArchive(tmp_path / "plans.db")
+    archive.add("Ana Ruiz", "# Plan for Ana\n", created_at=1000.0)
+    archive.add("Ana Ruiz", "# Second plan for Ana\n", created_at=1000.0)
+    assert archive.export(tmp_path / "out", "md") == 2
+    assert sorted(path.read_text() for path in (tmp_path / "out").iterdir()) == ["# Plan for Ana\n", "# Second plan for Ana\n"]
+    archive.close()
@@ -0,0 +1,32 @@
+import json
+
+import main
+from conftest import profile
+
+
+def test_batch_summary_counts_successes_and_failures(generator, tmp_path, monkeypatch):
+    input_path = tmp_path / "cohort.jsonl"
+    input_path.write_text("".join(json.dumps(profile(name)) + "\n" for name in ("Ana Ruiz", "Ben Cole", "Cara Diaz")))
+    output_path = tmp_path / "plans.jsonl"
+    original = generator.agenerate_study_plan
+
+    async def failing(api_key, model=None, student_profile=None, temperature=0.7, **kwargs):
+        if student_profile["student_name"] == "Ben Cole":
+            raise RuntimeError("provider down")
+        return await original(api_key, model, student_profile, temperature, **kwargs)
+
+    monkeypatch.setattr(generator, "agenerate_study_plan", failing)
+    summary = generator.run_batch(str(input_path), "test-key", model="fake", output_path=str(output_path),
+                                  concurrency=2, journal_path=str(tmp_path / "cohort.journal"))
+
+    assert summary["profiles"] == 3
+    assert summary["succeeded"] == 2
+    assert summary["failed"] == 1
+    assert summary["outstanding"] == 1
+    assert summary["output_path"] == str(output_path)
+    records = {record["student_name"]: record for record in map(json.loads, output_path.read_text().splitlines())}
+    assert records["Ben Cole"]["status"] == "error"
+    assert records["Ben Cole"]["error"] == "provider down"
+    assert records["Ana Ruiz"]["status"] == "ok"
+    assert "ANA RUIZ" in records["Ana Ruiz"]["study_plan"]
+    assert sorted(record["index"] for record in records.values()) == [0, 1, 2]
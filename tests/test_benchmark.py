@@ -0,0 +1,18 @@
+import sys
+
+import main
+
+
+def test_benchmark_row_summarises_latencies():
+    row = main._benchmark_row("parse", [0.001, 0.002, 0.003, 0.004], 0.01, workers=1)
+    assert row["name"] == "parse" and row["workers"] == 1
+    assert row["ops"] == 4
+    assert row["throughput_per_second"] == 400.0
+    assert row["p50_ms"] == 2.5
+    assert row["peak_rss_mb"] > 0
+
+
+def test_benchmark_row_without_resource_module(monkeypatch):
+    # Windows has no resource module
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert main._benchmark_row("parse", [0.001], 0.001)["peak_rss_mb"] is None
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+
+import main
+from conftest import profile
+
+
+def test_exact_cache_hit_and_miss(generator):
+    first = asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    second = asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    assert main.extract_plan_text(second) == main.extract_plan_text(first)
+    assert generator.cache.stats()["misses"] == 1
+    assert generator.cache.stats()["hits"] == 1
+
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile(), temperature=0.2))
+    assert generator.cache.stats()["misses"] == 2
+
+
+def test_cache_key_covers_prompt_model_temperature_and_variant():
+    key = main.PlanCache.make_key("prompt", "gpt-4", 0.7)
+    assert key == main.PlanCache.make_key("prompt", "gpt-4", 0.7)
+    assert key == main.PlanCache.make_key("prompt", "gpt-4", "0.7")
+    assert len({key,
+                main.PlanCache.make_key("prompt!", "gpt-4", 0.7),
+                main.PlanCache.make_key("prompt", "gpt-4o", 0.7),
+                main.PlanCache.make_key("prompt", "gpt-4", 0.2),
+                main.PlanCache.make_key("prompt", "gpt-4", 0.7, variant="sectioned")}) == 5
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = main.PlanCache(tmp_path, max_entries=2)
+    now = time.time()
+    cache.put("a", "plan a")
+    cache.put("b", "plan b")
+    os.utime(tmp_path / "a.json", (now - 20, now - 20))
+    os.utime(tmp_path / "b.json", (now - 10, now - 10))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == "plan a"
+    cache.put("c", "plan c")
+    assert sorted(path.stem for path in tmp_path.glob("*.json")) == ["a", "c"]
+    assert cache.get("b") is None
+
+
+def test_cache_bounds_total_bytes(tmp_path):
+    cache = main.PlanCache(tmp_path, max_bytes=250)
+    for index, key in enumerate("abc"):
+        cache.put(key, "x" * 100)
+        os.utime(tmp_path / f"{key}.json", (time.time() - 30 + index, time.time() - 30 + index))
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.json")) <= 250
+    assert cache.get("c") == "x" * 100
+
+
+def test_cache_expires_old_entries(tmp_path):
+    cache = main.PlanCache(tmp_path, max_age_seconds=60)
+    cache.put("old", "stale plan")
+    cache.put("new", "fresh plan")
+    stale = time.time() - 120
+    os.utime(tmp_path / "old.json", (stale, stale))
+    assert cache.get("old") is None
+    assert not (tmp_path / "old.json").exists()
+    assert cache.get("new") == "fresh plan"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
@@ -0,0 +1,27 @@
+import asyncio
+
+import main
+
+
+def test_clients_are_reused_per_settings():
+    registry = main.LLMClientRegistry()
+    first = registry.get("key", "gpt-4", 0.7, "http://127.0.0.1:9/v1")
+    assert registry.get("key", "gpt-4", 0.7, "http://127.0.0.1:9/v1") is first
+    assert registry.get("other-key", "gpt-4", 0.7, "http://127.0.0.1:9/v1") is not first
+    assert registry.stats()["clients_created"] == 2
+    assert registry.stats()["clients_reused"] == 1
+    registry.close()
+
+
+def test_async_shutdown_closes_the_async_pool():
+    registry = main.LLMClientRegistry()
+    registry.get("key", "gpt-4", 0.7, "http://127.0.0.1:9/v1")
+    http_client, http_async_client = registry._http_client, registry._http_async_client
+    asyncio.run(registry.aclose())
+    assert http_client.is_closed
+    assert http_async_client.is_closed
+    assert registry.stats()["clients"] == 0
+    # The next request starts a fresh session
+    assert registry.get("key", "gpt-4", 0.7, "http://127.0.0.1:9/v1") is not None
+    assert not registry._http_async_client.is_closed
+    registry.close()
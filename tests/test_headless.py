@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from conftest import profile
+
+
+def test_headless_markdown_output_is_plan_text(generator, tmp_path):
+    output_path = tmp_path / "plan.md"
+    generator.run_headless(profile(), api_key="test-key", model="fake", output_path=str(output_path), format_type="md")
+    text = output_path.read_text()
+    assert text.startswith("# PERSONALIZED STUDY PLAN FOR JORDAN LEE")
+    assert '"student_name"' not in text
+
+
+def test_headless_archive_storage_honours_format(generator):
+    generator.plan_storage = "archive"
+    archived = generator.run_headless(profile(), api_key="test-key", model="fake")
+    assert "#" in archived and not list(Path(".").rglob("*.md"))
+    exported = generator.run_headless(profile("Sam Park"), api_key="test-key", model="fake", format_type="md")
+    assert exported.endswith(".md")
+    assert Path(exported).read_text().startswith("# PERSONALIZED STUDY PLAN FOR SAM PARK")
+    assert generator.archive.stats()["plans"] == 2
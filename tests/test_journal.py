@@ -0,0 +1,64 @@
+import json
+
+import main
+from conftest import profile
+
+
+def test_batch_resumes_outstanding_profiles(generator, tmp_path, monkeypatch):
+    profiles = [profile(name) for name in ("Ana Ruiz", "Ben Cole", "Cara Diaz")]
+    input_path = tmp_path / "cohort.jsonl"
+    input_path.write_text("".join(json.dumps(p) + "\n" for p in profiles))
+    journal_path = tmp_path / "cohort.journal"
+    output_path = tmp_path / "plans.jsonl"
+
+    journal = main.JobJournal(journal_path)
+    journal.start(input_path=str(input_path), output_path=str(output_path), profiles=3, model="fake", temperature=0.7)
+    journal.record(0, main.profile_fingerprint(main.load_student_profiles(input_path)[0]), "done", seconds=1.0)
+    journal.record(1, "stale-key", "done", seconds=1.0)
+    journal.close()
+    with open(journal_path, "a") as f:
+        f.write('{"type": "profile", "index": 2, "st')
+
+    generated = []
+    original = generator.agenerate_study_plan
+
+    async def tracking(api_key, model=None, student_profile=None, temperature=0.7, **kwargs):
+        generated.append(student_profile["student_name"])
+        return await original(api_key, model, student_profile, temperature, **kwargs)
+
+    monkeypatch.setattr(generator, "agenerate_study_plan", tracking)
+    generator.run_batch(str(input_path), "test-key", model="fake", journal_path=str(journal_path))
+
+    assert sorted(generated) == ["Ben Cole", "Cara Diaz"]
+    resumed = main.JobJournal(journal_path)
+    keys = [main.profile_fingerprint(p) for p in main.load_student_profiles(input_path)]
+    assert resumed.outstanding(keys) == []
+    assert resumed.counts(keys)["done"] == 3
+
+
+def test_journal_ignores_torn_records_and_tracks_latest_state(tmp_path):
+    journal = main.JobJournal(tmp_path / "run.journal")
+    journal.start(input_path="cohort.jsonl", output_path="plans.jsonl", profiles=2, model="fake", temperature=0.7)
+    journal.record(0, "key-a", "in_flight")
+    journal.record(0, "key-a", "failed", error="timeout")
+    journal.record(1, "key-b", "done", seconds=1.0)
+    journal.close()
+    with open(tmp_path / "run.journal", "a") as f:
+        f.write('{"type": "profile", "index": 0, "key": "key-a", "sta')
+
+    resumed = main.JobJournal(tmp_path / "run.journal")
+    assert resumed.run["output_path"] == "plans.jsonl"
+    assert resumed.counts(["key-a", "key-b"]) == {"pending": 0, "in_flight": 0, "done": 1, "failed": 1}
+    assert resumed.outstanding(["key-a", "key-b"]) == [0]
+    # An edited input profile no longer matches its journaled key
+    assert resumed.outstanding(["key-a", "key-b-edited"]) == [0, 1]
+    resumed.close()
+
+
+def test_default_journal_location_follows_config(generator, tmp_path):
+    assert generator.config["batch_journal_dir"] is None
+    default = generator.batch_journal_path(tmp_path / "cohort.jsonl", "fake")
+    assert default.startswith("study_plans/journals/cohort_")
+    assert generator.batch_journal_path(tmp_path / "cohort.jsonl", "fake", 0.2) != default
+    generator.config["batch_journal_dir"] = str(tmp_path / "journals")
+    assert generator.batch_journal_path(tmp_path / "cohort.jsonl", "fake").startswith(str(tmp_path / "journals"))
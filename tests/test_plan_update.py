@@ -0,0 +1,32 @@
+import asyncio
+
+import main
+from conftest import profile
+
+
+
+def test_plan_update_renames_first_name_mentions(generator):
+    old = profile("Jordan Lee")
+    plan = main.extract_plan_text(asyncio.run(generator.agenerate_study_plan("test-key", "fake", old)))
+    assert "Jordan will" in plan
+    text, stale = asyncio.run(generator.aregenerate_plan_sections("test-key", plan, old, profile("Sam Park"), "fake"))
+    assert stale == []
+    assert "Jordan" not in text and "JORDAN" not in text
+    assert "Sam will" in text and "SAM PARK" in text
+
+
+def test_plan_update_rewrites_only_dependent_sections(generator):
+    old = profile()
+    plan = main.extract_plan_text(asyncio.run(generator.agenerate_study_plan("test-key", "fake", old)))
+    new = {**old, "preferred_resources": "Practice workbooks and flashcards"}
+    assert main.sections_affected_by(main.changed_profile_fields(old, new)) == [
+        "Subject-Specific Action Plans", "Resource Appendix"
+    ]
+    text, stale = asyncio.run(generator.aregenerate_plan_sections("test-key", plan, old, new, "fake"))
+    assert stale == ["Subject-Specific Action Plans", "Resource Appendix"]
+    _, before = main.parse_plan_sections(plan)
+    _, after = main.parse_plan_sections(text)
+    assert [title for title, _, _ in after] == [title for title, _, _ in before]
+    for (title, _, old_body), (_, _, new_body) in zip(before, after):
+        if title not in stale:
+            assert new_body == old_body
@@ -0,0 +1,44 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import main
+
+PLAN = "## 2. Weekly Master Schedule\n\n### Monday\n- 6:00-8:00 PM: Calculus practice\n### Saturday\n- 9:00-10:00 AM: Essay draft"
+
+
+def test_png_fast_path_paints_the_grid(tmp_path):
+    renderer = main.ScheduleRenderer()
+    schedule = main.parse_weekly_schedule(PLAN)
+    frame = renderer.rasterize(schedule)
+    assert frame.shape == renderer.background.shape
+    empty = renderer.rasterize(main.parse_weekly_schedule("No schedule yet."))
+    assert not (frame == empty).all()
+    assert (empty[renderer.top:renderer.bottom, renderer.left:renderer.right] == 255).all()
+    path = renderer.render(schedule, tmp_path / "plan.png")
+    assert path.read_bytes().startswith(b"\x89PNG")
+
+
+def test_svg_is_written_from_the_grid(tmp_path):
+    renderer = main.ScheduleRenderer()
+    path = renderer.render(main.parse_weekly_schedule(PLAN), tmp_path / "plan.svg", title="Jordan & Sam")
+    root = ET.parse(path).getroot()
+    texts = [element.text for element in root.iter("{http://www.w3.org/2000/svg}text")]
+    assert "Jordan & Sam" in texts and "Monday" in texts and "Math" in texts
+    math_color = main.SCHEDULE_COLORS[main.SCHEDULE_SUBJECTS.index("Math")]
+    cells = [rect for rect in root.iter("{http://www.w3.org/2000/svg}rect")
+             if rect.get("fill") == math_color and rect.get("stroke") is None]
+    # 6-8 PM on Monday is one merged two-hour cell
+    assert len(cells) == 1
+    assert cells[0].get("width") == str(2 * 48)
+
+
+def test_npy_round_trips_the_grid(tmp_path):
+    schedule = main.parse_weekly_schedule(PLAN)
+    path = main.ScheduleRenderer().render(schedule, tmp_path / "plan.npy")
+    assert (np.load(path) == schedule.grid).all()
+
+
+def test_render_schedules_names_files_per_plan(tmp_path):
+    paths = main.render_schedules([("ana", PLAN), ("ben", PLAN)], tmp_path / "viz", format_type="svg")
+    assert sorted(map(str, paths)) == [str(tmp_path / "viz" / f"{name}_schedule.svg") for name in ("ana", "ben")]
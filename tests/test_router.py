@@ -0,0 +1,62 @@
+import asyncio
+
+import main
+from conftest import profile
+
+
+def test_router_falls_back_to_next_model():
+    router = main.ModelRouter(min_samples=1)
+    fake = main.make_fake_chat_model(ttft=0.0, tokens_per_second=1e6)
+
+    async def call(model):
+        if model == "broken":
+            raise RuntimeError("provider down")
+        return (await fake.ainvoke("Write a plan for Jordan Lee.\n")).content
+
+    model, text = asyncio.run(router.run(call, ["broken", "gpt-3.5-turbo"]))
+    assert model == "gpt-3.5-turbo"
+    assert "JORDAN LEE" in text
+    assert router.counters["fallbacks"] == 1
+    assert router.error_rate("broken") == 1.0
+
+
+def test_router_hedges_slow_model():
+    router = main.ModelRouter()
+    models = {
+        "slow": main.make_fake_chat_model(ttft=5.0, model_name="slow"),
+        "fast": main.make_fake_chat_model(ttft=0.0, tokens_per_second=1e6, model_name="fast"),
+    }
+
+    async def call(model):
+        return (await models[model].ainvoke("Write a plan for Jordan Lee.\n")).content
+
+    model, _ = asyncio.run(router.run(call, ["slow", "fast"], hedge_after=0.05))
+    assert model == "fast"
+    assert router.counters["hedges"] == 1
+    assert router.counters["hedge_wins"] == 1
+
+
+def test_routed_generation_records_model(generator):
+    generator.router.max_attempts = 2
+    plan = asyncio.run(generator.agenerate_study_plan("test-key", "auto", profile()))
+    assert plan["model"] in generator.router.catalog
+    assert "JORDAN LEE" in main.extract_plan_text(plan)
+
+
+def test_route_respects_context_cost_slo_and_errors():
+    catalog = [
+        {"name": "small", "quality": 2, "context": 8000, "input_cost": 0.5, "output_cost": 1.5, "expected_seconds": 10},
+        {"name": "best", "quality": 5, "context": 128000, "input_cost": 10.0, "output_cost": 30.0, "expected_seconds": 50},
+        {"name": "slow", "quality": 4, "context": 128000, "input_cost": 1.0, "output_cost": 2.0, "expected_seconds": 120},
+    ]
+    router = main.ModelRouter(catalog, latency_slo=60, min_samples=2)
+    # Highest quality within the SLO first, then the rest fastest first
+    assert router.route(1000) == ["best", "small", "slow"]
+    # A long prompt rules out the small context window
+    assert "small" not in router.route(20000)
+    # A cost cap drops the expensive model
+    assert router.route(1000, max_cost=0.05)[0] == "small"
+    # A model failing most recent calls is skipped until it recovers
+    router.record("best", 1.0, False)
+    router.record("best", 1.0, False)
+    assert "best" not in router.route(1000)
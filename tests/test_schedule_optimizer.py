@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+
+import main
+from conftest import profile
+
+TODAY = date(2026, 1, 10)
+
+
+def windows(text):
+    return [(main.DAYS[day], f"{start // 60}:{start % 60:02d}", f"{end // 60}:{end % 60:02d}")
+            for day, start, end, _ in main.parse_time_windows(text)[2]]
+
+
+def test_bare_working_hours_run_from_morning_to_afternoon():
+    assert windows("Work 9-5 Saturdays") == [("Saturday", "9:00", "17:00")]
+    assert windows("Saturdays work 9-5") == [("Saturday", "9:00", "17:00")]
+    assert windows("Lunch 11:30-1:00 PM daily")[0] == ("Monday", "11:30", "13:00")
+
+
+def test_days_listed_after_a_range_apply_to_it():
+    assert windows("Soccer 4-6 PM Tuesdays, piano 5-6 PM on Thursdays") == [
+        ("Tuesday", "16:00", "18:00"), ("Thursday", "17:00", "18:00")
+    ]
+    # A day that opens the next clause does not belong to the range before it
+    assert {day for day, _, _ in windows("Weekdays 6-8 PM. Weekends: 10-12")} == set(main.DAYS)
+    assert windows("Weekdays 6-8 PM. Weekends: 10-12")[-1] == ("Sunday", "10:00", "12:00")
+
+
+def test_abbreviated_days_and_ranges():
+    assert windows("Mon/Wed/Fri 4-6 PM") == [(day, "16:00", "18:00") for day in ("Monday", "Wednesday", "Friday")]
+    assert windows("Tue, Thu 4-7 PM") == [(day, "16:00", "19:00") for day in ("Tuesday", "Thursday")]
+    assert [day for day, _, _ in windows("Monday to Friday 6-9 PM")] == main.DAYS[:5]
+
+
+def test_sat_is_the_exam_not_saturday():
+    assert not main._DAY_MENTION_RE.search("SAT prep")
+    assert [day for day, _, _ in windows("SAT prep 4-5 PM")] == main.DAYS
+    assert [day for day, _, _ in windows("Sat 9-11 AM")] == ["Saturday"]
+
+
+def test_grade_parser_ignores_non_grade_letters():
+    performance = "E-commerce elective (B), A-level Physics (C), Emerging Tech (A-)"
+    assert main.subject_difficulty("E-commerce", performance) == 1.3
+    assert main.subject_difficulty("Physics", performance) == 1.6
+    assert main.subject_difficulty("Emerging Tech", performance) == 1.1
+    assert main.subject_difficulty("Chemistry", "Chemistry (82%)") == 1.3
+    assert main.subject_difficulty("Art", "") == main.GRADE_DIFFICULTY["B"]
+
+
+def test_exam_dates_need_real_month_names():
+    exams = main.parse_upcoming_exams(
+        "Physics midterm Feb. 3rd, essay on the novel, SAT scheduled for March 12th (8 weeks from now)", today=TODAY
+    )
+    assert [(label, weeks) for label, _, weeks in exams] == [
+        ("Physics midterm", 24 / 7), ("essay", None), ("SAT", 8)
+    ]
+    assert exams[2][1] == main.SCHEDULE_SUBJECTS.index("Test Prep")
+
+
+def test_optimizer_keeps_study_inside_free_time():
+    student = profile(
+        available_study_time="Weekdays 4:00-9:00 PM",
+        extracurricular_activities="Soccer practice Tuesdays and Thursdays 4-6 PM"
+    )
+    schedule = main.optimize_weekly_schedule(student, today=TODAY)
+    study = [block for block in schedule.blocks
+             if main.SCHEDULE_SUBJECTS[block[3]] not in ("Break", "Extracurricular")]
+    assert study
+    for day, start, end, _, _ in study:
+        assert day < 5 and start >= 16 * 60 and end <= 21 * 60
+        if main.DAYS[day] in ("Tuesday", "Thursday"):
+            assert start >= 18 * 60
+    # Weaker grades get more time
+    hours = schedule.hours_by_subject()
+    assert hours["Chemistry"] >= hours["English"]
+
+
+def test_formatted_schedule_reads_back():
+    schedule = main.optimize_weekly_schedule(profile(), today=TODAY)
+    markdown = main.format_weekly_schedule(schedule)
+    parsed = main.parse_weekly_schedule(f"## 2. Weekly Master Schedule\n\n{markdown}")
+    assert (parsed.grid == schedule.grid).all()
+
+
+def test_scheduled_templates_keep_the_static_prefix():
+    for name in ("personalized_study_plan_template", "cacheable_study_plan_template", "compact_study_plan_template"):
+        plain = main._PROMPT_TEMPLATES[name][1]
+        scheduled = main._PROMPT_TEMPLATES[f"scheduled_{name}"][1]
+        # The schedule varies per student, so it goes last, after the profile
+        assert scheduled.endswith(main.SCHEDULE_PROMPT_BLOCK)
+        assert scheduled.count("{weekly_schedule}") == 1
+        first_variable = scheduled.index("{")
+        assert scheduled[first_variable:].startswith("{student_name}")
+        assert first_variable >= plain.index("{") // 2
+
+
+def test_generated_plan_contains_the_local_schedule(generator):
+    plan = main.extract_plan_text(asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile())))
+    expected = main.parse_weekly_schedule(f"## 2. Weekly Master Schedule\n\n{generator.local_schedule(profile())}")
+    assert "Weekly study time:" in plan
+    assert (main.parse_weekly_schedule(plan).grid == expected.grid).all()
@@ -0,0 +1,77 @@
+import main
+
+
+def parse(schedule):
+    return main.parse_weekly_schedule(f"## 2. Weekly Master Schedule\n\n{schedule}")
+
+
+def days_of(schedule, subject):
+    return sorted({day for day, _, _, found, _ in schedule.to_rows() if found == subject}, key=main.DAYS.index)
+
+
+def test_per_day_lists_with_times_and_subjects():
+    schedule = parse("### Monday\n- 6:00-6:45 PM: Calculus practice\n- 7:00-8:00 PM: Physics problems\n"
+                     "### Tuesday\n- 4-5: Chemistry lab report")
+    assert schedule.to_rows() == [
+        ("Monday", "18:00", "18:45", "Math", "Calculus practice"),
+        ("Monday", "19:00", "20:00", "Physics", "Physics problems"),
+        ("Tuesday", "16:00", "17:00", "Chemistry", "Chemistry lab report"),
+    ]
+    assert schedule.grid[0, 18] == main.SCHEDULE_SUBJECTS.index("Math")
+
+
+def test_heading_with_several_days_fills_every_day():
+    schedule = parse(
+        "### Tuesday & Thursday\n- 6:00-7:00 PM: Chemistry practice\n"
+        "**Monday, Wednesday, Friday:**\n- 7:00-8:00 PM: Algebra review\n"
+        "**Tuesday/Thursday**\n- 8:00-9:00 PM: English essay\n"
+        "### Mon/Wed\n- 9:00-9:30 PM: History reading"
+    )
+    assert days_of(schedule, "Chemistry") == ["Tuesday", "Thursday"]
+    assert days_of(schedule, "Math") == ["Monday", "Wednesday", "Friday"]
+    assert days_of(schedule, "English") == ["Tuesday", "Thursday"]
+    assert days_of(schedule, "History") == ["Monday", "Wednesday"]
+    assert schedule.hours_by_subject()["Math"] == 3
+
+
+def test_day_ranges_and_weekday_keywords():
+    schedule = parse("### Monday-Friday\n- 5:00-6:00 PM: Spanish vocab\n"
+                     "### Weekends\n- 10:00-11:00 AM: Biology notes\n"
+                     "**Weekdays:** 9:00-9:30 PM review flashcards")
+    assert days_of(schedule, "Languages") == main.DAYS[:5]
+    assert days_of(schedule, "Biology") == ["Saturday", "Sunday"]
+    assert days_of(schedule, "Review") == main.DAYS[:5]
+
+
+def test_sat_prep_is_not_saturday():
+    schedule = parse("### Monday\n- SAT Prep 5-6 PM\n- 6-7 PM: Essay draft")
+    assert {day for day, *_ in schedule.to_rows()} == {"Monday"}
+    assert days_of(schedule, "Test Prep") == ["Monday"]
+
+
+def test_table_with_day_columns_and_free_cells():
+    schedule = parse(
+        "| Time | Monday | Tue/Thu | Weekends |\n"
+        "|------|--------|---------|----------|\n"
+        "| 4-5 PM | Math homework | Free | Biology |\n"
+        "| 5-6 PM | - | Soccer practice | Free |"
+    )
+    assert schedule.to_rows() == [
+        ("Monday", "16:00", "17:00", "Math", "Math homework"),
+        ("Saturday", "16:00", "17:00", "Biology", "Biology"),
+        ("Sunday", "16:00", "17:00", "Biology", "Biology"),
+        ("Tuesday", "17:00", "18:00", "Extracurricular", "Soccer practice"),
+        ("Thursday", "17:00", "18:00", "Extracurricular", "Soccer practice"),
+    ]
+    assert "Other" not in schedule.hours_by_subject()
+
+
+def test_free_is_empty_time():
+    assert main.classify_activity("Free") == 0
+    assert main.classify_activity("**Free**") == 0
+    assert main.classify_activity("Free time with friends") == main.SCHEDULE_SUBJECTS.index("Break")
+    assert parse("### Sunday\n- 2:00-4:00 PM: Free").is_empty()
+
+
+def test_plan_without_schedule_is_empty():
+    assert parse("Study a little every day.").is_empty()
@@ -0,0 +1,46 @@
+import main
+from conftest import profile
+
+
+def archive_with_plans(tmp_path):
+    archive = main.PlanArchive(tmp_path / "plans.db")
+    students = [
+        profile("Ana Ruiz", subjects="AP Chemistry, Calculus", challenges="Lab reports take too long"),
+        profile("Ben Cole", subjects="Spanish, World History", challenges="Memorising vocabulary"),
+        profile("Cara Diaz", subjects="Orchestra, English Literature", challenges="Essay deadlines"),
+    ]
+    for student in students:
+        plan = f"# Plan for {student['student_name']}\nFocus on {student['subjects']}. {student['challenges']}."
+        archive.add(student["student_name"], plan, student_profile=student)
+    return archive
+
+
+def test_keyword_search_ranks_matching_plans(tmp_path):
+    archive = archive_with_plans(tmp_path)
+    index = main.PlanIndex(archive)
+    results = index.search("vocabulary spanish", mode="keyword")
+    assert [record["student_name"] for record in results] == ["Ben Cole"]
+    assert "study_plan" not in results[0]
+    assert index.search("the and of", mode="keyword") == []
+    archive.close()
+
+
+def test_hybrid_search_and_similar_plans(tmp_path):
+    archive = archive_with_plans(tmp_path)
+    index = main.PlanIndex(archive)
+    assert index.search("chemistry lab reports")[0]["student_name"] == "Ana Ruiz"
+    similar = index.similar_plans(profile("Dana Fox", subjects="Spanish, European History",
+                                          challenges="Memorising vocabulary lists"), limit=1)
+    assert [record["student_name"] for record in similar] == ["Ben Cole"]
+    archive.close()
+
+
+def test_index_picks_up_plans_added_later(tmp_path):
+    archive = archive_with_plans(tmp_path)
+    index = main.PlanIndex(archive)
+    assert index.search("robotics", mode="keyword") == []
+    archive.add("Eli Park", "# Plan for Eli\nRobotics club builds.", student_profile=profile("Eli Park", subjects="Robotics"))
+    assert [record["student_name"] for record in index.search("robotics", mode="keyword")] == ["Eli Park"]
+    # A fresh index over the same archive reuses the stored vectors
+    assert main.PlanIndex(archive).search("robotics", mode="vector")[0]["student_name"] == "Eli Park"
+    archive.close()
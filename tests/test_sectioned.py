@@ -0,0 +1,45 @@
+import asyncio
+
+import main
+from conftest import profile
+
+
+def test_sectioned_batch_bounds_total_requests(generator):
+    generator.engine = "sectioned"
+    fake_factory = generator.llm_factory
+    in_flight, peak = [0], [0]
+
+    class CountingModel:
+        def __init__(self, llm):
+            self.llm = llm
+
+        async def ainvoke(self, prompt):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            try:
+                return await self.llm.ainvoke(prompt)
+            finally:
+                in_flight[0] -= 1
+
+    generator.llm_factory = lambda model, temperature: CountingModel(fake_factory(model, temperature))
+    profiles = [profile(name) for name in ("Ana Ruiz", "Ben Cole", "Cara Diaz")]
+    asyncio.run(generator._generate_batch(profiles, "test-key", "fake", 0.7, "plans.jsonl", 2))
+    assert peak[0] == 2
+
+
+def test_sectioned_cache_key_follows_schedule_optimizer(generator):
+    generator.engine = "sectioned"
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    assert generator.cache.stats()["hits"] == 1
+    generator.schedule_optimizer = False
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    assert generator.cache.stats()["misses"] == 2
+
+
+def test_sectioned_plan_has_every_section_in_order(generator):
+    generator.engine = "sectioned"
+    plan = main.extract_plan_text(asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile())))
+    _, sections = main.parse_plan_sections(plan)
+    assert [title for title, _, _ in sections] == main.PLAN_SECTION_TITLES
+    assert "JORDAN LEE" in plan
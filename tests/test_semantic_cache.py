@@ -0,0 +1,49 @@
+import asyncio
+
+import main
+from conftest import profile
+
+
+def test_semantic_cache_reuses_plan_for_renamed_student(generator):
+    generator.semantic_cache_mode = "template"
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile("Jordan Lee")))
+    plan = asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile("Sam Park")))
+    text = main.extract_plan_text(plan)
+    assert "SAM PARK" in text and "Jordan" not in text
+    assert generator.semantic_cache.stats()["template_hits"] == 1
+
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile("Sam Park", grade_level="12th Grade")))
+    assert generator.semantic_cache.stats()["misses"] == 2
+
+
+def test_semantic_cache_compacts_at_twice_the_cap(tmp_path):
+    cache = main.SemanticPlanCache(tmp_path / "semantic.jsonl", max_entries=2)
+    for i in range(3):
+        cache.add(profile(f"Student {i}", goals=f"goal number {i}"), f"plan {i}", "fake", 0.7)
+        cache.match(profile(f"Student {i}", goals=f"goal number {i}"), "fake", 0.7)
+    cache.flush()
+    assert len((tmp_path / "semantic.jsonl").read_text().splitlines()) == 3
+    cache.add(profile("Student 3", goals="goal number 3"), "plan 3", "fake", 0.7)
+    cache.flush()
+    assert len((tmp_path / "semantic.jsonl").read_text().splitlines()) == 2
+    entry, _, _ = cache.match(profile("Student 3", goals="goal number 3"), "fake", 0.7)
+    assert entry["plan"] == "plan 3"
+    assert [entry["plan"] for entry in main.SemanticPlanCache(tmp_path / "semantic.jsonl", max_entries=2).entries] == ["plan 2", "plan 3"]
+
+
+def test_template_mode_edits_when_other_fields_differ(generator):
+    generator.semantic_cache_mode = "template"
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile("Jordan Lee")))
+    changed = profile("Sam Park", challenges="Struggles to start long reading assignments")
+    plan = asyncio.run(generator.agenerate_study_plan("test-key", "fake", changed))
+    stats = generator.semantic_cache.stats()
+    assert stats["template_hits"] == 0
+    assert stats["edit_hits"] == 1
+    assert "SAM PARK" in main.extract_plan_text(plan)
+
+
+def test_exam_dates_and_accommodations_must_match_exactly(generator):
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile("Jordan Lee")))
+    for field, value in (("upcoming_exams", "Algebra final on May 20th"),
+                         ("special_considerations", "Extended time on tests (IEP)")):
+        assert generator.semantic_cache.match(profile("Sam Park", **{field: value}), "fake", 0.7) is None
@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from conftest import profile
+
+
+async def start_stub(stub):
+    server = await asyncio.start_server(stub._handle_connection, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_service_retries_rate_limited_requests(generator):
+    stub = main.StubOpenAIServer(latency=0.0, rate_limit_every=2, retry_after=0)
+    generator.llm_factory = None
+    generator.cache = generator.semantic_cache = None
+    service = main.PlanService(generator, "test-key", workers=1, requests_per_minute=6000, backoff_base=0.01)
+
+    async def run():
+        server, port = await start_stub(stub)
+        generator.config["openrouter_api_base"] = f"http://127.0.0.1:{port}/v1"
+        service.queue = asyncio.Queue(maxsize=10)
+        worker = asyncio.create_task(service._worker())
+        jobs = [service.submit({"profile": profile(name), "model": "gpt-3.5-turbo"}) for name in ("Ana Ruiz", "Ben Cole")]
+        await service.queue.join()
+        worker.cancel()
+        server.close()
+        return jobs
+
+    jobs = asyncio.run(run())
+    assert [job["status"] for job in jobs] == ["done", "done"]
+    assert jobs[1]["attempts"] == 2
+    assert service.counters["rate_limited"] == 1
+    assert service.counters["retries"] == 1
+    assert stub.requests == 3
+    assert "Stub content for executive summary" in service.job_view(jobs[1])["study_plan"]
+
+
+def test_service_rejects_non_object_body(generator):
+    service = main.PlanService(generator, "test-key")
+
+    async def post(body):
+        service.queue = asyncio.Queue(maxsize=10)
+        server = await asyncio.start_server(service._handle_connection, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(f"POST /jobs HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        status = (await reader.readline()).split()[1]
+        writer.close()
+        server.close()
+        return int(status)
+
+    assert asyncio.run(post(b"[1, 2]")) == 400
+    assert service.jobs == {}
+
+
+def test_service_expires_finished_jobs(generator):
+    service = main.PlanService(generator, "test-key", max_jobs=2)
+    service.queue = asyncio.Queue(maxsize=10)
+    old = service.submit(profile("Old Job"))
+    old.update(status="done", finished_at=0.0)
+    running = service.submit(profile("Running Job"))
+    service.submit(profile("New Job"))
+    assert old["id"] not in service.jobs
+    assert running["id"] in service.jobs
+    assert service.counters["expired"] == 1
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, retry_after):
+        super().__init__(f"provider returned {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def test_backoff_releases_the_model_slot(generator):
+    service = main.PlanService(generator, "test-key", workers=2, model_concurrency=1, requests_per_minute=6000)
+    finished = []
+
+    async def generate(job):
+        if job["student_name"] == "Ana Ruiz" and job["attempts"] == 1:
+            raise ProviderError(503, 0.2)
+        finished.append(job["student_name"])
+
+    service._generate = generate
+
+    async def run():
+        service.queue = asyncio.Queue(maxsize=10)
+        workers = [asyncio.create_task(service._worker()) for _ in range(2)]
+        jobs = [service.submit({"profile": profile(name), "model": "gpt-3.5-turbo"}) for name in ("Ana Ruiz", "Ben Cole")]
+        await service.queue.join()
+        for worker in workers:
+            worker.cancel()
+        return jobs
+
+    jobs = asyncio.run(run())
+    assert [job["status"] for job in jobs] == ["done", "done"]
+    # Ben ran while Ana was backing off instead of waiting for her retry
+    assert finished == ["Ben Cole", "Ana Ruiz"]
+    assert service._semaphore("gpt-3.5-turbo")._value == 1
+
+
+def test_service_rejects_models_outside_the_catalog(generator):
+    service = main.PlanService(generator, "test-key")
+    service.queue = asyncio.Queue(maxsize=10)
+    for model in ("not-a-model", "fake"):
+        try:
+            service.submit({"profile": profile(), "model": model})
+        except ValueError as e:
+            assert "unknown model" in str(e)
+        else:
+            raise AssertionError(f"{model} was accepted")
+    assert service.submit({"profile": profile(), "model": "auto"})["model"] == "auto"
+    assert service._semaphores == {} and service._buckets == {}
+
+
+def test_service_ignores_connections_that_send_nothing(generator):
+    service = main.PlanService(generator, "test-key")
+
+    async def connect_and_close():
+        server = await asyncio.start_server(service._handle_connection, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.close()
+        await writer.wait_closed()
+        response = await reader.read()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    assert asyncio.run(connect_and_close()) == b""
+
+
+def test_service_survives_client_reset_while_reporting_errors(generator):
+    service = main.PlanService(generator, "test-key")
+
+    class ResetWriter:
+        closed = False
+
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            raise ConnectionResetError("client went away")
+
+        def close(self):
+            self.closed = True
+
+    async def malformed():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"GARBAGE\r\n\r\n")
+        reader.feed_eof()
+        writer = ResetWriter()
+        await service._handle_connection(reader, writer)
+        return writer
+
+    assert asyncio.run(malformed()).closed
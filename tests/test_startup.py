@@ -0,0 +1,30 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run(code, cwd):
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True).stdout
+
+
+def test_import_does_not_load_heavy_dependencies(tmp_path):
+    loaded = run(
+        f"import sys; sys.path.insert(0, {str(ROOT)!r}); import main; "
+        "print(' '.join(m for m in ('langchain', 'langchain_openai', 'openai', 'numpy', 'matplotlib', 'rich', 'tiktoken', 'httpx') "
+        "if m in sys.modules))",
+        tmp_path
+    )
+    assert loaded.strip() == ""
+
+
+def test_help_runs_without_heavy_dependencies(tmp_path):
+    output = run(
+        f"import sys; sys.path.insert(0, {str(ROOT)!r}); sys.argv = ['main', '--help']; import main\n"
+        "try:\n    main.main()\nexcept SystemExit:\n    pass\n"
+        "print('LOADED', 'langchain' in sys.modules or 'matplotlib' in sys.modules)",
+        tmp_path
+    )
+    assert "--profile-startup" in output
+    assert output.rstrip().endswith("LOADED False")
@@ -0,0 +1,20 @@
+import main
+from conftest import profile
+
+
+def test_streamed_plan_is_written_as_it_arrives(generator, tmp_path):
+    output_path = tmp_path / "plan.md"
+    plan = generator.stream_study_plan("test-key", "fake", profile(), output_path=str(output_path))
+    text = main.extract_plan_text(plan)
+    assert text.startswith("# PERSONALIZED STUDY PLAN FOR JORDAN LEE")
+    assert output_path.read_text() == text
+    assert generator.cache.stats()["misses"] == 1
+
+
+def test_cached_plan_streams_from_cache(generator, tmp_path):
+    first = generator.stream_study_plan("test-key", "fake", profile(), output_path=str(tmp_path / "first.md"))
+    generator.llm_factory = None
+    second = generator.stream_study_plan("test-key", "fake", profile(), output_path=str(tmp_path / "second.md"))
+    assert main.extract_plan_text(second) == main.extract_plan_text(first)
+    assert (tmp_path / "second.md").read_text() == (tmp_path / "first.md").read_text()
+    assert generator.cache.stats()["hits"] == 1
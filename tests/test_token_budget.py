@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+import main
+from conftest import profile
+
+LONG = "This sentence pads the field with detail the model can live without. " * 40
+
+
+def template(name):
+    return main._PROMPT_TEMPLATES[main.STUDY_PLAN_TEMPLATE_VARIANTS[name]][1]
+
+
+def test_budget_shortens_low_priority_fields_first():
+    student = profile(additional_info=LONG, preferred_resources=LONG, subjects="Algebra II, Chemistry, English")
+    _, _, full = main.fit_profile_to_budget(student, template("compact"), model="gpt-4")
+    budget = full["prompt_tokens"] - 200
+    prompt, fitted, stats = main.fit_profile_to_budget(student, template("compact"), budget, model="gpt-4")
+    assert stats["truncated_fields"] == ["additional_info"]
+    assert fitted["additional_info"].endswith("[...]")
+    assert fitted["subjects"] == student["subjects"]
+    assert stats["prompt_tokens"] <= budget and not stats["over_budget"]
+    assert main.count_tokens(prompt, "gpt-4") == stats["prompt_tokens"]
+
+
+def test_budget_too_small_is_reported():
+    student = profile(additional_info=LONG)
+    _, fitted, stats = main.fit_profile_to_budget(student, template("compact"), 50, model="gpt-4")
+    assert stats["over_budget"]
+    assert stats["truncated_fields"][0] == "additional_info"
+    assert fitted["student_name"] == student["student_name"]
+
+
+def test_static_prefix_stops_at_the_first_variable():
+    assert main.static_prefix("Role {{json}} text\n{student_name} and {grade_level}") == "Role {json} text\n"
+    for name in main.STUDY_PLAN_TEMPLATE_VARIANTS:
+        _, _, stats = main.fit_profile_to_budget(profile(), template(name), model="gpt-4")
+        assert 0 < stats["prefix_tokens"] <= stats["static_tokens"]
+    _, _, cacheable = main.fit_profile_to_budget(profile(), template("cacheable"), model="gpt-4")
+    _, _, full = main.fit_profile_to_budget(profile(), template("full"), model="gpt-4")
+    assert cacheable["prefix_tokens"] > full["prefix_tokens"]
+
+
+def test_token_counts_fall_back_when_the_encoder_cannot_load(monkeypatch):
+    release = threading.Event()
+
+    def hanging_load(*args, **kwargs):
+        release.wait(5)
+        raise OSError("no network")
+
+    tiktoken = pytest.importorskip("tiktoken")
+    monkeypatch.setattr(tiktoken, "encoding_for_model", hanging_load)
+    monkeypatch.setattr(main, "TOKEN_ENCODER_LOAD_TIMEOUT", 0.05)
+    monkeypatch.setattr(main, "_TOKEN_ENCODERS", {})
+    try:
+        assert main._token_encoder("gpt-4") is None
+        assert main.count_tokens("x" * 40, "gpt-4") == 10
+    finally:
+        release.set()
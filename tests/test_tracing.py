@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import main
+from conftest import profile
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = main.Tracer()
+    with tracer.span("generate") as span:
+        span.set(model="fake")
+    tracer.count("retries")
+    assert tracer.metrics.render() == "\n"
+
+
+def test_spans_nest_and_export_as_jsonl(tmp_path):
+    tracer = main.Tracer()
+    tracer.enable(str(tmp_path / "trace.jsonl"))
+    with tracer.span("generate", student="Ana"):
+        with tracer.span("llm.generate", model="fake"):
+            tracer.annotate(tokens=12)
+        try:
+            with tracer.span("save"):
+                raise OSError("disk full")
+        except OSError:
+            pass
+    tracer.close()
+    spans = {record["name"]: record for record in map(json.loads, (tmp_path / "trace.jsonl").read_text().splitlines())}
+    assert spans["llm.generate"]["parent_id"] == spans["generate"]["span_id"]
+    assert spans["llm.generate"]["trace_id"] == spans["generate"]["trace_id"]
+    assert spans["llm.generate"]["attrs"] == {"model": "fake", "tokens": 12}
+    assert spans["save"]["status"] == "error" and spans["save"]["error"] == "disk full"
+    assert spans["generate"]["parent_id"] is None
+
+
+def test_metrics_render_in_prometheus_format():
+    tracer = main.Tracer()
+    tracer.enable()
+    tracer.count("retries", 2, "Retried attempts", model='gpt "4"')
+    tracer.observe("ttft_seconds", 0.3, "Time to first token", model="fake")
+    text = tracer.metrics.render({"queue_depth": 3})
+    assert "# HELP study_plan_retries_total Retried attempts" in text
+    assert "# TYPE study_plan_retries_total counter" in text
+    assert 'study_plan_retries_total{model="gpt \\"4\\""} 2' in text
+    assert "# TYPE study_plan_ttft_seconds histogram" in text
+    assert 'study_plan_ttft_seconds_bucket{model="fake",le="+Inf"} 1' in text
+    assert 'study_plan_ttft_seconds_count{model="fake"} 1' in text
+    assert "queue_depth 3" in text
+
+
+def test_traced_pipeline_records_span_durations(generator, monkeypatch):
+    tracer = main.Tracer()
+    tracer.enable()
+    monkeypatch.setattr(main, "tracer", tracer)
+    asyncio.run(generator.agenerate_study_plan("test-key", "fake", profile()))
+    text = tracer.metrics.render()
+    assert 'study_plan_span_duration_seconds_count{span="generate"} 1' in text
+    assert 'study_plan_span_duration_seconds_count{span="llm.generate"} 1' in text